@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from conversores import periodo_chave
+
+#
+# AGREGADOS PARCIAIS COMBINÁVEIS (contagem, soma, M2)
+#
+# Cada (RazaoSocial, UF, Ano, Trimestre) guarda n, soma e M2 (soma dos quadrados
+# dos desvios em torno da média do próprio trimestre). Parciais se combinam sem
+# voltar às linhas originais (Chan et al.):
+#
+#   n = Σ nᵢ    média = Σ somaᵢ / n    M2 = Σ M2ᵢ + Σ nᵢ·(médiaᵢ − média)²
+#
+# e desvio padrão amostral = sqrt(M2 / (n − 1)), igual ao std() do pandas.
+#
+GRUPO = ["RazaoSocial", "UF"]
+PERIODO = ["Ano", "Trimestre"]
+COLUNAS_PARCIAIS = GRUPO + PERIODO + ["Contagem", "Soma", "M2"]
+
+def parciais(df, valor="ValorDespesas"):
+    """Estados parciais por (RazaoSocial, UF, Ano, Trimestre) a partir das linhas enriquecidas."""
+    if df.empty:
+        return pd.DataFrame(columns=COLUNAS_PARCIAIS)
+    chaves = GRUPO + PERIODO
+    g = df.groupby(chaves)[valor]
+    desvio = df[valor] - g.transform("mean")
+    resultado = pd.DataFrame({
+        "Contagem": g.size(),
+        "Soma": g.sum(),
+        "M2": (desvio ** 2).groupby([df[c] for c in chaves]).sum(),
+    }).reset_index()
+    resultado["Ano"] = resultado["Ano"].astype(int)
+    return resultado[COLUNAS_PARCIAIS]
+
+def combinar(df_parciais, por=None):
+    """Junta parciais (de qualquer conjunto de trimestres) em um estado por grupo."""
+    por = por or GRUPO
+    if df_parciais.empty:
+        return pd.DataFrame(columns=por + ["Contagem", "Soma", "M2"])
+    p = df_parciais.astype({"Contagem": "int64", "Soma": "float64", "M2": "float64"})
+    g = p.groupby(por)
+    n = g["Contagem"].transform("sum")
+    media = g["Soma"].transform("sum") / n
+    # Correção de Chan: desvio de cada média parcial em relação à média combinada
+    entre = p["Contagem"] * (p["Soma"] / p["Contagem"] - media) ** 2
+    return pd.DataFrame({
+        "Contagem": g["Contagem"].sum(),
+        "Soma": g["Soma"].sum(),
+        "M2": g["M2"].sum() + entre.groupby([p[c] for c in por]).sum(),
+    }).reset_index()
+
+def finalizar(df_combinados):
+    """Colunas de despesas_agregadas (Total, Média, Desvio padrão amostral), ordenadas pelo total."""
+    n = df_combinados["Contagem"].astype("float64")
+    agregado = df_combinados[GRUPO].copy()
+    agregado["TotalDespesas"] = df_combinados["Soma"].astype("float64")
+    agregado["MediaDespesas"] = agregado["TotalDespesas"] / n
+    # M2 pode sair levemente negativo por arredondamento quando todos os valores são iguais
+    variancia = (df_combinados["M2"].astype("float64") / (n - 1)).where(n > 1).clip(lower=0)
+    agregado["DesvioPadraoDespesas"] = np.sqrt(variancia)
+    return agregado.sort_values(by="TotalDespesas", ascending=False).reset_index(drop=True)
+
+def janela(df_parciais, ultimos=None, de=None, ate=None):
+    """Agregado de um período: os `ultimos` N trimestres ou o intervalo [de, ate] em (Ano, 'NT')."""
+    p = df_parciais
+    if p.empty:
+        return finalizar(combinar(p))
+    chave = periodo_chave(p["Ano"], p["Trimestre"])
+    manter = np.ones(len(p), dtype=bool)
+    if ultimos is not None:
+        manter &= np.isin(chave, np.unique(chave)[-int(ultimos):])
+    if de is not None:
+        manter &= chave >= periodo_chave(*de)
+    if ate is not None:
+        manter &= chave <= periodo_chave(*ate)
+    return finalizar(combinar(p[manter]))
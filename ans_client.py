@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import contextlib
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#
+# CONFIGURAÇÃO (variáveis de ambiente)
+#
+DOWNLOAD_WORKERS = int(os.getenv("ANS_DOWNLOAD_WORKERS", "4"))
+MAX_TENTATIVAS = int(os.getenv("ANS_MAX_TENTATIVAS", "4"))
+BACKOFF_SEGUNDOS = float(os.getenv("ANS_BACKOFF_SEGUNDOS", "1.5"))
+TIMEOUT_SEGUNDOS = float(os.getenv("ANS_TIMEOUT_SEGUNDOS", "60"))
+
+# Cache local em disco (ANS_CACHE_DIR vazio desativa)
+CACHE_DIR = os.getenv("ANS_CACHE_DIR", os.path.join(os.getcwd(), ".cache_ans"))
+CACHE_MAX_BYTES = int(float(os.getenv("ANS_CACHE_MAX_MB", "4096")) * 1024 * 1024)
+OFFLINE = os.getenv("ANS_OFFLINE", "0").lower() in ("1", "true", "sim")
+# Acesso de uma entrada só é regravado no índice se o anterior tiver mais que isso (LRU por hora)
+ACESSO_RESOLUCAO_SEGUNDOS = 3600
+
+_sessao = None
+_lock_sessao = threading.Lock()
+_lock_cache = threading.Lock()
+
+#
+# SESSÃO HTTP COMPARTILHADA (keep-alive)
+#
+def get_session():
+    """Sessão única com pool de conexões dimensionado para os downloads paralelos."""
+    global _sessao
+    with _lock_sessao:
+        if _sessao is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(DOWNLOAD_WORKERS, 4))
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _sessao = s
+    return _sessao
+
+#
+# CACHE ENDEREÇADO POR CONTEÚDO
+#
+# Layout: <CACHE_DIR>/objetos/<sha[:2]>/<sha>  +  <CACHE_DIR>/indice.json
+# O índice mapeia URL -> {sha256, etag, last_modified, tamanho, acesso}.
+# teste1, teste2/cadop e backfill podem rodar ao mesmo tempo: a leitura-
+# modificação-gravação do índice roda sob uma trava de arquivo (flock), além
+# da trava entre threads do mesmo processo.
+#
+def _cache_ativo():
+    return bool(CACHE_DIR)
+
+def _caminho_objeto(sha):
+    return os.path.join(CACHE_DIR, "objetos", sha[:2], sha)
+
+def _caminho_indice():
+    return os.path.join(CACHE_DIR, "indice.json")
+
+@contextlib.contextmanager
+def _trava_cache():
+    with _lock_cache:
+        if fcntl is None:
+            # Sem flock (Windows): só a trava entre threads
+            yield
+            return
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(os.path.join(CACHE_DIR, "indice.lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _ler_indice():
+    try:
+        with open(_caminho_indice(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _gravar_indice(indice):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix="indice_", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(indice, f)
+    os.replace(tmp, _caminho_indice())
+
+def _entrada_cache(url):
+    """Entrada do índice para `url`, desde que o objeto ainda exista em disco."""
+    if not _cache_ativo():
+        return None
+    # O índice é trocado por os.replace: ler sem trava vê a versão anterior ou a nova, inteira
+    entrada = _ler_indice().get(url)
+    if entrada and os.path.exists(_caminho_objeto(entrada["sha256"])):
+        return entrada
+    return None
+
+def _tocar_cache(url, entrada):
+    # Acerto no cache não regrava o índice a cada uso: basta o acesso com resolução de uma hora
+    if time.time() - entrada.get("acesso", 0) < ACESSO_RESOLUCAO_SEGUNDOS:
+        return
+    with _trava_cache():
+        indice = _ler_indice()
+        if url in indice:
+            indice[url]["acesso"] = time.time()
+            _gravar_indice(indice)
+
+def _guardar_no_cache(url, tmp, sha, tamanho, headers):
+    destino = _caminho_objeto(sha)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with _trava_cache():
+        if os.path.exists(destino):
+            os.remove(tmp)
+        else:
+            os.replace(tmp, destino)
+        indice = _ler_indice()
+        indice[url] = {
+            "sha256": sha,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "tamanho": tamanho,
+            "acesso": time.time(),
+        }
+        _despejar(indice, manter=url)
+        _gravar_indice(indice)
+    return destino
+
+def _despejar(indice, manter=None):
+    """Remove as entradas menos acessadas até o cache caber em CACHE_MAX_BYTES."""
+    objetos = {e["sha256"]: e["tamanho"] for e in indice.values()}
+    total = sum(objetos.values())
+
+    for url in sorted(indice, key=lambda u: indice[u]["acesso"]):
+        if total <= CACHE_MAX_BYTES:
+            break
+        if url == manter:
+            continue
+        sha = indice.pop(url)["sha256"]
+        # O objeto só sai do disco quando nenhuma outra URL aponta para ele
+        if not any(e["sha256"] == sha for e in indice.values()):
+            try:
+                os.remove(_caminho_objeto(sha))
+            except FileNotFoundError:
+                pass
+            total -= objetos[sha]
+    _remover_orfaos(indice)
+
+def _remover_orfaos(indice):
+    """Apaga objetos que nenhuma entrada do índice referencia (ex.: índice antigo sem trava entre processos)."""
+    referenciados = {e["sha256"] for e in indice.values()}
+    raiz = os.path.join(CACHE_DIR, "objetos")
+    for pasta in os.listdir(raiz) if os.path.isdir(raiz) else []:
+        for sha in os.listdir(os.path.join(raiz, pasta)):
+            if sha not in referenciados:
+                try:
+                    os.remove(os.path.join(raiz, pasta, sha))
+                except FileNotFoundError:
+                    pass
+
+def limpar_cache():
+    """Apaga todo o conteúdo do cache local."""
+    with _trava_cache():
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+
+#
+# DOWNLOAD EM STREAMING COM RETRY E BACKOFF EXPONENCIAL
+#
+def _baixar_stream(url, headers, tentativas, timeout, bloco):
+    """GET em streaming para arquivo temporário, calculando o SHA-256 no caminho.
+
+    Retorna (status, caminho_tmp, sha256, tamanho, headers). Em 304 não há arquivo.
+    """
+    sessao = get_session()
+    nome = url.rstrip("/").rsplit("/", 1)[-1] or url
+    pasta_tmp = CACHE_DIR if _cache_ativo() else None
+    if pasta_tmp:
+        os.makedirs(pasta_tmp, exist_ok=True)
+
+    for tentativa in range(1, tentativas + 1):
+        inicio = time.perf_counter()
+        fd, caminho = tempfile.mkstemp(prefix="ans_", suffix=".part", dir=pasta_tmp)
+        try:
+            with os.fdopen(fd, "wb") as f, sessao.get(url, headers=headers, timeout=timeout, stream=True) as r:
+                if r.status_code == 304:
+                    print(f"   ♻️ {nome}: não modificado, usando cache ({time.perf_counter() - inicio:.2f}s)")
+                    status, sha, total = 304, None, 0
+                else:
+                    r.raise_for_status()
+                    status = r.status_code
+                    hasher = hashlib.sha256()
+                    total = 0
+                    for parte in r.iter_content(chunk_size=bloco):
+                        f.write(parte)
+                        hasher.update(parte)
+                        total += len(parte)
+                    sha = hasher.hexdigest()
+                    duracao = time.perf_counter() - inicio
+                    print(f"   ⬇️ {nome}: {total / 1024 / 1024:.1f} MB em {duracao:.2f}s (tentativa {tentativa})")
+            if status == 304:
+                os.remove(caminho)
+                caminho = None
+            return status, caminho, sha, total, r.headers
+        except requests.HTTPError as e:
+            os.remove(caminho)
+            status = e.response.status_code if e.response is not None else 0
+            if status < 500 or tentativa == tentativas:
+                raise
+            erro = e
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            os.remove(caminho)
+            if tentativa == tentativas:
+                raise
+            erro = e
+        except BaseException:
+            if os.path.exists(caminho):
+                os.remove(caminho)
+            raise
+        espera = BACKOFF_SEGUNDOS * (2 ** (tentativa - 1))
+        print(f"   🔁 {nome}: falha ({erro}). Nova tentativa em {espera:.1f}s...")
+        time.sleep(espera)
+
+def baixar_para_arquivo(url, tentativas=None, timeout=None, bloco=1024 * 1024):
+    """Obtém `url` como arquivo em disco, sem manter o corpo em memória.
+
+    Com cache ativo, revalida via ETag/Last-Modified e devolve o caminho do objeto
+    no cache; sem cache, devolve um arquivo temporário. Em ambos os casos, chame
+    `liberar_arquivo()` depois de usar.
+    """
+    tentativas = tentativas or MAX_TENTATIVAS
+    timeout = timeout or TIMEOUT_SEGUNDOS
+    entrada = _entrada_cache(url)
+
+    if OFFLINE:
+        if entrada is None:
+            raise FileNotFoundError(f"Modo offline: {url} não está no cache ({CACHE_DIR})")
+        _tocar_cache(url, entrada)
+        return _caminho_objeto(entrada["sha256"])
+
+    headers = {}
+    if entrada:
+        if entrada.get("etag"):
+            headers["If-None-Match"] = entrada["etag"]
+        if entrada.get("last_modified"):
+            headers["If-Modified-Since"] = entrada["last_modified"]
+
+    try:
+        status, tmp, sha, tamanho, resp_headers = _baixar_stream(url, headers, tentativas, timeout, bloco)
+    except requests.RequestException as e:
+        # Falha de rede com cópia local disponível: segue com a versão em cache
+        if entrada is None:
+            raise
+        print(f"   ⚠️ Falha ao revalidar {url} ({e}). Usando cópia em cache.")
+        _tocar_cache(url, entrada)
+        return _caminho_objeto(entrada["sha256"])
+
+    if status == 304:
+        _tocar_cache(url, entrada)
+        return _caminho_objeto(entrada["sha256"])
+    if not _cache_ativo():
+        return tmp
+    return _guardar_no_cache(url, tmp, sha, tamanho, resp_headers)
+
+def liberar_arquivo(caminho):
+    """Remove o arquivo de `baixar_para_arquivo` quando ele não pertence ao cache."""
+    if _cache_ativo() and os.path.abspath(caminho).startswith(os.path.abspath(CACHE_DIR) + os.sep):
+        return
+    try:
+        os.remove(caminho)
+    except FileNotFoundError:
+        pass
+
+def baixar(url, tentativas=None, timeout=None):
+    """Baixa `url` (listagens HTML, CSVs pequenos) e devolve o conteúdo em bytes."""
+    caminho = baixar_para_arquivo(url, tentativas=tentativas, timeout=timeout)
+    try:
+        with open(caminho, "rb") as f:
+            return f.read()
+    finally:
+        liberar_arquivo(caminho)
@@ -1,87 +1,124 @@
-from fastapi import FastAPI, Query
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import HTMLResponse, Response, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import pandas as pd
 import uvicorn
 import os
-import zipfile
-from database import get_engine
+import time
+import asyncio
+import threading
+import hmac
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from sqlalchemy import text
+from database import get_engine, criar_tabelas
+import snapshot
+import consultas_sql
+import consolidado
+import exportacao
+import compartilhado
+from metricas import rss_bytes
+from respostas import resposta_json, escolher_codificacao
+from compacto import compactar, relatorio_memoria
+from indices import construir_indice_cnpj, buscar_cnpj, NAO_ENCONTRADA, CatalogoOperadoras, construir_estatisticas, etag_confere, bytes_indice
 
-app = FastAPI(title="Intuitive Care API")
+# memoria: dados do snapshot em RAM | sql: consultas parametrizadas direto no banco
+API_MODO = os.getenv("API_MODO", "memoria").lower()
+# Estatísticas só mudam com um novo conjunto de dados: o cliente sempre revalida pelo ETag
+CACHE_CONTROL_ESTATISTICAS = os.getenv("API_CACHE_CONTROL_ESTATISTICAS", "public, no-cache")
+# Recarga a quente: token do endpoint administrativo e intervalo do vigia do snapshot (0 = desligado)
+ADMIN_TOKEN = os.getenv("API_ADMIN_TOKEN", "")
+RECARGA_INTERVALO = float(os.getenv("API_RECARGA_INTERVALO", "0"))
+# DataFrames do estado em tipos compactos (compacto.py) depois de montados os índices
+COMPACTAR = os.getenv("API_COMPACTAR", "1").lower() in ("1", "true", "sim")
+# Workers anexam o dataset compactado por memory-map (compartilhado.py); ligado por --workers N
+COMPARTILHADO = os.getenv("API_COMPARTILHADO", "0").lower() in ("1", "true", "sim")
 
-# Habilitar CORS para o frontend Vue.js
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+#
+# ESTADO SERVIDO PELA API
+#
+# Tudo que os endpoints leem (DataFrames, índices, estatísticas) fica num único
+# objeto imutável. A recarga monta um estado novo por inteiro e troca a
+# referência global numa atribuição só; requisições em andamento terminam com
+# o estado que já tinham em mãos.
+#
+@dataclass(frozen=True)
+class EstadoAPI:
+    versao: str
+    df_despesas: pd.DataFrame
+    df_agregado: pd.DataFrame
+    indice_cnpj: dict
+    catalogo: CatalogoOperadoras
+    estatisticas: bytes
+    etag_estatisticas: str
+    # Bytes de cada DataFrame antes da compactação (para o relatório de memória)
+    memoria_original: dict = field(default_factory=dict)
 
-# Carregar dados (prioridade MySQL)
-try:
-    engine = get_engine()
-    print("🔌 Carregando dados do MySQL...")
-    df_despesas = pd.read_sql("SELECT * FROM despesas_consolidadas", engine)
-    df_ops = pd.read_sql("SELECT CNPJ, RegistroANS, Modalidade, UF FROM operadoras_ativas", engine)
-    df_agregado = pd.read_sql("SELECT * FROM despesas_agregadas", engine)
-    
-    # Merge para garantir metadados (RazaoSocial, UF) no df_despesas se estiverem faltando
-    if 'UF' not in df_despesas.columns:
-         df_despesas = pd.merge(df_despesas, df_ops[['CNPJ', 'UF']], on='CNPJ', how='left')
-    # Se agregados estiver vazio no banco, tentar CSV local
-    if df_agregado.empty and os.path.exists('despesas_agregadas.csv'):
-        try:
-            df_agregado = pd.read_csv('despesas_agregadas.csv')
-        except Exception:
-            pass
+def _estado_vazio():
+    vazio = pd.DataFrame()
+    estatisticas, etag = construir_estatisticas(vazio, vazio, "vazio")
+    return EstadoAPI("vazio", vazio, vazio, {}, CatalogoOperadoras(vazio), estatisticas, etag)
 
-except Exception as e:
-    print(f"⚠️ Erro ao conectar MySQL: {e}. Usando arquivos locais...")
+estado = _estado_vazio()
+_lock_recarga = threading.Lock()
+ultima_recarga = {}
+
+def _carregar_legado():
+    """Caminho antigo (sem snapshot): banco, depois CSV/ZIP locais."""
     try:
-        # Tentar ler despesas (CSV ou ZIP)
-        if os.path.exists('consolidado_despesas.csv'):
-             df_despesas = pd.read_csv('consolidado_despesas.csv')
-        elif os.path.exists('consolidado_despesas.zip'):
-             with zipfile.ZipFile('consolidado_despesas.zip') as z:
-                 csv_name = [n for n in z.namelist() if n.endswith('.csv')][0]
-                 df_despesas = pd.read_csv(z.open(csv_name))
-        else:
-             df_despesas = pd.DataFrame()
+        engine = get_engine()
+        print("🔌 Carregando dados do MySQL...")
+        df_despesas = pd.read_sql("SELECT * FROM despesas_consolidadas", engine).drop(columns=['Periodo'], errors='ignore')
+        df_ops = pd.read_sql("SELECT CNPJ, RegistroANS, Modalidade, UF FROM operadoras_ativas", engine)
+        df_agregado = pd.read_sql("SELECT * FROM despesas_agregadas", engine)
 
-        # Tentar ler agregados
-        if os.path.exists('despesas_agregadas.csv'):
-            df_agregado = pd.read_csv('despesas_agregadas.csv')
-        else:
+        # Merge para garantir metadados (RazaoSocial, UF) no df_despesas se estiverem faltando
+        if 'UF' not in df_despesas.columns:
+             df_despesas = pd.merge(df_despesas, df_ops[['CNPJ', 'UF']], on='CNPJ', how='left')
+        # Se agregados estiver vazio no banco, tentar CSV local
+        if df_agregado.empty and os.path.exists('despesas_agregadas.csv'):
+            try:
+                df_agregado = pd.read_csv('despesas_agregadas.csv')
+            except Exception:
+                pass
+
+    except Exception as e:
+        print(f"⚠️ Erro ao conectar MySQL: {e}. Usando arquivos locais...")
+        try:
+            # Tentar ler despesas (Parquet, CSV ou ZIP), só com as colunas servidas
+            df_despesas = consolidado.ler_consolidado(colunas=['CNPJ', 'RazaoSocial', 'Trimestre', 'Ano', 'ValorDespesas', 'UF'])
+            if df_despesas is None:
+                 df_despesas = pd.DataFrame()
+
+            # Tentar ler agregados
+            if os.path.exists('despesas_agregadas.csv'):
+                df_agregado = pd.read_csv('despesas_agregadas.csv')
+            else:
+                df_agregado = pd.DataFrame()
+
+        except Exception as e2:
+            print(f"❌ Erro ao carregar arquivos locais: {e2}")
+            df_despesas = pd.DataFrame()
             df_agregado = pd.DataFrame()
-            
-    except Exception as e2:
-        print(f"❌ Erro ao carregar arquivos locais: {e2}")
-        df_despesas = pd.DataFrame()
-        df_agregado = pd.DataFrame()
+
+    # Aplicar enriquecimento se necessário
+    if 'RazaoSocial' not in df_despesas.columns or df_despesas['RazaoSocial'].isna().any():
+        df_despesas = _preencher_razao_social(df_despesas)
+    return df_despesas, df_agregado
 
 # Enriquecer RazaoSocial via Cadop quando estiver ausente
 def _preencher_razao_social(df):
     try:
-        import requests, io
-        url_ativas = "https://dadosabertos.ans.gov.br/FTP/PDA/operadoras_de_plano_de_saude_ativas/Relatorio_cadop.csv"
-        r = requests.get(url_ativas, timeout=15)
-        r.raise_for_status()
-        cadop = pd.read_csv(io.BytesIO(r.content), sep=';', encoding='latin1', on_bad_lines='skip')
-        cadop.columns = [c.strip() for c in cadop.columns]
-        # Normalizar CNPJ
-        if 'CNPJ' in cadop.columns:
-            cadop['CNPJ'] = cadop['CNPJ'].astype(str).str.replace(r'\D', '', regex=True)
-        # Detectar coluna de razão social
-        col_razao = next((c for c in cadop.columns if 'RAZAO' in c.upper()), None)
-        if not col_razao:
-            col_razao = next((c for c in cadop.columns if 'NOME' in c.upper()), None)
-        if 'CNPJ' in df.columns and col_razao and 'CNPJ' in cadop.columns:
+        import cadop
+        # Só a cópia local: a API não baixa nada durante a inicialização
+        df_cadop = cadop.obter_cadop(offline=True)
+        if 'CNPJ' in df.columns and df_cadop is not None:
             df['CNPJ'] = df['CNPJ'].astype(str).str.replace(r'\D', '', regex=True)
-            df = pd.merge(df, cadop[['CNPJ', col_razao]], on='CNPJ', how='left')
+            # Lookup por hash (CNPJ -> RazaoSocial) em vez de merge
+            razao = df_cadop.set_index('CNPJ')['RazaoSocial']
             if 'RazaoSocial' not in df.columns:
                 df['RazaoSocial'] = None
-            df['RazaoSocial'] = df['RazaoSocial'].fillna(df[col_razao])
-            df = df.drop(columns=[col_razao], errors='ignore')
+            df['RazaoSocial'] = df['RazaoSocial'].fillna(df['CNPJ'].str.zfill(14).map(razao))
     except Exception:
         pass
     # Garantir pelo menos string não nula
@@ -91,53 +128,233 @@ def _preencher_razao_social(df):
         df['RazaoSocial'] = 'DESCONHECIDO'
     return df
 
-# Aplicar enriquecimento se necessário
-if 'RazaoSocial' not in df_despesas.columns or df_despesas['RazaoSocial'].isna().any():
-    df_despesas = _preencher_razao_social(df_despesas)
+def montar_estado():
+    """Snapshot publicado pelo ETL (memory-map) ou, na falta dele, o caminho legado."""
+    inicio = time.perf_counter()
+    if COMPARTILHADO:
+        try:
+            dados = compartilhado.obter()
+        except Exception as e:
+            print(f"⚠️ Dataset compartilhado indisponível ({e}); carregando cópia própria.")
+            dados = None
+        if dados is not None:
+            # DataFrames, índice por CNPJ e estatísticas vêm prontos (memory-map); só o catálogo é local
+            catalogo = CatalogoOperadoras(dados.operadoras)
+            print(f"🔗 Dataset compartilhado {dados.versao} anexado em {time.perf_counter() - inicio:.2f}s "
+                  f"(pid {os.getpid()}, {len(catalogo)} operadoras)")
+            return EstadoAPI(dados.versao, dados.df_despesas, dados.df_agregado, dados.indice_cnpj, catalogo,
+                             dados.estatisticas, dados.etag_estatisticas, dados.memoria_original)
+
+    try:
+        resultado = snapshot.carregar_snapshot()
+    except Exception as e:
+        print(f"⚠️ Snapshot ilegível ({e}).")
+        resultado = None
+
+    if resultado is not None:
+        manifesto, df_despesas, df_agregado = resultado
+        versao = manifesto['versao']
+        print(f"⚡ Snapshot {versao} carregado em {time.perf_counter() - inicio:.2f}s")
+    else:
+        print("⚠️ Snapshot não encontrado (rode o teste2.py ou python snapshot.py). Usando banco/arquivos...")
+        df_despesas, df_agregado = _carregar_legado()
+        versao = f"legado-{int(time.time())}"
+        print(f"Dados carregados em {time.perf_counter() - inicio:.2f}s")
+
+    inicio = time.perf_counter()
+    indice_cnpj = construir_indice_cnpj(df_despesas)
+    catalogo = CatalogoOperadoras(df_despesas)
+    estatisticas, etag = construir_estatisticas(df_despesas, df_agregado, versao)
+    print(f"🗂️ Índices (CNPJ + busca + estatísticas): {len(catalogo)} operadoras em {time.perf_counter() - inicio:.2f}s")
+
+    memoria_original = {}
+    if COMPACTAR:
+        # Os índices já guardam as respostas prontas: os DataFrames ficam só em tipos compactos
+        memoria_original = {
+            "despesas": int(df_despesas.memory_usage(deep=True).sum()),
+            "agregado": int(df_agregado.memory_usage(deep=True).sum()),
+        }
+        df_despesas, df_agregado = compactar(df_despesas), compactar(df_agregado)
+        compactado = int(df_despesas.memory_usage(deep=True).sum() + df_agregado.memory_usage(deep=True).sum())
+        print(f"🗜️ DataFrames compactados: {sum(memoria_original.values()) / 1024 / 1024:.1f} MB -> "
+              f"{compactado / 1024 / 1024:.1f} MB")
+    return EstadoAPI(versao, df_despesas, df_agregado, indice_cnpj, catalogo, estatisticas, etag, memoria_original)
+
+def _memoria_estado(e):
+    frames = int(e.df_despesas.memory_usage(deep=True).sum() + e.df_agregado.memory_usage(deep=True).sum())
+    return frames + bytes_indice(e.indice_cnpj)
+
+def recarregar():
+    """Monta um estado novo em segundo plano e o publica com troca atômica da referência.
+
+    Retorna o relatório da recarga (duração, memória) ou None se já houver uma em andamento.
+    """
+    global estado, ultima_recarga
+    if not _lock_recarga.acquire(blocking=False):
+        return None
+    try:
+        anterior = estado
+        rss_antes = rss_bytes()
+        inicio = time.perf_counter()
+        try:
+            novo = montar_estado()
+        except Exception as e:
+            # Falha na montagem: o estado anterior continua servindo
+            print(f"❌ Recarga falhou ({e}); mantendo a versão {anterior.versao}.")
+            ultima_recarga = {"versao": anterior.versao, "erro": str(e), "concluida_em": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            return ultima_recarga
+        duracao = time.perf_counter() - inicio
+        rss_pico = rss_bytes()
+        estado = novo
+        ultima_recarga = {
+            "versao_anterior": anterior.versao,
+            "versao": novo.versao,
+            "duracao_s": round(duracao, 3),
+            "memoria_estado_mb": round(_memoria_estado(novo) / 1024 / 1024, 2),
+            # Durante a montagem os dois estados convivem: este é o custo extra da recarga
+            "rss_extra_durante_recarga_mb": round((rss_pico - rss_antes) / 1024 / 1024, 2),
+            "concluida_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        print(f"🔄 Recarga {anterior.versao} -> {novo.versao} em {duracao:.2f}s "
+              f"(+{ultima_recarga['rss_extra_durante_recarga_mb']} MB durante a montagem)")
+        return ultima_recarga
+    finally:
+        _lock_recarga.release()
+
+async def _vigiar_snapshot():
+    """Recarrega quando o manifesto do snapshot passa a apontar para outra versão."""
+    while True:
+        await asyncio.sleep(RECARGA_INTERVALO)
+        try:
+            manifesto = await asyncio.to_thread(snapshot.ler_manifesto)
+            if manifesto and manifesto["versao"] != estado.versao:
+                await asyncio.to_thread(recarregar)
+        except Exception as e:
+            print(f"⚠️ Falha ao verificar/recarregar o snapshot: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    if API_MODO == "sql":
+        print("🛢️ API_MODO=sql: endpoints consultam o banco diretamente (sem carga em memória).")
+        try:
+            # Bancos de antes do marcador de versão (etl_versao) ganham a tabela vazia
+            await asyncio.to_thread(criar_tabelas, get_engine())
+        except Exception as e:
+            print(f"⚠️ Não foi possível conferir as tabelas do banco: {e}")
+        yield
+        return
+    recarregar()
+    vigia = asyncio.create_task(_vigiar_snapshot()) if RECARGA_INTERVALO > 0 else None
+    yield
+    if vigia:
+        vigia.cancel()
+
+app = FastAPI(title="Intuitive Care API", lifespan=lifespan)
+
+# Habilitar CORS para o frontend Vue.js
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
 
 @app.get("/api/operadoras")
-def get_operadoras(page: int = 1, limit: int = 10, search: str = None):
-    df = df_despesas[['CNPJ', 'RazaoSocial']].drop_duplicates()
-    
-    if search:
-        df = df[df['RazaoSocial'].str.contains(search, case=False) | df['CNPJ'].str.contains(search)]
-    
-    total = len(df)
-    start = (page - 1) * limit
-    end = start + limit
-    
-    data = df.iloc[start:end].to_dict(orient='records')
-    
-    return {
-        "data": data,
-        "total": total,
-        "page": page,
-        "limit": limit
-    }
+def get_operadoras(request: Request, page: int = 1, limit: int = 10, search: str = None, apos: str = None):
+    if API_MODO == "sql":
+        return resposta_json(consultas_sql.listar_operadoras(get_engine(), page, limit, search, apos), request)
+    # Catálogo pré-montado: busca literal, sem acento/caixa, ranqueada; páginas em bytes com cache
+    return resposta_json(estado.catalogo.pagina_json(search, page, limit), request)
 
 @app.get("/api/operadoras/{cnpj}")
-def get_operadora_detail(cnpj: str):
-    operadora = df_despesas[df_despesas['CNPJ'].astype(str) == cnpj].iloc[0:1]
-    if operadora.empty:
-        return {"error": "Operadora não encontrada"}
-    return operadora.to_dict(orient='records')[0]
+def get_operadora_detail(cnpj: str, request: Request):
+    if API_MODO == "sql":
+        return resposta_json(consultas_sql.detalhe_operadora(get_engine(), cnpj) or NAO_ENCONTRADA, request)
+    entrada = buscar_cnpj(estado.indice_cnpj, cnpj)
+    return resposta_json(NAO_ENCONTRADA if entrada is None else entrada[0], request)
 
 @app.get("/api/operadoras/{cnpj}/despesas")
-def get_operadora_despesas(cnpj: str):
-    despesas = df_despesas[df_despesas['CNPJ'].astype(str) == cnpj]
-    return despesas.to_dict(orient='records')
+def get_operadora_despesas(cnpj: str, request: Request):
+    if API_MODO == "sql":
+        return resposta_json(consultas_sql.despesas_operadora(get_engine(), cnpj), request)
+    entrada = buscar_cnpj(estado.indice_cnpj, cnpj)
+    return resposta_json(entrada[1] if entrada else b"[]", request)
 
 @app.get("/api/estatisticas")
-def get_estatisticas():
-    if df_despesas.empty:
-        return {}
-    
-    return {
-        "total_despesas": float(df_despesas['ValorDespesas'].sum()),
-        "media_despesas": float(df_despesas['ValorDespesas'].mean()),
-        "top_5_operadoras": df_agregado.head(5).to_dict(orient='records'),
-        "distribuicao_uf": df_agregado.groupby('UF')['TotalDespesas'].sum().to_dict()
+def get_estatisticas(request: Request):
+    if API_MODO == "sql":
+        payload, etag = consultas_sql.estatisticas(get_engine())
+    else:
+        e = estado
+        payload, etag = e.estatisticas, e.etag_estatisticas
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL_ESTATISTICAS}
+    if etag_confere(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return resposta_json(payload, request, headers=headers)
+
+#
+# EXPORTAÇÃO EM STREAMING
+#
+@app.get("/api/export")
+def exportar(request: Request, formato: str = "csv", tabela: str = "despesas", uf: str = None,
+             de: str = None, ate: str = None, cnpj: str = None):
+    """Resultado filtrado (UF, período de/ate, lista de CNPJs) em CSV, NDJSON ou Arrow IPC, bloco a bloco."""
+    if formato not in exportacao.FORMATOS:
+        return JSONResponse({"error": f"Formato inválido: {formato!r} (use {', '.join(exportacao.FORMATOS)})"},
+                            status_code=400)
+    codificacao = escolher_codificacao(request.headers.get("accept-encoding"))
+    try:
+        filtros = exportacao.Filtros(tabela, uf, de, ate, cnpj)
+        if API_MODO == "sql":
+            engine = get_engine()
+            versao = consultas_sql.versao_dados(engine)
+
+            def blocos():
+                return exportacao.blocos_sql(engine, filtros)
+        else:
+            # O gerador segura o estado atual: uma recarga no meio não muda a exportação
+            e = estado
+            versao = e.versao
+            df = e.df_despesas if tabela == "despesas" else e.df_agregado
+
+            def blocos():
+                return exportacao.blocos_memoria(df, filtros)
+
+        def gerar():
+            return exportacao.comprimir_fluxo(exportacao.serializar(blocos(), formato), codificacao)
+
+        partes = gerar()
+    except exportacao.FiltroInvalido as ex:
+        return JSONResponse({"error": str(ex)}, status_code=400)
+
+    etag = exportacao.etag(versao, filtros, formato, codificacao)
+    media_type, extensao = exportacao.FORMATOS[formato]
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept-Encoding",
+        "Content-Disposition": f'attachment; filename="{tabela}.{extensao}"',
     }
+    if codificacao:
+        headers["Content-Encoding"] = codificacao
+
+    # Retomada: total registrado por qualquer worker ou, na falta dele, medido agora
+    pedido = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if pedido and (not if_range or if_range.strip() == etag):
+        total = exportacao.tamanho_conhecido(etag)
+        if total is None:
+            total = exportacao.medir(partes, etag)
+            partes = gerar()
+        trecho = exportacao.intervalo(pedido, total)
+        if trecho == "fora":
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{total}", **headers})
+        if trecho:
+            inicio, fim = trecho
+            headers.update({"Content-Range": f"bytes {inicio}-{fim}/{total}", "Content-Length": str(fim - inicio + 1)})
+            return StreamingResponse(exportacao.fluxo(partes, etag, inicio, fim), status_code=206,
+                                     media_type=media_type, headers=headers)
+    return StreamingResponse(exportacao.fluxo(partes, etag), media_type=media_type, headers=headers)
 
 @app.get("/", response_class=HTMLResponse)
 def serve_index():
@@ -150,9 +367,99 @@ def serve_index():
 @app.get("/api/debug/agregado_count")
 def agregado_count():
     try:
-        return {"count": int(len(df_agregado))}
+        if API_MODO == "sql":
+            with get_engine().connect() as conn:
+                return {"count": int(conn.execute(text("SELECT COUNT(*) FROM despesas_agregadas")).scalar())}
+        return {"count": int(len(estado.df_agregado))}
     except Exception:
         return {"count": 0}
 
+@app.get("/api/debug/memoria")
+def memoria():
+    """Bytes por coluna dos DataFrames servidos, tamanho dos índices e RSS do worker."""
+    if API_MODO == "sql":
+        return {"modo": "sql", "rss_bytes": rss_bytes()}
+    e = estado
+    dataframes = {}
+    for nome, df in (("despesas", e.df_despesas), ("agregado", e.df_agregado)):
+        dataframes[nome] = relatorio_memoria(df)
+        dataframes[nome]["bytes_sem_compactacao"] = e.memoria_original.get(nome)
+    return {
+        "modo": "memoria",
+        "versao": e.versao,
+        "pid": os.getpid(),
+        "compartilhado": COMPARTILHADO,
+        "rss_bytes": rss_bytes(),
+        "dataframes": dataframes,
+        "indice_cnpj_bytes": bytes_indice(e.indice_cnpj),
+    }
+
+#
+# ADMINISTRAÇÃO: RECARGA A QUENTE
+#
+def _negado(request):
+    """Resposta de erro se a chamada administrativa não é permitida, senão None.
+
+    Sem API_ADMIN_TOKEN os endpoints ficam desligados (404): com CORS "*",
+    qualquer página poderia disparar recargas.
+    """
+    if not ADMIN_TOKEN:
+        return JSONResponse({"detail": "Not Found"}, status_code=404)
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        return JSONResponse({"error": "Não autorizado"}, status_code=403)
+    return None
+
+@app.post("/api/admin/recarregar")
+def post_recarregar(request: Request, aguardar: bool = False):
+    negado = _negado(request)
+    if negado is not None:
+        return negado
+    if _lock_recarga.locked():
+        return JSONResponse({"status": "em_andamento", "versao": estado.versao}, status_code=409)
+    if aguardar:
+        relatorio = recarregar()
+        if relatorio is None:
+            return JSONResponse({"status": "em_andamento", "versao": estado.versao}, status_code=409)
+        return {"status": "concluida", **relatorio}
+    threading.Thread(target=recarregar, name="recarga-api", daemon=True).start()
+    return JSONResponse({"status": "iniciada", "versao": estado.versao}, status_code=202)
+
+@app.get("/api/admin/recarga")
+def get_recarga(request: Request):
+    negado = _negado(request)
+    if negado is not None:
+        return negado
+    return {"versao": estado.versao, "em_andamento": _lock_recarga.locked(), "ultima": ultima_recarga}
+
+#
+# VÁRIOS WORKERS (python app.py --workers N)
+#
+def preparar_workers():
+    """Carregador único: garante snapshot e dataset compartilhado antes de subir os workers."""
+    if snapshot.ler_manifesto() is None:
+        # Sem snapshot, cada worker iria ao banco/Cadop: o caminho legado roda uma vez só aqui
+        df_despesas, df_agregado = _carregar_legado()
+        snapshot.publicar_snapshot(df_despesas, df_agregado)
+        del df_despesas, df_agregado
+    if not compartilhado.disponivel():
+        print("⚠️ pyarrow não instalado: cada worker carrega sua própria cópia do snapshot.")
+        return False
+    compartilhado.obter()
+    return True
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    import argparse
+    parser = argparse.ArgumentParser(description="API de operadoras de planos de saúde")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", "1")),
+                        help="processos servindo a API (com mais de um, o dataset é compartilhado por memory-map)")
+    args = parser.parse_args()
+    if args.workers > 1:
+        if API_MODO != "sql" and preparar_workers():
+            # Lido pelos workers no import do app
+            os.environ["API_COMPARTILHADO"] = "1"
+        print(f"🚀 Subindo {args.workers} workers em {args.host}:{args.port}")
+        uvicorn.run("app:app", host=args.host, port=args.port, workers=args.workers)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,214 @@
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from sqlalchemy import text
+import metricas
+import consolidado
+from teste1 import (
+    PARSE_WORKERS, descobrir_trimestres, baixar_medido, checksum_arquivo, processar_zip,
+    obter_cadop, corrigir_identificadores, preparar_para_banco, preencher_razao_social,
+)
+from database import get_engine, criar_tabelas, carregar_em_massa, excluir_por_chaves, ler_estado_carga, registrar_carga
+from ans_client import liberar_arquivo
+
+#
+# BACKFILL DO HISTÓRICO COMPLETO (python backfill.py)
+#
+# Percorre todos os trimestres publicados pela ANS, do mais antigo para o mais
+# novo, um de cada vez: download -> parse/normalização -> CNPJ via Cadop ->
+# despesas_consolidadas e partição Ano/Trimestre do Parquet. Só um trimestre
+# fica em memória; o download do próximo corre em paralelo ao processamento.
+#
+# Checkpoint: cada trimestre é gravado de forma idempotente (DELETE do trimestre
+# + INSERT) e só então registrado em etl_carga_trimestres. Se a execução cair,
+# a próxima pula os trimestres já registrados com o mesmo arquivo (sem baixar)
+# e refaz o que estava pela metade. Um trimestre que falha (rede, arquivo
+# inválido, erro de leitura em algum membro, nenhuma linha de despesa) não
+# interrompe o backfill: fica sem registro e entra na próxima.
+#
+# Ao final, CSV/ZIP do consolidado são regravados a partir da tabela, em blocos.
+# As agregações ficam para o teste2 (ETL_INCREMENTAL=1 processa só os
+# trimestres ainda não agregados).
+#
+# Uso: python backfill.py [--desde 2014] [--ate 2024] [--verificar] [--sem-arquivos]
+#
+
+def _duracao(segundos):
+    segundos = int(segundos)
+    horas, resto = divmod(segundos, 3600)
+    return f"{horas}h{resto // 60:02d}m" if horas else f"{resto // 60}m{resto % 60:02d}s"
+
+class Progresso:
+    """Contagem de trimestres com tempo decorrido e ETA pela média dos já processados."""
+
+    def __init__(self, total):
+        self.total = total
+        self.feitos = 0
+        self.inicio = time.perf_counter()
+        self._duracoes = []
+
+    def concluir(self, rotulo, duracao, detalhe=""):
+        self.feitos += 1
+        self._duracoes.append(duracao)
+        decorrido = time.perf_counter() - self.inicio
+        restantes = self.total - self.feitos
+        eta = sum(self._duracoes) / len(self._duracoes) * restantes
+        print(f"📈 [{self.feitos}/{self.total}] {rotulo} em {duracao:.1f}s {detalhe}| "
+              f"decorrido {_duracao(decorrido)} | ETA {_duracao(eta) if restantes else '-'}")
+
+def _pendentes(trimestres, estado, verificar):
+    """Trimestres ainda não registrados com o mesmo arquivo (com --verificar, todos: decide o checksum)."""
+    pendentes = []
+    for ano, tri, url in trimestres:
+        registro = estado.get((int(ano), tri))
+        if not verificar and registro and registro.get("Arquivo") == url.rsplit("/", 1)[-1]:
+            continue
+        pendentes.append((ano, tri, url))
+    return pendentes
+
+def gravar_trimestre(df_db, engine):
+    """Substitui o trimestre em despesas_consolidadas (DELETE + INSERT: refazer não duplica)."""
+    chaves = df_db[["Ano", "Trimestre"]].drop_duplicates()
+    excluir_por_chaves(chaves, "despesas_consolidadas", engine)
+    return carregar_em_massa(df_db, "despesas_consolidadas", engine, relatorio=False)
+
+def processar_trimestre(caminho_zip, ano, tri, df_cadop, engine, pool_parse, gravar_parquet=True):
+    """Um trimestre do ZIP ao banco; retorna o número de linhas gravadas.
+
+    Arquivo com erro de leitura ou trimestre sem nenhuma linha de despesa levanta
+    RuntimeError antes de gravar: o trimestre fica sem checkpoint e entra na próxima execução.
+    """
+    falhas = []
+    dados = processar_zip(caminho_zip, ano, tri, pool_parse, PARSE_WORKERS, falhas)
+    if falhas:
+        raise RuntimeError(f"erro de leitura em {', '.join(falhas)}")
+    if not dados:
+        raise RuntimeError("nenhuma linha de despesas no arquivo")
+    df = pd.concat(dados, ignore_index=True)
+    del dados
+    df = corrigir_identificadores(df, df_cadop)
+    if "Valor" in df.columns:
+        df = df.rename(columns={"Valor": "ValorDespesas"})
+    df_db = preparar_para_banco(df)
+    del df
+    if df_db.empty:
+        raise RuntimeError("nenhuma linha válida após a normalização")
+    linhas = gravar_trimestre(df_db, engine)
+    if gravar_parquet:
+        consolidado.gravar_particao_parquet(df_db.drop(columns=["Periodo"]))
+    return linhas
+
+def regravar_arquivos(engine, df_cadop=None):
+    """CSV/ZIP do consolidado a partir da tabela, lida em blocos (memória de um bloco)."""
+    # Linhas de cargas anteriores podem estar sem nome: completa pelo Cadop antes de ler
+    if df_cadop is not None:
+        preenchidas = preencher_razao_social(df_cadop, engine)
+        if preenchidas:
+            print(f"🏷️ RazaoSocial preenchida pelo Cadop em {preenchidas} linhas")
+    sql = text(f"SELECT {', '.join(consolidado.COLUNAS)} FROM despesas_consolidadas ORDER BY Periodo, CNPJ")
+    with engine.connect().execution_options(stream_results=True) as conn:
+        blocos = pd.read_sql(sql, conn, chunksize=consolidado.LINHAS_POR_BLOCO)
+        consolidado.gravar_csv_zip_blocos(consolidado.do_banco(bloco) for bloco in blocos)
+    print(f"✅ {consolidado.ZIP_PATH} regravado a partir de despesas_consolidadas")
+
+def backfill(desde=None, ate=None, verificar=False, arquivos=True):
+    with metricas.execucao("backfill"):
+        return _backfill(desde, ate, verificar, arquivos)
+
+def _backfill(desde, ate, verificar, arquivos):
+    engine = get_engine()
+    criar_tabelas(engine)
+
+    with metricas.etapa("descoberta") as m:
+        trimestres = descobrir_trimestres(limite=None, desde=desde, ate=ate)
+        m.linhas_saida = len(trimestres)
+    # Do mais antigo para o mais novo: uma interrupção deixa um prefixo contínuo do histórico
+    trimestres.sort(key=lambda t: (int(t[0]), t[1]))
+    estado = ler_estado_carga(engine)
+    pendentes = _pendentes(trimestres, estado, verificar)
+    carregados = sum((int(ano), tri) in estado for ano, tri, _ in trimestres)
+    print(f"🗓️ {len(trimestres)} trimestres publicados "
+          f"({trimestres[0][0]}-{trimestres[0][1]} a {trimestres[-1][0]}-{trimestres[-1][1]}); "
+          f"{carregados} já carregados, {len(pendentes)} a baixar."
+          if trimestres else "🗓️ Nenhum trimestre encontrado.")
+    if not pendentes:
+        return {"processados": [], "pulados": [], "falhas": []}
+
+    with metricas.etapa("cadop") as m:
+        df_cadop = m.saida(obter_cadop())
+
+    pool_parse = None
+    if PARSE_WORKERS > 1:
+        pool_parse = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+    progresso = Progresso(len(pendentes))
+    resultado = {"processados": [], "pulados": [], "falhas": []}
+    try:
+        # Um download à frente: o ZIP seguinte chega enquanto o atual é processado
+        with ThreadPoolExecutor(max_workers=1) as downloads:
+            proximo = downloads.submit(baixar_medido, pendentes[0][2])
+            for i, (ano, tri, url) in enumerate(pendentes):
+                rotulo, arquivo = f"{ano}-{tri}", url.rsplit("/", 1)[-1]
+                futuro = proximo
+                if i + 1 < len(pendentes):
+                    proximo = downloads.submit(baixar_medido, pendentes[i + 1][2])
+                inicio = time.perf_counter()
+                print(f"\n📦 {rotulo} ({arquivo})")
+                try:
+                    caminho_zip = futuro.result()
+                except Exception as e:
+                    print(f"   ❌ Falha ao baixar {arquivo}: {e}")
+                    resultado["falhas"].append((rotulo, str(e)))
+                    progresso.concluir(rotulo, time.perf_counter() - inicio, "(falha) ")
+                    continue
+                try:
+                    checksum = checksum_arquivo(caminho_zip)
+                    if verificar and estado.get((int(ano), tri), {}).get("Checksum") == checksum:
+                        print("   ⏭️ Trimestre já carregado (checksum igual). Pulando.")
+                        resultado["pulados"].append(rotulo)
+                        progresso.concluir(rotulo, time.perf_counter() - inicio, "(igual) ")
+                        continue
+                    with metricas.etapa("trimestre", detalhe=rotulo) as m:
+                        m.bytes = os.path.getsize(caminho_zip)
+                        linhas = processar_trimestre(caminho_zip, ano, tri, df_cadop, engine, pool_parse, arquivos)
+                        m.linhas_saida = linhas
+                    # Checkpoint só depois do trimestre gravado
+                    registrar_carga(ano, tri, arquivo, checksum, linhas, engine)
+                    resultado["processados"].append(rotulo)
+                    progresso.concluir(rotulo, time.perf_counter() - inicio, f"({linhas} linhas) ")
+                except Exception as e:
+                    print(f"   ❌ Falha ao processar {rotulo}: {e}")
+                    resultado["falhas"].append((rotulo, str(e)))
+                    progresso.concluir(rotulo, time.perf_counter() - inicio, "(falha) ")
+                finally:
+                    liberar_arquivo(caminho_zip)
+    finally:
+        if pool_parse is not None:
+            pool_parse.shutdown()
+
+    if arquivos and resultado["processados"]:
+        with metricas.etapa("arquivos"):
+            regravar_arquivos(engine, df_cadop)
+
+    print(f"\n🏁 Backfill: {len(resultado['processados'])} processados, {len(resultado['pulados'])} iguais, "
+          f"{len(resultado['falhas'])} falhas.")
+    for rotulo, erro in resultado["falhas"]:
+        print(f"   ❌ {rotulo}: {erro}")
+    if resultado["falhas"]:
+        print("   Rode o backfill de novo para tentar os trimestres que falharam.")
+    return resultado
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carrega o histórico completo da ANS, trimestre a trimestre, com retomada.")
+    parser.add_argument("--desde", type=int, help="primeiro ano (padrão: o mais antigo publicado)")
+    parser.add_argument("--ate", type=int, help="último ano (padrão: o mais recente)")
+    parser.add_argument("--verificar", action="store_true",
+                        help="baixa também os trimestres já carregados e reprocessa os que mudaram (checksum)")
+    parser.add_argument("--sem-arquivos", action="store_true", help="não grava Parquet nem CSV/ZIP, só o banco")
+    args = parser.parse_args()
+    resultado = backfill(args.desde, args.ate, args.verificar, not args.sem_arquivos)
+    sys.exit(1 if resultado["falhas"] else 0)
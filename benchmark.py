@@ -0,0 +1,231 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import contextlib
+from datetime import datetime
+import numpy as np
+
+#
+# BENCHMARK DE PONTA A PONTA (dados sintéticos, sem acesso à ANS)
+#
+# Gera (ou reaproveita) um conjunto de sinteticos.py, roda as etapas do ETL e da
+# API sobre ele num diretório de trabalho isolado (SQLite próprio, snapshot,
+# Parquet e Cadop locais) e grava os tempos em JSON para comparar execuções.
+#
+# Uso:
+#   python benchmark.py --escala 1m                     # roda e grava em benchmarks/
+#   python benchmark.py --escala 1m --comparar benchmarks/<anterior>.json
+#
+BENCH_DIR = os.getenv("BENCH_DIR", os.path.join(os.getcwd(), "benchmarks"))
+DADOS_DIR = os.getenv("BENCH_DADOS_DIR", os.path.join(os.getcwd(), "dados_sinteticos"))
+# Variação acima da qual uma etapa é marcada como regressão na comparação
+TOLERANCIA = float(os.getenv("BENCH_TOLERANCIA", "0.10"))
+
+class Medidor:
+    """Acumula as medições de cada etapa: melhor tempo, mediana e linhas processadas."""
+
+    def __init__(self, verbose=False):
+        self.etapas = []
+        self.verbose = verbose
+
+    def medir(self, nome, func, repeticoes=1, linhas=None):
+        tempos, resultado = [], None
+        for _ in range(max(repeticoes, 1)):
+            saida = contextlib.nullcontext() if self.verbose else contextlib.redirect_stdout(io.StringIO())
+            inicio = time.perf_counter()
+            with saida:
+                resultado = func()
+            tempos.append(time.perf_counter() - inicio)
+        n = linhas(resultado) if callable(linhas) else linhas
+        etapa = {"etapa": nome, "melhor_s": min(tempos), "mediana_s": float(np.median(tempos)),
+                 "repeticoes": len(tempos), "linhas": None if n is None else int(n)}
+        self.etapas.append(etapa)
+        taxa = f"  {etapa['linhas'] / etapa['melhor_s']:>12,.0f} linhas/s" if etapa["linhas"] and etapa["melhor_s"] > 0 else ""
+        print(f"⏱️ {nome:<42} {etapa['melhor_s']:9.4f}s{taxa}")
+        return resultado
+
+def _preparar_ambiente(trabalho, modo_api):
+    # Os módulos leem a configuração no import: ambiente isolado antes de importá-los
+    os.makedirs(trabalho, exist_ok=True)
+    banco = os.path.join(trabalho, "benchmark.db")
+    for caminho in (banco, f"{banco}-wal", f"{banco}-shm"):
+        if os.path.exists(caminho):
+            os.remove(caminho)
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{banco}",
+        "CADOP_DIR": trabalho,
+        "API_SNAPSHOT_DIR": os.path.join(trabalho, "snapshot"),
+        "ETL_PARQUET_DIR": os.path.join(trabalho, "consolidado_parquet"),
+        "API_MODO": modo_api,
+        "ANS_PARSE_WORKERS": "1",
+    })
+    os.chdir(trabalho)
+
+def etapas_etl(m, manifesto, dados_dir):
+    import zipfile
+    import pandas as pd
+    import cadop
+    import teste1
+    import teste2
+    from consolidado import salvar_arquivos
+    from database import get_engine, criar_tabelas, carregar_em_massa
+
+    m.medir("cadop.importar_csv", lambda: cadop.importar_csv(os.path.join(dados_dir, manifesto["cadop"])), linhas=len)
+
+    # Leitura e normalização de um membro (primeiro trimestre), isoladas
+    primeiro = manifesto["trimestres"][0]
+    with zipfile.ZipFile(os.path.join(dados_dir, primeiro["arquivo"])) as z:
+        for membro in z.namelist():
+            tipo = "xlsx" if membro.lower().endswith(".xlsx") else "csv"
+            df_raw = m.medir(f"teste1.ler_arquivo_do_zip[{tipo}]", lambda: teste1.ler_arquivo_do_zip(z, membro), linhas=len)
+            m.medir(f"teste1.normalizar[{tipo}]",
+                    lambda: teste1.normalizar(df_raw, primeiro["ano"], primeiro["trimestre"]), linhas=len(df_raw))
+            if tipo == "csv":
+                m.medir("teste1.normalizar_membro[csv]",
+                        lambda: teste1.normalizar_membro(z, membro, primeiro["ano"], primeiro["trimestre"]),
+                        linhas=len(df_raw))
+
+    # Pipeline do teste1 sobre todos os trimestres
+    def processar_todos():
+        dados = []
+        for t in manifesto["trimestres"]:
+            dados += teste1.processar_zip(os.path.join(dados_dir, t["arquivo"]), t["ano"], t["trimestre"])
+        return pd.concat(dados, ignore_index=True)
+
+    total = sum(t["linhas_csv"] + t["linhas_xlsx"] for t in manifesto["trimestres"])
+    df_final = m.medir("teste1.processar_zip[todos]", processar_todos, linhas=total)
+    df_final = m.medir("teste1.corrigir_identificadores",
+                       lambda: teste1.corrigir_identificadores(df_final.copy(), teste1.obter_cadop()), linhas=len)
+    # Mesmo nome de coluna que salvar_consolidado() usa para arquivos e banco
+    df_final = df_final.rename(columns={"Valor": "ValorDespesas"})
+    df_db = m.medir("teste1.preparar_para_banco", lambda: teste1.preparar_para_banco(df_final), linhas=len(df_final))
+    m.medir("consolidado.salvar_arquivos", lambda: salvar_arquivos(df_final), linhas=len(df_final))
+
+    engine = get_engine()
+    criar_tabelas(engine)
+    m.medir("database.carregar_em_massa[consolidadas]",
+            lambda: carregar_em_massa(df_db, "despesas_consolidadas", engine), linhas=len(df_db))
+
+    # Validação de CNPJ (linhas antes da soma por operadora): escalar numa amostra, vetorizada em todas
+    cnpjs = df_final["CNPJ"].dropna().astype(str).str.zfill(14)
+    amostra = cnpjs.sample(min(len(cnpjs), 100_000), random_state=0).tolist()
+    m.medir("teste2.validar_cnpj[amostra]", lambda: [teste2.validar_cnpj(c) for c in amostra], linhas=len(amostra))
+    m.medir("teste2.validar_cnpj_vetorizado", lambda: teste2.validar_cnpj_vetorizado(cnpjs), linhas=len(cnpjs))
+
+    # teste2 completo (carga, validação, enriquecimento, agregação, gravação, snapshot e resumos)
+    df_enriquecido, _ = m.medir("teste2.processar_teste2", lambda: teste2.processar_teste2(incremental=False),
+                                linhas=len(df_db))
+    m.medir("teste2.agregar", lambda: teste2.agregar(df_enriquecido), repeticoes=3, linhas=len(df_enriquecido))
+    return df_enriquecido
+
+def etapas_api(m, repeticoes):
+    from fastapi.testclient import TestClient
+    import app as api
+
+    cliente = TestClient(api.app)
+    m.medir("api.startup", cliente.__enter__)
+    try:
+        cnpjs = [r["CNPJ"] for r in cliente.get("/api/operadoras", params={"limit": 100}).json()["data"]]
+        cnpj = cnpjs[len(cnpjs) // 2] if cnpjs else "00000000000000"
+        etag = cliente.get("/api/estatisticas").headers.get("etag", "")
+        rotas = [
+            ("GET /api/operadoras", "/api/operadoras", {"page": 3, "limit": 10}, {}),
+            ("GET /api/operadoras?search", "/api/operadoras", {"search": "saude", "limit": 10}, {}),
+            ("GET /api/operadoras?search[cnpj]", "/api/operadoras", {"search": cnpj[:6], "limit": 10}, {}),
+            ("GET /api/operadoras/{cnpj}", f"/api/operadoras/{cnpj}", {}, {}),
+            ("GET /api/operadoras/{cnpj}/despesas", f"/api/operadoras/{cnpj}/despesas", {}, {}),
+            ("GET /api/estatisticas", "/api/estatisticas", {}, {}),
+            ("GET /api/estatisticas[304]", "/api/estatisticas", {}, {"If-None-Match": etag}),
+        ]
+        for nome, rota, params, headers in rotas:
+            m.medir(nome, lambda: cliente.get(rota, params=params, headers=headers), repeticoes=repeticoes)
+    finally:
+        cliente.__exit__(None, None, None)
+
+def _commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+def comparar(atual, anterior, tolerancia=TOLERANCIA):
+    """Tabela etapa a etapa (melhor tempo); retorna as etapas que ficaram mais lentas que a tolerância."""
+    base = {e["etapa"]: e for e in anterior["etapas"]}
+    regressoes = []
+    print(f"\nComparação com {anterior.get('commit') or '?'} ({anterior.get('quando')}):")
+    for campo in ("escala", "modo_api", "semente"):
+        if atual.get(campo) != anterior.get(campo):
+            print(f"  ⚠️ {campo} diferente: {anterior.get(campo)} -> {atual.get(campo)}")
+    for e in atual["etapas"]:
+        b = base.get(e["etapa"])
+        if b is None or b["melhor_s"] <= 0:
+            continue
+        razao = e["melhor_s"] / b["melhor_s"]
+        marca = "🔴" if razao > 1 + tolerancia else ("🟢" if razao < 1 - tolerancia else "⚪")
+        if razao > 1 + tolerancia:
+            regressoes.append(e["etapa"])
+        print(f"  {marca} {e['etapa']:<42} {b['melhor_s']:9.4f}s -> {e['melhor_s']:9.4f}s  ({razao:5.2f}x)")
+    return regressoes
+
+def executar(escala="100k", repeticoes=20, modo_api="memoria", semente=None, verbose=False, saida=None):
+    import sinteticos
+    linhas = sinteticos.linhas_da_escala(escala)
+    semente = sinteticos.SEMENTE if semente is None else semente
+    dados_dir = os.path.abspath(os.path.join(DADOS_DIR, f"{escala}-{semente}"))
+    saida = os.path.abspath(saida or BENCH_DIR)
+    raiz = os.getcwd()
+
+    print(f"🧪 Benchmark: escala {escala} ({linhas:,} linhas), API em modo {modo_api}")
+    manifesto = sinteticos.gerar(dados_dir, linhas, semente=semente)
+    _preparar_ambiente(os.path.join(dados_dir, "trabalho"), modo_api)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    m = Medidor(verbose)
+    try:
+        etapas_etl(m, manifesto, dados_dir)
+        etapas_api(m, repeticoes)
+    finally:
+        os.chdir(raiz)
+
+    resultado = {
+        "quando": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_atual(),
+        "escala": escala,
+        "linhas": linhas,
+        "semente": semente,
+        "modo_api": modo_api,
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "etapas": m.etapas,
+    }
+    os.makedirs(saida, exist_ok=True)
+    caminho = os.path.join(saida, f"{datetime.now():%Y%m%dT%H%M%S}-{escala}-{modo_api}.json")
+    with open(caminho, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Resultados salvos em {caminho}")
+    return resultado
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de ponta a ponta com dados sintéticos da ANS")
+    parser.add_argument("--escala", default="100k", help="100k, 1m, 10m, 100m ou número de linhas")
+    parser.add_argument("--repeticoes", type=int, default=20, help="repetições por endpoint da API")
+    parser.add_argument("--modo-api", default="memoria", choices=["memoria", "sql"])
+    parser.add_argument("--semente", type=int, default=None)
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparação")
+    parser.add_argument("--verbose", action="store_true", help="mostra a saída das etapas")
+    args = parser.parse_args()
+
+    resultado = executar(args.escala, args.repeticoes, args.modo_api, args.semente, args.verbose)
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            regressoes = comparar(resultado, json.load(f))
+        if regressoes:
+            print(f"\n🔴 {len(regressoes)} etapa(s) mais lentas que {TOLERANCIA:.0%}: {', '.join(regressoes)}")
+            sys.exit(1)
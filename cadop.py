@@ -0,0 +1,166 @@
+import io
+import os
+import time
+import threading
+import pandas as pd
+from ans_client import baixar
+from conversores import somente_digitos, identificador_para_int
+
+#
+# CADASTRO DE OPERADORAS ATIVAS (Relatorio_cadop.csv) — FONTE ÚNICA
+#
+# teste1, teste2 e a API usam este módulo: o CSV é baixado uma vez, normalizado
+# para um esquema fixo e gravado em disco com tipos (Parquet, ou pickle sem
+# pyarrow). Novas leituras reaproveitam a cópia local enquanto estiver no TTL.
+#
+URL_CADOP = "https://dadosabertos.ans.gov.br/FTP/PDA/operadoras_de_plano_de_saude_ativas/Relatorio_cadop.csv"
+CADOP_TTL_HORAS = float(os.getenv("CADOP_TTL_HORAS", "24"))
+CADOP_DIR = os.getenv("CADOP_DIR", os.getcwd())
+
+COLUNAS = ["CNPJ", "Registro_ANS", "RazaoSocial", "Modalidade", "UF"]
+
+try:
+    import pyarrow  # noqa: F401
+    _FORMATO = "parquet"
+except ImportError:
+    _FORMATO = "pickle"
+
+_lock = threading.Lock()
+_memoria = {"df": None, "carregado_em": 0.0, "por_cnpj": None, "por_registro": None}
+
+def caminho_arquivo():
+    return os.path.join(CADOP_DIR, f"cadop.{'parquet' if _FORMATO == 'parquet' else 'pkl'}")
+
+def normalizar_cadop(df_raw):
+    """Esquema fixo: CNPJ (14 dígitos), Registro_ANS (Int64), RazaoSocial, Modalidade, UF."""
+    colunas = {c.strip().upper(): c for c in df_raw.columns}
+
+    def achar(*termos):
+        for termo in termos:
+            col = next((colunas[c] for c in colunas if termo in c), None)
+            if col:
+                return col
+        return None
+
+    col_cnpj = achar("CNPJ")
+    col_reg = achar("REGISTRO")
+    col_razao = achar("RAZAO", "NOME")
+    col_mod = achar("MODALIDADE")
+    col_uf = colunas.get("UF")
+
+    df = pd.DataFrame(index=df_raw.index)
+    df["CNPJ"] = somente_digitos(df_raw[col_cnpj]).str.zfill(14) if col_cnpj else None
+    df["Registro_ANS"] = identificador_para_int(df_raw[col_reg]) if col_reg else pd.array([pd.NA] * len(df_raw), dtype="Int64")
+    for destino, origem in (("RazaoSocial", col_razao), ("Modalidade", col_mod), ("UF", col_uf)):
+        df[destino] = df_raw[origem].astype(str).str.strip().where(df_raw[origem].notna()) if origem else None
+
+    df = df[df["CNPJ"].notna() & (df["CNPJ"] != "00000000000000")]
+    return df.drop_duplicates("CNPJ").reset_index(drop=True)[COLUNAS]
+
+def _ler_disco():
+    caminho = caminho_arquivo()
+    if not os.path.exists(caminho):
+        return None, 0.0
+    if _FORMATO == "parquet":
+        df = pd.read_parquet(caminho)
+    else:
+        df = pd.read_pickle(caminho)
+    return df, os.path.getmtime(caminho)
+
+def _gravar_disco(df):
+    caminho = caminho_arquivo()
+    tmp = f"{caminho}.tmp"
+    if _FORMATO == "parquet":
+        df.to_parquet(tmp, index=False)
+    else:
+        df.to_pickle(tmp)
+    os.replace(tmp, caminho)
+
+def _definir(df, carregado_em):
+    _memoria.update(df=df, carregado_em=carregado_em, por_cnpj=None, por_registro=None)
+    return df
+
+def obter_cadop(ttl_horas=None, offline=False):
+    """DataFrame normalizado das operadoras ativas (ou None se indisponível).
+
+    Ordem: memória -> arquivo local dentro do TTL -> download. Se o download
+    falhar, usa a cópia local mesmo vencida. Com `offline=True` nunca acessa a rede.
+    """
+    ttl = (CADOP_TTL_HORAS if ttl_horas is None else ttl_horas) * 3600
+    with _lock:
+        agora = time.time()
+        if _memoria["df"] is not None and (offline or agora - _memoria["carregado_em"] < ttl):
+            return _memoria["df"]
+
+        try:
+            df, mtime = _ler_disco()
+        except Exception as e:
+            print(f"⚠️ Cópia local do Cadop ilegível ({e}).")
+            df, mtime = None, 0.0
+        if df is not None and (offline or agora - mtime < ttl):
+            return _definir(df, mtime)
+        if offline:
+            return None
+
+        print("Baixando dados cadastrais de operadoras (Cadop)...")
+        try:
+            conteudo = baixar(URL_CADOP)
+            bruto = pd.read_csv(io.BytesIO(conteudo), sep=";", encoding="latin1", on_bad_lines="skip", dtype=str)
+            novo = normalizar_cadop(bruto)
+        except Exception as e:
+            if df is not None:
+                print(f"⚠️ Erro ao baixar Cadop: {e}. Usando cópia local de {time.ctime(mtime)}.")
+                return _definir(df, mtime)
+            print(f"Erro ao baixar Cadop: {e}")
+            return None
+
+        try:
+            _gravar_disco(novo)
+        except Exception as e:
+            print(f"⚠️ Não foi possível gravar o Cadop em disco: {e}")
+        print(f"✅ Cadop: {len(novo)} operadoras ativas.")
+        return _definir(novo, agora)
+
+def importar_csv(caminho):
+    """Adota um Relatorio_cadop.csv local (ex.: dados sintéticos) como cópia atual, sem rede."""
+    bruto = pd.read_csv(caminho, sep=";", encoding="latin1", on_bad_lines="skip", dtype=str)
+    novo = normalizar_cadop(bruto)
+    with _lock:
+        _gravar_disco(novo)
+        return _definir(novo, time.time())
+
+#
+# CONSULTAS POR CHAVE (índices hash construídos sob demanda)
+#
+def _indice(campo):
+    """(df, {valor: posição}) do Cadop atual; o índice é refeito quando o Cadop é recarregado."""
+    # Dentro do TTL obter_cadop() só devolve a cópia em memória; vencido, recarrega
+    df = obter_cadop()
+    if df is None:
+        return None, {}
+    chave = "por_cnpj" if campo == "CNPJ" else "por_registro"
+    atual = _memoria[chave]
+    if atual is None or atual[0] is not df:
+        atual = (df, {v: i for i, v in enumerate(df[campo].tolist()) if not pd.isna(v)})
+        _memoria[chave] = atual
+    return atual
+
+def _linha(df, posicao):
+    if posicao is None:
+        return None
+    return df.iloc[posicao].to_dict()
+
+def por_cnpj(cnpj):
+    """Registro da operadora pelo CNPJ (com ou sem máscara) ou None."""
+    digitos = "".join(ch for ch in str(cnpj) if ch.isdigit()).zfill(14)
+    df, indice = _indice("CNPJ")
+    return _linha(df, indice.get(digitos))
+
+def por_registro(registro_ans):
+    """Registro da operadora pelo número de registro na ANS ou None."""
+    try:
+        chave = int(registro_ans)
+    except (TypeError, ValueError):
+        return None
+    df, indice = _indice("Registro_ANS")
+    return _linha(df, indice.get(chave))
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+#
+# REPRESENTAÇÃO COMPACTA DOS DATAFRAMES DA API
+#
+# Depois que índices e estatísticas são montados, a API guarda os DataFrames
+# em tipos compactos:
+#
+#   CNPJ (14 dígitos)               -> int64 (8 bytes; zeros à esquerda voltam no zfill)
+#   textos repetidos (RazaoSocial,
+#   UF, Trimestre, Modalidade...)   -> category (códigos inteiros + dicionário)
+#   Ano                             -> int16
+#   ValorDespesas / TotalDespesas   -> int64 em centavos
+#
+# A codificação de cada coluna fica em df.attrs["compacto"] e expandir() devolve
+# os tipos originais (mesmos valores, mesmo JSON). Uma conversão só é aplicada
+# quando a volta é exata.
+#
+COLUNAS_CENTAVOS = ("ValorDespesas", "TotalDespesas")
+COLUNAS_ANO = ("Ano",)
+# Texto vira category quando há no máximo este tanto de valores distintos por linha
+LIMITE_CATEGORIA = 0.5
+
+def _eh_texto(serie):
+    return serie.dtype == object or pd.api.types.is_string_dtype(serie.dtype)
+
+def _cnpj_inteiro(serie):
+    texto = serie.astype(str)
+    if serie.isna().any() or not (texto.str.len() == 14).all() or not texto.str.isdigit().all():
+        return None
+    return texto.astype("int64")
+
+def _centavos(serie):
+    valores = pd.to_numeric(serie, errors="coerce")
+    if valores.isna().any():
+        return None
+    centavos = np.round(valores.to_numpy(dtype="float64") * 100)
+    if np.abs(centavos).max(initial=0) >= 2**53:
+        return None
+    centavos = centavos.astype("int64")
+    # Só compacta se centavos / 100 reproduz exatamente o float original
+    if not np.array_equal(centavos / 100, valores.to_numpy(dtype="float64")):
+        return None
+    return pd.Series(centavos, index=serie.index, name=serie.name)
+
+def compactar(df):
+    """Cópia de `df` em tipos compactos; df.attrs["compacto"] registra como desfazer."""
+    if df.empty:
+        return df
+    resultado = {}
+    codificacao = {}
+    for coluna in df.columns:
+        serie = df[coluna]
+        original = str(serie.dtype)
+        novo = None
+        if coluna == "CNPJ" and _eh_texto(serie):
+            novo, tipo = _cnpj_inteiro(serie), "cnpj14"
+        elif coluna in COLUNAS_CENTAVOS and pd.api.types.is_numeric_dtype(serie):
+            novo, tipo = _centavos(serie), "centavos"
+        elif coluna in COLUNAS_ANO and pd.api.types.is_integer_dtype(serie) and not serie.isna().any():
+            if serie.between(np.iinfo(np.int16).min, np.iinfo(np.int16).max).all():
+                novo, tipo = serie.astype("int16"), "inteiro"
+        # Em colunas object, None e NaN virariam o mesmo ausente da category: nulos ficam de fora
+        sem_volta = serie.dtype == object and serie.isna().any()
+        if novo is None and _eh_texto(serie) and not sem_volta and serie.nunique(dropna=True) <= LIMITE_CATEGORIA * len(serie):
+            novo, tipo = serie.astype("category"), "categoria"
+        if novo is None:
+            resultado[coluna] = serie
+            continue
+        resultado[coluna] = novo
+        codificacao[coluna] = {"tipo": tipo, "dtype": original}
+    compacto = pd.DataFrame(resultado, index=df.index)
+    compacto.attrs["compacto"] = codificacao
+    return compacto
+
+def expandir(df):
+    """Desfaz compactar(): mesmos tipos e valores do DataFrame original."""
+    codificacao = df.attrs.get("compacto")
+    if not codificacao:
+        return df
+    resultado = {}
+    for coluna in df.columns:
+        serie = df[coluna]
+        info = codificacao.get(coluna)
+        if info is None:
+            resultado[coluna] = serie
+        elif info["tipo"] == "cnpj14":
+            resultado[coluna] = serie.astype(str).str.zfill(14).astype(info["dtype"])
+        elif info["tipo"] == "centavos":
+            resultado[coluna] = (serie / 100).astype(info["dtype"])
+        elif info["tipo"] == "categoria":
+            resultado[coluna] = serie.astype(serie.cat.categories.dtype).astype(info["dtype"])
+        else:
+            resultado[coluna] = serie.astype(info["dtype"])
+    return pd.DataFrame(resultado, index=df.index)
+
+def relatorio_memoria(df):
+    """{"linhas", "bytes", "colunas": {coluna: {"dtype", "bytes", "codificacao"}}} de um DataFrame."""
+    por_coluna = df.memory_usage(deep=True, index=False)
+    codificacao = df.attrs.get("compacto", {})
+    return {
+        "linhas": int(len(df)),
+        "bytes": int(por_coluna.sum()),
+        "colunas": {
+            str(c): {
+                "dtype": str(df[c].dtype),
+                "bytes": int(por_coluna[c]),
+                "codificacao": codificacao.get(c, {}).get("tipo"),
+            }
+            for c in df.columns
+        },
+    }
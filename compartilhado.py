@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import shutil
+import contextlib
+from dataclasses import dataclass
+import pandas as pd
+import snapshot
+from compacto import compactar
+from indices import construir_indice_cnpj, construir_estatisticas
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc  # noqa: F401
+except ImportError:
+    pa = None
+
+#
+# DATASET COMPARTILHADO ENTRE WORKERS DA API
+#
+# Com vários workers (python app.py --workers N), cada processo teria sua
+# própria cópia dos DataFrames e dos payloads pré-serializados. Aqui um único
+# carregador monta, para cada versão do snapshot, tudo o que é pesado e grava
+# em Arrow IPC sem compressão, ao lado da versão:
+#
+#   <SNAPSHOT_DIR>/<versao>/compartilhado/
+#       despesas.arrow, agregado.arrow   DataFrames compactados (compacto.py)
+#       indice_cnpj.arrow                CNPJ -> JSON do detalhe e das despesas
+#       operadoras.arrow                 (CNPJ, RazaoSocial) para o catálogo de busca
+#       estado.json                      estatísticas prontas, ETag e tamanhos
+#
+# Os workers abrem os arquivos com memory-map: colunas numéricas, dicionários
+# e os payloads do índice apontam para o page cache, que é o mesmo para todos
+# os processos. Cada worker monta só o catálogo de busca (uma linha por
+# operadora). A publicação roda sob uma trava de arquivo (flock): na troca de
+# versão, o primeiro worker a chegar grava e os outros esperam e só anexam.
+#
+PASTA = "compartilhado"
+
+@dataclass(frozen=True)
+class DadosCompartilhados:
+    versao: str
+    df_despesas: pd.DataFrame
+    df_agregado: pd.DataFrame
+    indice_cnpj: "IndiceCompartilhado"
+    operadoras: pd.DataFrame
+    estatisticas: bytes
+    etag_estatisticas: str
+    memoria_original: dict
+
+def _coluna(tabela, nome):
+    coluna = tabela.column(nome)
+    # Um único bloco aponta direto para o arquivo; combine_chunks() sempre copia
+    return coluna.chunk(0) if coluna.num_chunks == 1 else coluna.combine_chunks()
+
+class IndiceCompartilhado:
+    """CNPJ -> (detalhe_json, despesas_json) sobre colunas binárias mapeadas em memória.
+
+    Mesma interface usada de um dict pela API (get, values, len); os bytes de
+    uma entrada são copiados do mapeamento só quando a entrada é consultada.
+    """
+
+    def __init__(self, tabela):
+        self._detalhe = _coluna(tabela, "detalhe")
+        self._despesas = _coluna(tabela, "despesas")
+        self._posicao = {c: i for i, c in enumerate(tabela.column("CNPJ").to_pylist())}
+        self.nbytes = int(self._detalhe.nbytes + self._despesas.nbytes)
+
+    def __len__(self):
+        return len(self._posicao)
+
+    def _entrada(self, i):
+        return self._detalhe[i].as_py(), self._despesas[i].as_py()
+
+    def get(self, cnpj, padrao=None):
+        i = self._posicao.get(cnpj)
+        return padrao if i is None else self._entrada(i)
+
+    def values(self):
+        return (self._entrada(i) for i in range(len(self._posicao)))
+
+def disponivel():
+    return pa is not None
+
+def _pasta(versao, diretorio=None):
+    return os.path.join(diretorio or snapshot.SNAPSHOT_DIR, versao, PASTA)
+
+@contextlib.contextmanager
+def _trava(versao, diretorio=None):
+    if fcntl is None:
+        # Sem flock (Windows): no pior caso dois processos gravam e um os.replace prevalece
+        yield
+        return
+    caminho = os.path.join(diretorio or snapshot.SNAPSHOT_DIR, versao, f".{PASTA}.lock")
+    with open(caminho, "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _gravar(tabela, caminho):
+    # Sem compressão: só assim o memory-map é zero-copy
+    with pa.OSFile(caminho, "wb") as f, pa.ipc.new_file(f, tabela.schema) as escritor:
+        escritor.write_table(tabela)
+
+def _ler(caminho):
+    with pa.memory_map(caminho, "r") as origem:
+        return pa.ipc.open_file(origem).read_all()
+
+def _df(caminho):
+    # split_blocks: cada coluna no seu bloco, sem consolidar (e copiar) as numéricas;
+    # df.attrs["compacto"] volta dos metadados gravados pelo from_pandas
+    return _ler(caminho).to_pandas(split_blocks=True)
+
+def publicar(versao, df_despesas, df_agregado, diretorio=None):
+    """Monta índice, catálogo, estatísticas e DataFrames compactados da versão e grava tudo.
+
+    A pasta aparece completa ou não aparece (gravada ao lado e renomeada).
+    """
+    destino = _pasta(versao, diretorio)
+    tmp = f"{destino}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+
+    indice = construir_indice_cnpj(df_despesas)
+    cnpjs = list(indice)
+    _gravar(pa.table({
+        "CNPJ": pa.array(cnpjs, pa.string()),
+        "detalhe": pa.array([indice[c][0] for c in cnpjs], pa.large_binary()),
+        "despesas": pa.array([indice[c][1] for c in cnpjs], pa.large_binary()),
+    }), os.path.join(tmp, "indice_cnpj.arrow"))
+    del indice
+
+    if df_despesas.empty or not {"CNPJ", "RazaoSocial"} <= set(df_despesas.columns):
+        operadoras = pd.DataFrame({"CNPJ": pd.Series(dtype=str), "RazaoSocial": pd.Series(dtype=str)})
+    else:
+        operadoras = df_despesas[["CNPJ", "RazaoSocial"]].drop_duplicates()
+    _gravar(pa.Table.from_pandas(operadoras.reset_index(drop=True), preserve_index=False),
+            os.path.join(tmp, "operadoras.arrow"))
+
+    estatisticas, etag = construir_estatisticas(df_despesas, df_agregado, versao)
+    memoria_original = {}
+    for nome, df in zip(snapshot.TABELAS, (df_despesas, df_agregado)):
+        memoria_original[nome] = int(df.memory_usage(deep=True).sum())
+        compacto = compactar(df).reset_index(drop=True)
+        _gravar(pa.Table.from_pandas(compacto, preserve_index=False), os.path.join(tmp, f"{nome}.arrow"))
+
+    with open(os.path.join(tmp, "estado.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "versao": versao,
+            "estatisticas": estatisticas.decode("utf-8"),
+            "etag_estatisticas": etag,
+            "memoria_original": memoria_original,
+        }, f, ensure_ascii=False)
+    try:
+        os.replace(tmp, destino)
+    except OSError:
+        # Outro processo publicou antes (só acontece sem flock)
+        shutil.rmtree(tmp, ignore_errors=True)
+    return destino
+
+def anexar(versao, diretorio=None):
+    """DadosCompartilhados da versão, via memory-map, ou None se a versão não foi publicada."""
+    pasta = _pasta(versao, diretorio)
+    if not os.path.isdir(pasta):
+        return None
+    with open(os.path.join(pasta, "estado.json"), "r", encoding="utf-8") as f:
+        estado = json.load(f)
+    return DadosCompartilhados(
+        versao=versao,
+        df_despesas=_df(os.path.join(pasta, "despesas.arrow")),
+        df_agregado=_df(os.path.join(pasta, "agregado.arrow")),
+        indice_cnpj=IndiceCompartilhado(_ler(os.path.join(pasta, "indice_cnpj.arrow"))),
+        operadoras=_df(os.path.join(pasta, "operadoras.arrow")),
+        estatisticas=estado["estatisticas"].encode("utf-8"),
+        etag_estatisticas=estado["etag_estatisticas"],
+        memoria_original=estado["memoria_original"],
+    )
+
+def obter(diretorio=None):
+    """Dados compartilhados da versão atual do snapshot, publicando-a antes se preciso."""
+    if not disponivel():
+        return None
+    manifesto = snapshot.ler_manifesto(diretorio)
+    if manifesto is None or manifesto["formato"] != "arrow":
+        return None
+    versao = manifesto["versao"]
+    dados = anexar(versao, diretorio)
+    if dados is None:
+        with _trava(versao, diretorio):
+            dados = anexar(versao, diretorio)
+            if dados is None:
+                inicio = time.perf_counter()
+                df_despesas, df_agregado = snapshot.carregar_versao(manifesto, diretorio)
+                publicar(versao, df_despesas, df_agregado, diretorio)
+                del df_despesas, df_agregado
+                print(f"🔗 Dataset compartilhado {versao} publicado em {time.perf_counter() - inicio:.2f}s")
+                dados = anexar(versao, diretorio)
+    return dados
@@ -0,0 +1,146 @@
+import os
+import shutil
+import zipfile
+import pandas as pd
+
+#
+# ARQUIVOS DO CONSOLIDADO (Parquet particionado + CSV/ZIP)
+#
+# O Parquet fica particionado por Ano/Trimestre (layout hive: Ano=2024/Trimestre=1T/)
+# com colunas tipadas, então os leitores pedem só as colunas e os trimestres de
+# que precisam. CSV e ZIP continuam sendo gerados, numa única passada.
+#
+PARQUET_DIR = os.getenv("ETL_PARQUET_DIR", os.path.join(os.getcwd(), "consolidado_parquet"))
+CSV_PATH = "consolidado_despesas.csv"
+ZIP_PATH = "consolidado_despesas.zip"
+LINHAS_POR_BLOCO = 100_000
+# Mesmas linhas de despesas_consolidadas (uma por CNPJ/Trimestre/Ano), em qualquer modo do ETL
+COLUNAS = ["CNPJ", "RazaoSocial", "Trimestre", "Ano", "ValorDespesas"]
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = ds = None
+
+def tipar(df):
+    """Tipos fixos para as colunas conhecidas (CNPJ como texto, Registro_ANS Int64...)."""
+    df = df.copy()
+    if "CNPJ" in df.columns:
+        df["CNPJ"] = df["CNPJ"].astype("string")
+    if "RazaoSocial" in df.columns:
+        df["RazaoSocial"] = df["RazaoSocial"].astype("string")
+    if "Registro_ANS" in df.columns:
+        df["Registro_ANS"] = pd.to_numeric(df["Registro_ANS"], errors="coerce").astype("Int64")
+    if "ValorDespesas" in df.columns:
+        df["ValorDespesas"] = pd.to_numeric(df["ValorDespesas"], errors="coerce").astype("float64")
+    if "Ano" in df.columns:
+        df["Ano"] = df["Ano"].astype("int32")
+    if "Trimestre" in df.columns:
+        df["Trimestre"] = df["Trimestre"].astype("string")
+    return df
+
+def do_banco(df):
+    """Linhas lidas de despesas_consolidadas no formato dos arquivos (DECIMAL do banco -> float)."""
+    df = df[COLUNAS].copy()
+    df["ValorDespesas"] = pd.to_numeric(df["ValorDespesas"]).astype("float64")
+    return df
+
+def _particionamento():
+    return ds.partitioning(pa.schema([("Ano", pa.int32()), ("Trimestre", pa.string())]), flavor="hive")
+
+def gravar_parquet(df, destino=None):
+    """Grava `df` em Parquet particionado, trocando o diretório anterior por inteiro."""
+    if pa is None:
+        print("⚠️ pyarrow não instalado: Parquet do consolidado não gerado.")
+        return None
+    destino = destino or PARQUET_DIR
+    tmp, antigo = f"{destino}.tmp", f"{destino}.old"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tabela = pa.Table.from_pandas(tipar(df), preserve_index=False)
+    ds.write_dataset(tabela, tmp, format="parquet", partitioning=_particionamento())
+
+    shutil.rmtree(antigo, ignore_errors=True)
+    if os.path.exists(destino):
+        os.replace(destino, antigo)
+    os.replace(tmp, destino)
+    shutil.rmtree(antigo, ignore_errors=True)
+    return destino
+
+def gravar_csv_zip(df, csv_path=CSV_PATH, zip_path=ZIP_PATH, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """CSV e ZIP numa só passada: cada bloco serializado vai para os dois destinos."""
+    blocos = (df.iloc[inicio:inicio + linhas_por_bloco] for inicio in range(0, max(len(df), 1), linhas_por_bloco))
+    gravar_csv_zip_blocos(blocos, csv_path, zip_path)
+
+def gravar_csv_zip_blocos(blocos, csv_path=CSV_PATH, zip_path=ZIP_PATH):
+    """gravar_csv_zip() a partir de um iterável de DataFrames (ex.: leitura do banco em blocos)."""
+    nome = os.path.basename(csv_path)
+    csv_tmp, zip_tmp = f"{csv_path}.tmp", f"{zip_path}.tmp"
+    with open(csv_tmp, "w", encoding="utf-8", newline="") as f_csv, \
+         zipfile.ZipFile(zip_tmp, "w", zipfile.ZIP_DEFLATED) as zf, \
+         zf.open(nome, "w", force_zip64=True) as membro:
+        for i, bloco in enumerate(blocos):
+            texto = bloco.to_csv(index=False, header=i == 0)
+            f_csv.write(texto)
+            membro.write(texto.encode("utf-8"))
+    os.replace(csv_tmp, csv_path)
+    os.replace(zip_tmp, zip_path)
+
+def salvar_arquivos(df, csv_path=CSV_PATH, zip_path=ZIP_PATH, parquet_dir=None):
+    gravar_csv_zip(df, csv_path, zip_path)
+    caminho = gravar_parquet(df, parquet_dir)
+    print(f"\n✅ Arquivo final salvo em: {zip_path}" + (f" (Parquet: {caminho})" if caminho else ""))
+
+def gravar_particao_parquet(df, destino=None):
+    """Grava só as partições (Ano/Trimestre) presentes em `df`, substituindo-as no diretório atual."""
+    if pa is None:
+        return None
+    destino = destino or PARQUET_DIR
+    tabela = pa.Table.from_pandas(tipar(df), preserve_index=False)
+    # delete_matching: apaga o conteúdo anterior de cada partição escrita (regravar um trimestre não duplica)
+    ds.write_dataset(tabela, destino, format="parquet", partitioning=_particionamento(),
+                     existing_data_behavior="delete_matching")
+    return destino
+
+#
+# LEITURA
+#
+def ler_parquet(colunas=None, anos=None, trimestres=None, diretorio=None):
+    """Lê o Parquet com projeção de colunas e poda de partições; None se não existir."""
+    diretorio = diretorio or PARQUET_DIR
+    if pa is None or not os.path.isdir(diretorio):
+        return None
+    dataset = ds.dataset(diretorio, format="parquet", partitioning=_particionamento())
+    if colunas is not None:
+        colunas = [c for c in colunas if c in dataset.schema.names]
+    filtro = None
+    if anos is not None:
+        filtro = ds.field("Ano").isin([int(a) for a in anos])
+    if trimestres is not None:
+        cond = ds.field("Trimestre").isin([str(t) for t in trimestres])
+        filtro = cond if filtro is None else filtro & cond
+    return dataset.to_table(columns=colunas, filter=filtro).to_pandas()
+
+def ler_consolidado(colunas=None, anos=None, trimestres=None, csv_path=CSV_PATH, zip_path=ZIP_PATH):
+    """Consolidado local: Parquet (preferido), depois CSV ou ZIP. None se nada existir."""
+    df = ler_parquet(colunas, anos, trimestres)
+    if df is not None:
+        return df
+
+    # CSV/ZIP: identificadores como texto para não perder zeros nem virar float
+    opcoes = {"dtype": {"CNPJ": str, "Registro_ANS": str, "Trimestre": str}}
+    if colunas is not None:
+        opcoes["usecols"] = lambda c: c in colunas
+    if os.path.exists(csv_path):
+        df = pd.read_csv(csv_path, **opcoes)
+    elif os.path.exists(zip_path):
+        with zipfile.ZipFile(zip_path) as z:
+            csv_name = [n for n in z.namelist() if n.endswith('.csv')][0]
+            df = pd.read_csv(z.open(csv_name), **opcoes)
+    else:
+        return None
+    if anos is not None and "Ano" in df.columns:
+        df = df[df["Ano"].isin([int(a) for a in anos])]
+    if trimestres is not None and "Trimestre" in df.columns:
+        df = df[df["Trimestre"].isin([str(t) for t in trimestres])]
+    return df
@@ -0,0 +1,143 @@
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+from sqlalchemy import text
+from indices import serializar_estatisticas
+
+#
+# MODO SQL DA API (API_MODO=sql)
+#
+# Em vez de copiar as tabelas para o pandas, cada requisição executa uma
+# consulta parametrizada e apoiada em índice (CNPJ é prefixo da PK de
+# despesas_consolidadas). A paginação é por chave (keyset): o cliente devolve
+# o último CNPJ recebido em `apos` e a consulta continua dali, sem OFFSET. O
+# total de operadoras de cada busca é contado uma vez por versão dos dados.
+#
+_cache_estatisticas = {}
+_lock_estatisticas = threading.Lock()
+
+_cache_totais = OrderedDict()
+_lock_totais = threading.Lock()
+MAX_TOTAIS = 1024
+
+def _nativo(valor):
+    # DECIMAL do MySQL chega como Decimal
+    return float(valor) if isinstance(valor, Decimal) else valor
+
+def _linhas(resultado):
+    return [{k: _nativo(v) for k, v in linha.items()} for linha in resultado.mappings()]
+
+def _padrao_like(termo):
+    # Busca literal: % e _ digitados pelo usuário não viram curingas
+    escapado = termo.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+    return f"%{escapado}%"
+
+def listar_operadoras(engine, page=1, limit=10, search=None, apos=None):
+    filtros, params = [], {"limit": int(limit)}
+    if search:
+        filtros.append("(RazaoSocial LIKE :padrao ESCAPE '!' OR CNPJ LIKE :padrao ESCAPE '!')")
+        params["padrao"] = _padrao_like(search)
+    where = f"WHERE {' AND '.join(filtros)}" if filtros else ""
+
+    if apos is not None:
+        # Keyset: continua após o último CNPJ da página anterior
+        cond = f"{where} AND CNPJ > :apos" if where else "WHERE CNPJ > :apos"
+        params["apos"] = str(apos)
+        paginacao = "LIMIT :limit"
+    else:
+        cond = where
+        params["offset"] = max((int(page) - 1) * int(limit), 0)
+        paginacao = "LIMIT :limit OFFSET :offset"
+
+    sql = (
+        "SELECT CNPJ, COALESCE(MAX(RazaoSocial), 'DESCONHECIDO') AS RazaoSocial "
+        f"FROM despesas_consolidadas {cond} GROUP BY CNPJ ORDER BY CNPJ {paginacao}"
+    )
+    with engine.connect() as conn:
+        data = _linhas(conn.execute(text(sql), params))
+    total = _total_operadoras(engine, where, params.get("padrao"))
+    proximo = data[-1]["CNPJ"] if len(data) == int(limit) else None
+    return {"data": data, "total": total, "page": page, "limit": limit, "proximo": proximo}
+
+def _total_operadoras(engine, where, padrao):
+    """COUNT(DISTINCT CNPJ) da busca, em cache por versão dos dados (não a cada página)."""
+    chave = (versao_dados(engine), padrao)
+    with _lock_totais:
+        if chave in _cache_totais:
+            _cache_totais.move_to_end(chave)
+            return _cache_totais[chave]
+    with engine.connect() as conn:
+        total = int(conn.execute(
+            text(f"SELECT COUNT(DISTINCT CNPJ) FROM despesas_consolidadas {where}"),
+            {"padrao": padrao} if padrao is not None else {},
+        ).scalar() or 0)
+    with _lock_totais:
+        _cache_totais[chave] = total
+        while len(_cache_totais) > MAX_TOTAIS:
+            _cache_totais.popitem(last=False)
+    return total
+
+_SQL_DESPESAS = (
+    "SELECT d.CNPJ, COALESCE(d.RazaoSocial, 'DESCONHECIDO') AS RazaoSocial, d.Trimestre, d.Ano, "
+    "d.ValorDespesas, o.UF "
+    "FROM despesas_consolidadas d LEFT JOIN operadoras_ativas o ON o.CNPJ = d.CNPJ "
+    "WHERE d.CNPJ = :cnpj ORDER BY d.Ano DESC, d.Trimestre DESC"
+)
+
+def normalizar_cnpj(cnpj):
+    """CNPJ com ou sem máscara -> 14 dígitos, como gravado no banco."""
+    digitos = re.sub(r"\D", "", str(cnpj))
+    return digitos.zfill(14) if digitos else str(cnpj)
+
+def despesas_operadora(engine, cnpj):
+    with engine.connect() as conn:
+        return _linhas(conn.execute(text(_SQL_DESPESAS), {"cnpj": normalizar_cnpj(cnpj)}))
+
+def detalhe_operadora(engine, cnpj):
+    with engine.connect() as conn:
+        linhas = _linhas(conn.execute(text(f"{_SQL_DESPESAS} LIMIT 1"), {"cnpj": normalizar_cnpj(cnpj)}))
+    return linhas[0] if linhas else None
+
+def versao_dados(engine):
+    """Identificador barato da versão dos dados (muda a cada carga/agregação do ETL).
+
+    O marcador de etl_versao cobre o que o estado da carga não vê, como uma
+    reagregação completa com nomes/UFs novos do Cadop.
+    """
+    with engine.connect() as conn:
+        estado = conn.execute(text(
+            "SELECT COUNT(*), MAX(CarregadoEm), SUM(Agregado) FROM etl_carga_trimestres"
+        )).one()
+        agregados = conn.execute(text("SELECT COUNT(*) FROM despesas_agregadas")).scalar()
+        marcador = conn.execute(text("SELECT MAX(Versao) FROM etl_versao")).scalar()
+    return hashlib.sha1(repr((*estado, agregados, marcador)).encode()).hexdigest()[:16]
+
+def estatisticas(engine):
+    """(payload_json, etag) das estatísticas, recalculadas só quando a versão dos dados muda."""
+    versao = versao_dados(engine)
+    with _lock_estatisticas:
+        if versao in _cache_estatisticas:
+            return _cache_estatisticas[versao]
+        with engine.connect() as conn:
+            total, media, linhas = conn.execute(text(
+                "SELECT SUM(ValorDespesas), AVG(ValorDespesas), COUNT(*) FROM despesas_consolidadas"
+            )).one()
+            top_5 = _linhas(conn.execute(text(
+                "SELECT * FROM despesas_agregadas ORDER BY TotalDespesas DESC LIMIT 5"
+            )))
+            por_uf = {
+                str(uf): float(v) for uf, v in conn.execute(text(
+                    "SELECT UF, SUM(TotalDespesas) FROM despesas_agregadas WHERE UF IS NOT NULL GROUP BY UF"
+                ))
+            }
+        dados = {} if not linhas else {
+            "total_despesas": float(total or 0),
+            "media_despesas": float(media or 0),
+            "top_5_operadoras": top_5,
+            "distribuicao_uf": por_uf,
+        }
+        _cache_estatisticas.clear()
+        _cache_estatisticas[versao] = serializar_estatisticas(dados, versao)
+        return _cache_estatisticas[versao]
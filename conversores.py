@@ -0,0 +1,126 @@
+import csv
+import time
+import pandas as pd
+
+#
+# CONVERSÃO DE NÚMEROS NO FORMATO BRASILEIRO ("1.234,56") E IDENTIFICADORES
+#
+# O caminho principal deixa o parser C do pandas converter as colunas VL_* já na
+# leitura (thousands='.', decimal=','), sem criar colunas de strings
+# intermediárias. As funções abaixo cobrem o que sobra: colunas que não
+# puderam ser inferidas como número e identificadores (CNPJ / Registro ANS).
+#
+def eh_coluna_valor(coluna):
+    return str(coluna).strip().upper().startswith("VL_")
+
+def opcoes_leitura_csv(cabecalho, sep=";"):
+    """kwargs de pd.read_csv para um CSV da ANS a partir da linha de cabeçalho.
+
+    Colunas VL_* ficam sem dtype para o parser convertê-las como números no
+    formato brasileiro; as demais são lidas como texto (preserva zeros à
+    esquerda de CNPJ/REG_ANS e o prefixo de CD_CONTA).
+    """
+    if isinstance(cabecalho, bytes):
+        try:
+            cabecalho = cabecalho.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            cabecalho = cabecalho.decode("latin1")
+    colunas = next(csv.reader([cabecalho.lstrip("\ufeff").strip("\r\n")], delimiter=sep), [])
+    dtype = {c: str for c in colunas if not eh_coluna_valor(c)}
+    return {"sep": sep, "dtype": dtype, "thousands": ".", "decimal": ","}
+
+def valor_br_para_float(serie):
+    """'1.234,56' -> 1234.56 com o sinal descartado (como no ETL original).
+
+    Colunas já numéricas só recebem o módulo. Texto (colunas que o parser não
+    conseguiu inferir) dispensa o strip, que o to_numeric já faz. Valores
+    inválidos viram NaN.
+    """
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie.astype("float64").abs()
+    limpo = (
+        serie.astype(str)
+        .str.replace(".", "", regex=False)
+        .str.replace("-", "", regex=False)
+        .str.replace(",", ".", regex=False)
+    )
+    return pd.to_numeric(limpo, errors="coerce")
+
+def somente_digitos(serie):
+    """Mantém apenas os dígitos de cada valor (CNPJ, Registro ANS) como string; ausente vira ""."""
+    if pd.api.types.is_numeric_dtype(serie):
+        texto = identificador_para_int(serie).astype("string")
+    else:
+        texto = serie.astype("string").str.replace(r"\D", "", regex=True)
+    # "" (e não "<NA>"/NaN) para o filtro de CNPJ vazio do ETL e o zfill do Cadop
+    return texto.fillna("").astype(str)
+
+def identificador_para_int(serie):
+    """Identificador numérico (Registro ANS, CNPJ) como Int64; sem dígitos vira <NA>."""
+    if pd.api.types.is_integer_dtype(serie):
+        return serie.astype("Int64")
+    if pd.api.types.is_float_dtype(serie):
+        return serie.round().astype("Int64")
+    digitos = serie.astype(str).str.replace(r"\D", "", regex=True)
+    return pd.to_numeric(digitos.where(digitos != ""), errors="coerce").astype("Int64")
+
+def periodo_chave(ano, trimestre):
+    """(2024, '3T') -> 20243: chave inteira e ordenável do trimestre (coluna Periodo)."""
+    if isinstance(ano, pd.Series) or isinstance(trimestre, pd.Series):
+        tri = pd.Series(trimestre).astype(str).str[0].astype(int)
+        return pd.Series(ano).astype(int).to_numpy() * 10 + tri.to_numpy()
+    return int(ano) * 10 + int(str(trimestre)[0])
+
+#
+# MICRO-BENCHMARK (python conversores.py [linhas])
+#
+def _valor_br_legado(serie):
+    # Versão anterior de normalizar(): quatro passadas de string + to_numeric
+    return pd.to_numeric(
+        serie.astype(str)
+        .str.replace(".", "", regex=False)
+        .str.replace(",", ".", regex=False)
+        .str.replace("-", "", regex=False)
+        .str.strip(),
+        errors="coerce",
+    )
+
+if __name__ == "__main__":
+    import io
+    import sys
+    import numpy as np
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = np.random.default_rng(42)
+    centavos = rng.integers(-10**11, 10**11, n)
+    registros = rng.integers(300000, 500000, n)
+    cabecalho = "REG_ANS;CD_CONTA_CONTABIL;DESCRICAO;VL_SALDO_FINAL\n"
+    linhas = "".join(
+        f'"{r}";"411";"EVENTOS";"{c / 100:,.2f}"\n'.replace(",", "X").replace(".", ",").replace("X", ".")
+        for r, c in zip(registros, centavos)
+    )
+    conteudo = (cabecalho + linhas).encode("utf-8")
+
+    def medir(nome, func):
+        inicio = time.perf_counter()
+        resultado = func()
+        print(f"{nome:<45} {time.perf_counter() - inicio:8.3f}s")
+        return resultado
+
+    def antigo():
+        df = pd.read_csv(io.BytesIO(conteudo), sep=";", dtype=str)
+        valor = _valor_br_legado(df["VL_SALDO_FINAL"])
+        reg = pd.to_numeric(df["REG_ANS"], errors="coerce").astype("Int64").astype(str)
+        return valor, reg
+
+    def novo():
+        df = pd.read_csv(io.BytesIO(conteudo), **opcoes_leitura_csv(cabecalho))
+        valor = valor_br_para_float(df["VL_SALDO_FINAL"])
+        reg = identificador_para_int(df["REG_ANS"])
+        return valor, reg
+
+    print(f"{n} linhas")
+    v_antigo, r_antigo = medir("Antigo: read_csv(str) + replace encadeado", antigo)
+    v_novo, r_novo = medir("Novo: read_csv(decimal=',') + Int64", novo)
+    print(f"  valores idênticos: {bool((v_antigo == v_novo).all())}")
+    print(f"  registros idênticos: {bool((r_antigo == r_novo.astype(str)).all())}")
@@ -1,11 +1,41 @@
 import os
-from sqlalchemy import create_engine
+import csv
+import time
+import tempfile
+import uuid
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import create_engine, text, inspect
 from sqlalchemy.orm import sessionmaker
 
+# Carga em massa: tamanho do lote e método (auto | load_data | executemany | to_sql)
+BULK_BATCH = int(os.getenv("DB_BULK_BATCH", "10000"))
+BULK_METODO = os.getenv("DB_BULK_METODO", "auto").lower()
+MYSQL_LOCAL_INFILE = os.getenv("DB_MYSQL_LOCAL_INFILE", "0").lower() in ("1", "true", "sim")
+
+# Pool de conexões (a API no modo sql abre uma conexão por requisição)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() in ("1", "true", "sim")
+
+def _opcoes_pool(url):
+    # SQLite em memória usa um pool próprio, que não aceita dimensionamento
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/") == "sqlite:"):
+        return {}
+    return {
+        "pool_size": POOL_SIZE,
+        "max_overflow": POOL_MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT,
+        "pool_recycle": POOL_RECYCLE,
+        "pool_pre_ping": POOL_PRE_PING,
+    }
+
 def _build_engine():
     url = os.getenv("DATABASE_URL")
     if url:
-        return create_engine(url)
+        return create_engine(url, **_opcoes_pool(url))
     vendor = os.getenv("DB_VENDOR", "sqlite").lower()
     if vendor == "mysql":
         user = os.getenv("DB_USER")
@@ -16,13 +46,368 @@ def _build_engine():
         if not all([user, password, name]):
             raise ValueError("Configure DB_USER, DB_PASSWORD e DB_NAME para usar MySQL")
         url = f"mysql+pymysql://{user}:{password}@{host}:{port}/{name}"
-        return create_engine(url)
+        # LOAD DATA LOCAL INFILE precisa ser habilitado também no cliente
+        connect_args = {"local_infile": True} if MYSQL_LOCAL_INFILE else {}
+        return create_engine(url, connect_args=connect_args, **_opcoes_pool(url))
     path = os.getenv("DB_PATH", os.path.join(os.getcwd(), "health_data.db"))
     url = f"sqlite:///{path}"
-    return create_engine(url)
+    return create_engine(url, **_opcoes_pool(url))
 
 engine = _build_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_engine():
     return engine
+
+# 
+# DDL (mesmo esquema do teste3.sql) + tabela de controle do ETL incremental
+# 
+DDL_TABELAS = [
+    """
+    CREATE TABLE IF NOT EXISTS despesas_consolidadas (
+        CNPJ VARCHAR(14),
+        RazaoSocial VARCHAR(255),
+        Trimestre VARCHAR(2),
+        Ano INTEGER,
+        ValorDespesas DECIMAL(18, 2),
+        Periodo INTEGER,
+        PRIMARY KEY (CNPJ, Trimestre, Ano)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS operadoras_ativas (
+        CNPJ VARCHAR(14) PRIMARY KEY,
+        RegistroANS VARCHAR(20),
+        Modalidade VARCHAR(100),
+        UF CHAR(2)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS despesas_agregadas (
+        RazaoSocial VARCHAR(255),
+        UF CHAR(2),
+        TotalDespesas DECIMAL(18, 2),
+        MediaDespesas DECIMAL(18, 2),
+        DesvioPadraoDespesas DECIMAL(18, 2)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS despesas_parciais (
+        RazaoSocial VARCHAR(255),
+        UF CHAR(2),
+        Ano INTEGER,
+        Trimestre VARCHAR(2),
+        Contagem INTEGER,
+        Soma DOUBLE PRECISION,
+        M2 DOUBLE PRECISION,
+        PRIMARY KEY (RazaoSocial, UF, Ano, Trimestre)
+    )
+    """,
+    # Resumos das consultas analíticas do teste3.sql, recalculados pelo ETL (resumos.py)
+    """
+    CREATE TABLE IF NOT EXISTS resumo_crescimento (
+        CNPJ VARCHAR(14) PRIMARY KEY,
+        RazaoSocial VARCHAR(255),
+        PeriodoInicial INTEGER,
+        PeriodoFinal INTEGER,
+        ValorInicial DECIMAL(18, 2),
+        ValorFinal DECIMAL(18, 2),
+        CrescimentoPercentual DOUBLE PRECISION
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS resumo_uf (
+        UF CHAR(2) PRIMARY KEY,
+        TotalDespesas DECIMAL(18, 2),
+        MediaPorOperadora DECIMAL(18, 2)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS resumo_acima_media (
+        CNPJ VARCHAR(14) PRIMARY KEY,
+        TrimestresAcima INTEGER
+    )
+    """,
+    # Métricas por etapa das execuções do ETL (metricas.py, com ETL_METRICAS_BANCO=1)
+    """
+    CREATE TABLE IF NOT EXISTS etl_metricas (
+        Execucao VARCHAR(40),
+        Pipeline VARCHAR(20),
+        Etapa VARCHAR(60),
+        Detalhe VARCHAR(255),
+        Inicio VARCHAR(32),
+        WallS DOUBLE PRECISION,
+        CpuS DOUBLE PRECISION,
+        LinhasEntrada BIGINT,
+        LinhasSaida BIGINT,
+        Bytes BIGINT,
+        RssPicoMB DOUBLE PRECISION,
+        MemoriaDfMB DOUBLE PRECISION,
+        Erro VARCHAR(500)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS etl_carga_trimestres (
+        Ano INTEGER,
+        Trimestre VARCHAR(2),
+        Arquivo VARCHAR(255),
+        Checksum CHAR(64),
+        Linhas INTEGER,
+        CarregadoEm VARCHAR(32),
+        Agregado INTEGER DEFAULT 0,
+        PRIMARY KEY (Ano, Trimestre)
+    )
+    """,
+    # Marcador da versão dos dados servidos, trocado pelo ETL a cada gravação (ETag/caches do modo sql)
+    """
+    CREATE TABLE IF NOT EXISTS etl_versao (
+        Id INTEGER PRIMARY KEY,
+        Versao VARCHAR(32),
+        AtualizadoEm VARCHAR(32)
+    )
+    """,
+]
+
+# Índices da API no modo sql e das consultas analíticas (CNPJ já é prefixo das PKs)
+DDL_INDICES = [
+    "CREATE INDEX idx_agregadas_total ON despesas_agregadas (TotalDespesas)",
+    "CREATE INDEX idx_agregadas_uf ON despesas_agregadas (UF)",
+    # Cobrem os joins por (CNPJ, Periodo) e o filtro contra a média sem ler a tabela
+    "CREATE INDEX idx_consolidadas_cnpj_periodo ON despesas_consolidadas (CNPJ, Periodo, ValorDespesas)",
+    "CREATE INDEX idx_consolidadas_valor ON despesas_consolidadas (ValorDespesas, CNPJ)",
+    "CREATE INDEX idx_operadoras_uf ON operadoras_ativas (UF, CNPJ)",
+    "CREATE INDEX idx_crescimento_percentual ON resumo_crescimento (CrescimentoPercentual)",
+]
+
+def criar_tabelas(engine=None):
+    engine = engine or get_engine()
+    with engine.connect() as conn:
+        for ddl in DDL_TABELAS:
+            conn.execute(text(ddl))
+        conn.commit()
+    migrar_periodo(engine)
+    criar_indices(engine)
+
+def migrar_periodo(engine=None):
+    """Bancos criados antes da coluna Periodo: adiciona a coluna e preenche (Ano*10 + trimestre)."""
+    engine = engine or get_engine()
+    colunas = {c["name"] for c in inspect(engine).get_columns("despesas_consolidadas")}
+    with engine.begin() as conn:
+        if "Periodo" not in colunas:
+            conn.execute(text("ALTER TABLE despesas_consolidadas ADD COLUMN Periodo INTEGER"))
+        conn.execute(text(
+            "UPDATE despesas_consolidadas SET Periodo = Ano * 10 + (SUBSTR(Trimestre, 1, 1) + 0) "
+            "WHERE Periodo IS NULL"
+        ))
+
+def criar_indices(engine=None):
+    # MySQL não tem CREATE INDEX IF NOT EXISTS: índice já existente é ignorado
+    engine = engine or get_engine()
+    for ddl in DDL_INDICES:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(ddl))
+        except Exception:
+            pass
+
+# 
+# CARGA EM MASSA (substitui DataFrame.to_sql)
+# 
+def _registros(df):
+    # NaN/NA -> None para o driver
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+def _tuplas(df):
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+def _lotes(iteravel, tamanho):
+    lote = []
+    for item in iteravel:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def _sql_insert(dialeto, tabela, colunas, chaves, marcador):
+    valores = ", ".join(marcador(c) for c in colunas)
+    sql = f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({valores})"
+    if not chaves:
+        return sql
+    atualizar = [c for c in colunas if c not in chaves]
+    if dialeto in ("sqlite", "postgresql"):
+        if not atualizar:
+            return f"{sql} ON CONFLICT ({', '.join(chaves)}) DO NOTHING"
+        sets = ", ".join(f"{c} = excluded.{c}" for c in atualizar)
+        return f"{sql} ON CONFLICT ({', '.join(chaves)}) DO UPDATE SET {sets}"
+    if dialeto == "mysql":
+        sets = ", ".join(f"{c} = VALUES({c})" for c in (atualizar or chaves))
+        return f"{sql} ON DUPLICATE KEY UPDATE {sets}"
+    raise NotImplementedError(f"Upsert não suportado para o dialeto {dialeto}")
+
+def _carga_sqlite(engine, df, tabela, chaves, batch_size):
+    sql = _sql_insert("sqlite", tabela, list(df.columns), chaves, lambda c: "?")
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        # WAL + synchronous=NORMAL: um fsync por checkpoint em vez de um por commit
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.execute("PRAGMA cache_size=-65536")
+        # Uma única transação para todos os lotes
+        for lote in _lotes(_tuplas(df), batch_size):
+            cur.executemany(sql, lote)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _carga_mysql_executemany(engine, df, tabela, chaves, batch_size):
+    # O PyMySQL reescreve executemany de INSERT em INSERTs multi-linha
+    sql = _sql_insert("mysql", tabela, list(df.columns), chaves, lambda c: "%s")
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        for lote in _lotes(_tuplas(df), batch_size):
+            cur.executemany(sql, lote)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _carga_mysql_load_data(engine, df, tabela, chaves):
+    # CSV temporário com \N para nulos; REPLACE cobre o upsert pela chave primária
+    fd, caminho = tempfile.mkstemp(prefix=f"{tabela}_", suffix=".csv")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            escritor = csv.writer(f, quoting=csv.QUOTE_MINIMAL, lineterminator="\n")
+            for linha in _tuplas(df):
+                escritor.writerow(["\\N" if v is None else v for v in linha])
+        modo = "REPLACE " if chaves else ""
+        sql = (
+            f"LOAD DATA LOCAL INFILE '{caminho}' {modo}INTO TABLE {tabela} "
+            "CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+            f"LINES TERMINATED BY '\\n' ({', '.join(df.columns)})"
+        )
+        conn = engine.raw_connection()
+        try:
+            conn.cursor().execute(sql)
+            conn.commit()
+        finally:
+            conn.close()
+    finally:
+        os.remove(caminho)
+
+def carregar_em_massa(df, tabela, engine=None, batch_size=None, metodo=None, upsert_chaves=None, relatorio=True):
+    """Insere `df` em `tabela` (que já deve existir) pelo caminho mais rápido do dialeto.
+
+    - sqlite: executemany em uma transação, com PRAGMAs de carga
+    - mysql: LOAD DATA LOCAL INFILE (DB_MYSQL_LOCAL_INFILE=1) ou INSERT multi-linha em lotes
+    - outros: to_sql(method="multi") em lotes
+
+    Com `upsert_chaves`, linhas com a mesma chave são atualizadas. Retorna o
+    número de linhas e, com `relatorio`, imprime a taxa (linhas/s).
+    """
+    if df.empty:
+        return 0
+    engine = engine or get_engine()
+    batch_size = batch_size or BULK_BATCH
+    metodo = (metodo or BULK_METODO).lower()
+    dialeto = engine.dialect.name
+
+    if metodo == "auto":
+        if dialeto == "sqlite":
+            metodo = "executemany"
+        elif dialeto == "mysql":
+            metodo = "load_data" if MYSQL_LOCAL_INFILE else "executemany"
+        else:
+            metodo = "to_sql"
+
+    inicio = time.perf_counter()
+    if metodo == "load_data" and dialeto == "mysql":
+        _carga_mysql_load_data(engine, df, tabela, upsert_chaves)
+    elif metodo == "executemany" and dialeto == "sqlite":
+        _carga_sqlite(engine, df, tabela, upsert_chaves, batch_size)
+    elif metodo == "executemany" and dialeto == "mysql":
+        _carga_mysql_executemany(engine, df, tabela, upsert_chaves, batch_size)
+    elif upsert_chaves:
+        sql = _sql_insert(dialeto, tabela, list(df.columns), upsert_chaves, lambda c: f":{c}")
+        with engine.begin() as conn:
+            for lote in _lotes(_registros(df), batch_size):
+                conn.execute(text(sql), lote)
+        metodo = "executemany"
+    else:
+        df.to_sql(tabela, engine, if_exists="append", index=False, method="multi", chunksize=batch_size)
+        metodo = "to_sql"
+
+    duracao = max(time.perf_counter() - inicio, 1e-9)
+    if relatorio:
+        print(f"   📥 {tabela}: {len(df)} linhas em {duracao:.2f}s ({len(df) / duracao:,.0f} linhas/s, {metodo})")
+    return len(df)
+
+def upsert_dataframe(df, tabela, chaves, engine=None, relatorio=True):
+    """INSERT ... ON CONFLICT/ON DUPLICATE KEY UPDATE de `df` em `tabela`."""
+    return carregar_em_massa(df, tabela, engine, upsert_chaves=chaves, relatorio=relatorio)
+
+def excluir_por_chaves(df_chaves, tabela, engine=None):
+    """DELETE das linhas de `tabela` cujas chaves aparecem em `df_chaves`."""
+    if df_chaves.empty:
+        return 0
+    engine = engine or get_engine()
+    cond = " AND ".join(f"{c} = :{c}" for c in df_chaves.columns)
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {tabela} WHERE {cond}"), _registros(df_chaves))
+    return len(df_chaves)
+
+# 
+# ESTADO DA CARGA INCREMENTAL (etl_carga_trimestres)
+# 
+def ler_estado_carga(engine=None):
+    """{(Ano, Trimestre): {Arquivo, Checksum, Linhas, CarregadoEm, Agregado}}"""
+    engine = engine or get_engine()
+    with engine.connect() as conn:
+        linhas = conn.execute(text(
+            "SELECT Ano, Trimestre, Arquivo, Checksum, Linhas, CarregadoEm, Agregado FROM etl_carga_trimestres"
+        )).mappings().all()
+    return {(int(l["Ano"]), l["Trimestre"]): dict(l) for l in linhas}
+
+def reiniciar_estado_carga(engine=None):
+    """Esquece os trimestres registrados (usado na carga completa)."""
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM etl_carga_trimestres"))
+
+def registrar_carga(ano, trimestre, arquivo, checksum, linhas, engine=None):
+    registro = pd.DataFrame([{
+        "Ano": int(ano), "Trimestre": trimestre, "Arquivo": arquivo, "Checksum": checksum,
+        "Linhas": int(linhas), "CarregadoEm": datetime.now().isoformat(timespec="seconds"), "Agregado": 0,
+    }])
+    upsert_dataframe(registro, "etl_carga_trimestres", ["Ano", "Trimestre"], engine, relatorio=False)
+
+def marcar_agregado(chaves, engine=None):
+    """Marca os trimestres [(Ano, Trimestre), ...] como já refletidos nas agregações."""
+    if not chaves:
+        return
+    engine = engine or get_engine()
+    with engine.begin() as conn:
+        conn.execute(
+            text("UPDATE etl_carga_trimestres SET Agregado = 1 WHERE Ano = :Ano AND Trimestre = :Trimestre"),
+            [{"Ano": int(a), "Trimestre": t} for a, t in chaves],
+        )
+
+# 
+# VERSÃO DOS DADOS (etl_versao)
+# 
+def registrar_versao(engine=None):
+    """Troca o marcador de versão: agregação, nomes ou UFs podem ter mudado sem mudar o estado da carga."""
+    engine = engine or get_engine()
+    registro = pd.DataFrame([{
+        "Id": 1, "Versao": uuid.uuid4().hex, "AtualizadoEm": datetime.now().isoformat(timespec="seconds"),
+    }])
+    upsert_dataframe(registro, "etl_versao", ["Id"], engine, relatorio=False)
@@ -0,0 +1,333 @@
+import io
+import os
+import re
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+from sqlalchemy import text, bindparam
+import snapshot
+from compacto import expandir
+from conversores import periodo_chave
+from consultas_sql import normalizar_cnpj
+from respostas import NIVEL_GZIP, NIVEL_BROTLI, brotli, linhas_json
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc  # noqa: F401
+except ImportError:
+    pa = None
+
+#
+# EXPORTAÇÃO EM STREAMING (/api/export)
+#
+# O resultado filtrado sai em blocos de LINHAS_POR_BLOCO linhas: cada bloco é
+# filtrado, expandido (compacto.expandir), serializado em CSV, NDJSON ou Arrow
+# IPC, comprimido em fluxo (gzip/br) e enviado. A memória do servidor depende
+# do tamanho do bloco, não do resultado. No modo memória os blocos vêm do
+# estado da API; no modo SQL, de um cursor (stream_results + fetchmany).
+#
+# Retomada: a saída é determinística para (versão dos dados, filtros, formato,
+# codificação), identificada pelo ETag. Quando uma exportação termina, o total
+# de bytes fica registrado em memória e num arquivo por ETag em API_EXPORT_DIR,
+# visível para todos os workers. Um pedido com Range (e If-Range igual ao ETag)
+# refaz o fluxo, descarta os bytes já recebidos e responde 206. Se o total
+# ainda não é conhecido (o primeiro download caiu no meio), ele é medido antes
+# com uma passada sem envio.
+#
+# API_EXPORT_LINHAS   linhas por bloco (padrão 50000)
+# API_EXPORT_DIR      totais das exportações (padrão <SNAPSHOT_DIR>/exportacoes)
+#
+LINHAS_POR_BLOCO = int(os.getenv("API_EXPORT_LINHAS", "50000"))
+EXPORT_DIR = os.getenv("API_EXPORT_DIR", os.path.join(snapshot.SNAPSHOT_DIR, "exportacoes"))
+FORMATOS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+TABELAS = ("despesas", "agregado")
+COLUNAS_NUMERICAS = ("Ano", "ValorDespesas", "TotalDespesas", "MediaDespesas", "DesvioPadraoDespesas")
+
+_tamanhos = OrderedDict()
+_lock_tamanhos = threading.Lock()
+MAX_TAMANHOS = 1024
+
+class FiltroInvalido(ValueError):
+    pass
+
+#
+# FILTROS
+#
+def _lista(valor):
+    return [v.strip() for v in (valor or "").split(",") if v.strip()]
+
+def _periodo(valor, fim):
+    """'2024', '2024-3', '2024-3T', '20243' -> chave Periodo (ano sozinho: 1º ou 4º trimestre)."""
+    if not valor:
+        return None
+    m = re.fullmatch(r"(\d{4})(?:[-/ ]?T?([1-4])T?)?", valor.strip().upper())
+    if not m:
+        raise FiltroInvalido(f"Período inválido: {valor!r} (use AAAA, AAAA-T ou AAAAT)")
+    ano, tri = m.groups()
+    return periodo_chave(ano, tri or ("4" if fim else "1"))
+
+class Filtros:
+    """Filtros da exportação já normalizados (UF, intervalo de Periodo, CNPJs)."""
+
+    def __init__(self, tabela="despesas", uf=None, de=None, ate=None, cnpj=None):
+        if tabela not in TABELAS:
+            raise FiltroInvalido(f"Tabela inválida: {tabela!r} (use {', '.join(TABELAS)})")
+        self.tabela = tabela
+        self.ufs = [u.upper() for u in _lista(uf)]
+        self.de, self.ate = _periodo(de, False), _periodo(ate, True)
+        self.cnpjs = [normalizar_cnpj(c) for c in _lista(cnpj)]
+        if tabela == "agregado" and (self.de or self.ate or self.cnpjs):
+            raise FiltroInvalido("A tabela agregado só aceita filtro por UF")
+
+    def verificar(self, colunas):
+        """FiltroInvalido se algum filtro pedido usa coluna que os dados não têm."""
+        necessarias = []
+        if self.ufs:
+            necessarias.append("UF")
+        if self.cnpjs:
+            necessarias.append("CNPJ")
+        if self.de is not None or self.ate is not None:
+            necessarias += ["Ano", "Trimestre"]
+        faltando = [c for c in necessarias if c not in colunas]
+        if faltando:
+            raise FiltroInvalido(f"Filtro indisponível: os dados não têm a coluna {', '.join(faltando)}")
+
+    def chave(self):
+        return repr((self.tabela, sorted(self.ufs), self.de, self.ate, sorted(self.cnpjs)))
+
+    def mascara(self, bloco):
+        """Máscara booleana do bloco (aceita colunas compactadas ou não)."""
+        mascara = pd.Series(True, index=bloco.index)
+        if self.ufs:
+            mascara &= bloco["UF"].isin(self.ufs)
+        if self.cnpjs:
+            if bloco.attrs.get("compacto", {}).get("CNPJ", {}).get("tipo") == "cnpj14":
+                mascara &= bloco["CNPJ"].isin([int(c) for c in self.cnpjs if c.isdigit()])
+            else:
+                mascara &= bloco["CNPJ"].isin(self.cnpjs)
+        if self.de is not None or self.ate is not None:
+            periodo = periodo_chave(bloco["Ano"], bloco["Trimestre"])
+            if self.de is not None:
+                mascara &= periodo >= self.de
+            if self.ate is not None:
+                mascara &= periodo <= self.ate
+        return mascara
+
+#
+# ORIGENS: ESTADO EM MEMÓRIA OU CURSOR DO BANCO
+#
+def blocos_memoria(df, filtros):
+    """Blocos filtrados e expandidos de um DataFrame do estado (sempre ao menos um).
+
+    Os filtros são conferidos aqui, antes do primeiro bloco: um erro ainda vira 400.
+    """
+    if not df.empty:
+        filtros.verificar(df.columns)
+    return _blocos_memoria(df, filtros)
+
+def _blocos_memoria(df, filtros):
+    if df.empty:
+        yield df
+        return
+    for inicio in range(0, len(df), LINHAS_POR_BLOCO):
+        bloco = df.iloc[inicio:inicio + LINHAS_POR_BLOCO]
+        selecionado = bloco[filtros.mascara(bloco).to_numpy()]
+        if len(selecionado) or inicio == 0:
+            yield expandir(selecionado)
+
+_SQL_EXPORT = {
+    "despesas": (
+        "SELECT d.CNPJ, COALESCE(d.RazaoSocial, 'DESCONHECIDO') AS RazaoSocial, d.Trimestre, d.Ano, "
+        "d.ValorDespesas, o.UF "
+        "FROM despesas_consolidadas d LEFT JOIN operadoras_ativas o ON o.CNPJ = d.CNPJ "
+        "{where} ORDER BY d.CNPJ, d.Periodo"
+    ),
+    "agregado": "SELECT * FROM despesas_agregadas {where} ORDER BY RazaoSocial, UF",
+}
+
+def _consulta(filtros):
+    condicoes, params, expansiveis = [], {}, []
+    prefixo = "o." if filtros.tabela == "despesas" else ""
+    if filtros.ufs:
+        condicoes.append(f"{prefixo}UF IN :ufs")
+        params["ufs"] = filtros.ufs
+        expansiveis.append("ufs")
+    if filtros.cnpjs:
+        condicoes.append("d.CNPJ IN :cnpjs")
+        params["cnpjs"] = filtros.cnpjs
+        expansiveis.append("cnpjs")
+    if filtros.de is not None:
+        condicoes.append("d.Periodo >= :de")
+        params["de"] = filtros.de
+    if filtros.ate is not None:
+        condicoes.append("d.Periodo <= :ate")
+        params["ate"] = filtros.ate
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+    consulta = text(_SQL_EXPORT[filtros.tabela].format(where=where))
+    if expansiveis:
+        consulta = consulta.bindparams(*(bindparam(n, expanding=True) for n in expansiveis))
+    return consulta, params
+
+def blocos_sql(engine, filtros):
+    """Blocos lidos de um cursor no servidor (sempre ao menos um)."""
+    consulta, params = _consulta(filtros)
+    with engine.connect() as conn:
+        resultado = conn.execution_options(stream_results=True, max_row_buffer=LINHAS_POR_BLOCO).execute(consulta, params)
+        colunas = list(resultado.keys())
+        primeiro = True
+        while True:
+            linhas = resultado.fetchmany(LINHAS_POR_BLOCO)
+            if not linhas and not primeiro:
+                break
+            bloco = pd.DataFrame.from_records(linhas, columns=colunas)
+            # DECIMAL do MySQL chega como Decimal; valores sempre float para o esquema não variar
+            for coluna in COLUNAS_NUMERICAS:
+                if coluna in bloco.columns:
+                    bloco[coluna] = pd.to_numeric(bloco[coluna]).astype("int64" if coluna == "Ano" else "float64")
+            yield bloco
+            primeiro = False
+            if not linhas:
+                break
+
+#
+# SERIALIZAÇÃO, COMPRESSÃO E RECORTE (Range)
+#
+def _csv(blocos):
+    for i, bloco in enumerate(blocos):
+        yield bloco.to_csv(index=False, header=i == 0).encode("utf-8")
+
+def _ndjson(blocos):
+    # Mesmo serializador das respostas da API (floats no repr mais curto)
+    for bloco in blocos:
+        if len(bloco):
+            yield b"\n".join(linhas_json(bloco)) + b"\n"
+
+def _esquema(esquema):
+    # Coluna só com nulos no primeiro bloco vira texto (os blocos seguintes são convertidos para ela)
+    return pa.schema([pa.field(c.name, pa.string()) if pa.types.is_null(c.type) else c for c in esquema])
+
+def _arrow(blocos):
+    sink = io.BytesIO()
+    escritor = esquema = None
+    for bloco in blocos:
+        tabela = pa.Table.from_pandas(bloco, preserve_index=False)
+        if escritor is None:
+            esquema = _esquema(tabela.schema)
+            escritor = pa.ipc.new_stream(sink, esquema)
+        escritor.write_table(tabela.cast(esquema))
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    if escritor is not None:
+        escritor.close()
+        yield sink.getvalue()
+
+def serializar(blocos, formato):
+    if formato == "arrow" and pa is None:
+        raise FiltroInvalido("Formato arrow requer pyarrow instalado")
+    return {"csv": _csv, "ndjson": _ndjson, "arrow": _arrow}[formato](blocos)
+
+def comprimir_fluxo(partes, codificacao):
+    """gzip/br em fluxo; mesmos bytes de entrada, mesmos bytes de saída."""
+    if codificacao is None:
+        yield from partes
+        return
+    if codificacao == "br":
+        compressor = brotli.Compressor(quality=NIVEL_BROTLI)
+        processar, terminar = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)
+        processar, terminar = compressor.compress, compressor.flush
+    for parte in partes:
+        saida = processar(parte)
+        if saida:
+            yield saida
+    yield terminar()
+
+def etag(versao, filtros, formato, codificacao):
+    chave = f"{versao}|{filtros.chave()}|{formato}|{codificacao}"
+    return f'"exp-{hashlib.sha1(chave.encode()).hexdigest()[:20]}"'
+
+def _arquivo_tamanho(etag_exportacao):
+    return os.path.join(EXPORT_DIR, f"{etag_exportacao.strip(chr(34))}.tamanho")
+
+def tamanho_conhecido(etag_exportacao):
+    """Total de bytes de uma exportação já concluída (neste ou em outro worker), ou None."""
+    with _lock_tamanhos:
+        if etag_exportacao in _tamanhos:
+            return _tamanhos[etag_exportacao]
+    try:
+        with open(_arquivo_tamanho(etag_exportacao), "r", encoding="utf-8") as f:
+            total = int(f.read())
+    except (OSError, ValueError):
+        return None
+    with _lock_tamanhos:
+        _tamanhos[etag_exportacao] = total
+    return total
+
+def _registrar_tamanho(etag_exportacao, total):
+    with _lock_tamanhos:
+        _tamanhos[etag_exportacao] = total
+        _tamanhos.move_to_end(etag_exportacao)
+        while len(_tamanhos) > MAX_TAMANHOS:
+            _tamanhos.popitem(last=False)
+    try:
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        caminho = _arquivo_tamanho(etag_exportacao)
+        tmp = f"{caminho}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(total))
+        os.replace(tmp, caminho)
+        _podar_tamanhos()
+    except OSError as e:
+        print(f"⚠️ Não foi possível registrar o tamanho da exportação: {e}")
+
+def _podar_tamanhos():
+    arquivos = [e for e in os.scandir(EXPORT_DIR) if e.name.endswith(".tamanho")]
+    if len(arquivos) <= MAX_TAMANHOS:
+        return
+    arquivos.sort(key=lambda e: e.stat().st_mtime)
+    for entrada in arquivos[:len(arquivos) - MAX_TAMANHOS]:
+        try:
+            os.remove(entrada.path)
+        except OSError:
+            pass
+
+def medir(partes, etag_exportacao):
+    """Total de bytes do fluxo, gerado sem envio (retomada antes de um download completo)."""
+    total = sum(len(parte) for parte in partes)
+    _registrar_tamanho(etag_exportacao, total)
+    return total
+
+def intervalo(cabecalho, total):
+    """'bytes=N-' / 'bytes=N-M' -> (inicio, fim) inclusivo; None se ausente/ilegível; 'fora' se além do fim."""
+    m = re.fullmatch(r"\s*bytes=(\d+)-(\d*)\s*", cabecalho or "")
+    if not m:
+        return None
+    inicio = int(m.group(1))
+    fim = min(int(m.group(2)), total - 1) if m.group(2) else total - 1
+    if inicio >= total or fim < inicio:
+        return "fora"
+    return inicio, fim
+
+def fluxo(partes, etag_exportacao, inicio=0, fim=None):
+    """Envia só os bytes [inicio, fim] e, numa exportação completa, registra o total."""
+    enviados = 0
+    for parte in partes:
+        comeco, enviados = enviados, enviados + len(parte)
+        if enviados <= inicio:
+            continue
+        if fim is not None and comeco > fim:
+            break
+        recorte = parte[max(inicio - comeco, 0):(fim + 1 - comeco) if fim is not None else None]
+        if recorte:
+            yield recorte
+    else:
+        if inicio == 0 and fim is None:
+            _registrar_tamanho(etag_exportacao, enviados)
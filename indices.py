@@ -0,0 +1,261 @@
+import re
+import hashlib
+import unicodedata
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from respostas import dumps, registros, linhas_json
+
+#
+# ÍNDICES EM MEMÓRIA DA API (montados uma vez, quando os dados são carregados)
+#
+
+#
+# CNPJ -> PAYLOADS JSON PRÉ-SERIALIZADOS
+#
+# Cada linha de df_despesas é serializada uma única vez (respostas.linhas_json) e as
+# respostas de /api/operadoras/{cnpj} e /api/operadoras/{cnpj}/despesas viram
+# apenas a junção das linhas do grupo: a consulta é um get() no dicionário.
+#
+NAO_ENCONTRADA = b'{"error":"Operadora n\\u00e3o encontrada"}'
+
+def construir_indice_cnpj(df):
+    """{CNPJ: (detalhe_json, despesas_json)} em bytes, na ordem original das linhas."""
+    if df.empty or "CNPJ" not in df.columns:
+        return {}
+    linhas = linhas_json(df)
+    chaves = df["CNPJ"].astype(str)
+    indice = {}
+    for cnpj, posicoes in chaves.groupby(chaves, sort=False).indices.items():
+        bloco = [linhas[p] for p in posicoes]
+        indice[cnpj] = (bloco[0], b"[" + b",".join(bloco) + b"]")
+    return indice
+
+def bytes_indice(indice):
+    """Bytes dos payloads do índice (dict local ou compartilhado.IndiceCompartilhado)."""
+    if hasattr(indice, "nbytes"):
+        return indice.nbytes
+    return sum(len(a) + len(b) for a, b in indice.values())
+
+def buscar_cnpj(indice, cnpj):
+    """Entrada do índice pelo CNPJ exato ou, em seguida, só pelos dígitos (aceita máscara)."""
+    entrada = indice.get(cnpj)
+    if entrada is None:
+        digitos = re.sub(r"\D", "", cnpj)
+        entrada = indice.get(digitos) or indice.get(digitos.zfill(14))
+    return entrada
+
+#
+# CATÁLOGO DE OPERADORAS PARA A BUSCA (/api/operadoras?search=)
+#
+# Operadoras deduplicadas uma vez, com nome normalizado (sem acento, minúsculo,
+# pontuação -> espaço) e índice de trigramas. Uma busca intersecta as listas dos
+# trigramas do termo e confirma cada candidato com comparação literal de
+# substring, sem regex. Termos com menos de 3 caracteres usam contains vetorizado.
+#
+def normalizar_texto(texto):
+    sem_acento = unicodedata.normalize("NFKD", str(texto))
+    sem_acento = "".join(c for c in sem_acento if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", sem_acento.casefold()).split())
+
+def normalizar_serie(serie):
+    """normalizar_texto() vetorizado para uma Series de nomes."""
+    return (
+        serie.astype(str)
+        .str.normalize("NFKD")
+        .str.encode("ascii", "ignore")
+        .str.decode("ascii")
+        .str.lower()
+        .str.replace(r"[^0-9a-z]+", " ", regex=True)
+        .str.strip()
+    )
+
+# Trigramas viram inteiros: cada caractere do texto normalizado ([0-9a-z ] e o
+# separador "|") tem um código de 1 a 38, e o trigrama é um número em base 39.
+_ALFABETO = "0123456789abcdefghijklmnopqrstuvwxyz |"
+_CODIGO = np.zeros(256, dtype=np.int64)
+_CODIGO[np.frombuffer(_ALFABETO.encode("ascii"), dtype=np.uint8)] = np.arange(1, len(_ALFABETO) + 1)
+_BASE = len(_ALFABETO) + 1
+
+def _codigos(texto):
+    return _CODIGO[np.frombuffer(texto.encode("ascii", "ignore"), dtype=np.uint8)]
+
+def _trigramas(texto):
+    c = _codigos(texto)
+    return set((c[:-2] * _BASE * _BASE + c[1:-1] * _BASE + c[2:]).tolist())
+
+def _indice_trigramas(textos):
+    """{trigrama: ids ordenados (int32)}, montado de uma vez sobre a matriz de caracteres."""
+    if len(textos) == 0:
+        return {}
+    largura = max(int(textos.str.len().max()), 3)
+    matriz = np.asarray(textos.str.encode("ascii", "ignore").tolist(), dtype=f"S{largura}")
+    c = _CODIGO[matriz.view(np.uint8).reshape(len(textos), largura)]
+    tri = c[:, :-2] * _BASE * _BASE + c[:, 1:-1] * _BASE + c[:, 2:]
+    # Posições que passam do fim do texto contêm o código 0 (preenchimento)
+    validos = (c[:, :-2] > 0) & (c[:, 1:-1] > 0) & (c[:, 2:] > 0)
+    ids = np.broadcast_to(np.arange(len(textos), dtype=np.int32)[:, None], tri.shape)[validos]
+    # 39³ < 2¹⁶: a ordenação estável de uint16 é radix sort e mantém os ids em ordem
+    tri = tri[validos].astype(np.uint16)
+    ordem = np.argsort(tri, kind="stable")
+    tri, ids = tri[ordem], ids[ordem]
+    # Remove repetições do mesmo trigrama no mesmo texto
+    manter = np.r_[True, (tri[1:] != tri[:-1]) | (ids[1:] != ids[:-1])]
+    tri, ids = tri[manter], ids[manter]
+    cortes = np.flatnonzero(np.diff(tri)) + 1
+    return dict(zip(tri[np.r_[0, cortes]].tolist(), np.split(ids, cortes)))
+
+class CatalogoOperadoras:
+    """Catálogo imutável de (CNPJ, RazaoSocial) com busca ranqueada e cache LRU."""
+
+    LIMITE_INTERSECAO = 256
+    LIMITE_PEQUENO = 512
+
+    def __init__(self, df, cache_consultas=1024):
+        if df.empty or not {"CNPJ", "RazaoSocial"} <= set(df.columns):
+            base = pd.DataFrame({"CNPJ": pd.Series(dtype=str), "RazaoSocial": pd.Series(dtype=str)})
+        else:
+            base = df[["CNPJ", "RazaoSocial"]].drop_duplicates().reset_index(drop=True)
+        self.registros = [
+            {"CNPJ": cnpj, "RazaoSocial": razao}
+            for cnpj, razao in zip(base["CNPJ"].tolist(), base["RazaoSocial"].tolist())
+        ]
+        # Texto pesquisável: nome normalizado + CNPJ (o separador não casa com nenhum termo)
+        self._nomes = normalizar_serie(base["RazaoSocial"].fillna(""))
+        self._cnpjs = base["CNPJ"].astype(str)
+        self._textos = self._nomes + "|" + self._cnpjs
+        # Cópias em listas para conjuntos pequenos (evita o custo fixo das operações vetorizadas)
+        self._lista_nomes = self._nomes.tolist()
+        self._lista_cnpjs = self._cnpjs.tolist()
+        self._postings = _indice_trigramas(self._textos)
+        self._buscar = lru_cache(maxsize=cache_consultas)(self._buscar_sem_cache)
+        self.pagina_json = lru_cache(maxsize=cache_consultas)(self._pagina_json)
+
+    def __len__(self):
+        return len(self.registros)
+
+    @staticmethod
+    def normalizar_consulta(termo):
+        termo = str(termo).strip()
+        # Termo com cara de CNPJ (dígitos e máscara) busca só pelos dígitos
+        if re.fullmatch(r"[\d./\-\s]+", termo):
+            return re.sub(r"\D", "", termo)
+        return normalizar_texto(termo)
+
+    def _candidatos(self, termo):
+        if len(termo) < 3:
+            return np.flatnonzero(self._textos.str.contains(termo, regex=False).to_numpy())
+        listas = []
+        for tri in _trigramas(termo):
+            ids = self._postings.get(tri)
+            if ids is None:
+                return np.empty(0, dtype=np.int32)
+            listas.append(ids)
+        listas.sort(key=len)
+        candidatos = listas[0]
+        for ids in listas[1:]:
+            if len(candidatos) <= self.LIMITE_INTERSECAO:
+                break
+            pos = np.searchsorted(ids, candidatos).clip(max=len(ids) - 1)
+            candidatos = candidatos[ids[pos] == candidatos]
+        # Só um termo de exatamente 3 caracteres é o próprio trigrama; "aaaa" também
+        # tem um único trigrama distinto, mas "aaa" não o contém
+        if len(termo) == 3:
+            return candidatos
+        # Confirmação literal (elimina falsos positivos da interseção de trigramas)
+        if len(candidatos) <= self.LIMITE_PEQUENO:
+            nomes, cnpjs = self._lista_nomes, self._lista_cnpjs
+            return np.asarray(
+                [i for i in candidatos.tolist() if termo in nomes[i] or termo in cnpjs[i]], dtype=np.int32
+            )
+        confirmados = self._textos.take(candidatos).str.contains(termo, regex=False).to_numpy()
+        return candidatos[confirmados]
+
+    def _posto(self, i, termo):
+        nome, cnpj = self._lista_nomes[i], self._lista_cnpjs[i]
+        if nome == termo or cnpj == termo:
+            return 0
+        if nome.startswith(termo) or cnpj.startswith(termo):
+            return 1
+        if f" {termo}" in nome:
+            return 2
+        return 3 if termo in nome else 4
+
+    def _buscar_sem_cache(self, termo):
+        ids = self._candidatos(termo)
+        if len(ids) == 0:
+            return ids
+        # Ranking: igual > prefixo > início de palavra > meio do nome > só no CNPJ
+        if len(ids) <= self.LIMITE_PEQUENO:
+            ranqueados = np.asarray(sorted(ids.tolist(), key=lambda i: (self._posto(i, termo), i)), dtype=np.int32)
+            ranqueados.flags.writeable = False
+            return ranqueados
+        nomes = self._nomes.take(ids)
+        cnpjs = self._cnpjs.take(ids)
+        posto = np.select(
+            [
+                ((nomes == termo) | (cnpjs == termo)).to_numpy(),
+                (nomes.str.startswith(termo) | cnpjs.str.startswith(termo)).to_numpy(),
+                nomes.str.contains(f" {termo}", regex=False).to_numpy(),
+                nomes.str.contains(termo, regex=False).to_numpy(),
+            ],
+            [0, 1, 2, 3],
+            default=4,
+        )
+        ranqueados = ids[np.lexsort((ids, posto))]
+        ranqueados.flags.writeable = False
+        return ranqueados
+
+    def buscar(self, termo):
+        """Índices dos registros que contêm `termo`, do mais ao menos relevante."""
+        termo = self.normalizar_consulta(termo)
+        return self._buscar(termo) if termo else np.empty(0, dtype=np.int32)
+
+    def pagina(self, termo, page, limit):
+        ids = self.buscar(termo) if termo else range(len(self.registros))
+        start = max((page - 1) * limit, 0)
+        return [self.registros[i] for i in ids[start:start + limit]], len(ids)
+
+    def _pagina_json(self, termo, page, limit):
+        # Resposta completa de /api/operadoras já em bytes; as páginas mais pedidas ficam no cache
+        data, total = self.pagina(termo, page, limit)
+        return dumps({"data": data, "total": total, "page": page, "limit": limit})
+
+#
+# ESTATÍSTICAS MATERIALIZADAS (/api/estatisticas)
+#
+# Calculadas uma vez por versão dos dados e servidas como bytes com ETag; o
+# cliente revalida com If-None-Match e recebe 304 enquanto a versão não mudar.
+#
+def construir_estatisticas(df_despesas, df_agregado, versao):
+    """(payload_json, etag) das estatísticas do dashboard para a versão `versao`."""
+    if df_despesas.empty:
+        estatisticas = {}
+    else:
+        valores = pd.to_numeric(df_despesas["ValorDespesas"], errors="coerce")
+        if df_agregado.empty:
+            top_5, por_uf = [], {}
+        else:
+            # NaN (ex.: desvio padrão de grupo com uma linha) vira null
+            top_5 = registros(df_agregado.head(5))
+            por_uf = {str(uf): float(v) for uf, v in df_agregado.groupby("UF")["TotalDespesas"].sum().items()}
+        estatisticas = {
+            "total_despesas": float(valores.sum()),
+            "media_despesas": float(valores.mean()),
+            "top_5_operadoras": top_5,
+            "distribuicao_uf": por_uf,
+        }
+    return serializar_estatisticas(estatisticas, versao)
+
+def serializar_estatisticas(estatisticas, versao):
+    payload = dumps(estatisticas)
+    etag = f'"{versao}-{hashlib.sha1(payload).hexdigest()[:12]}"'
+    return payload, etag
+
+def etag_confere(if_none_match, etag):
+    """Compara o cabeçalho If-None-Match (lista, W/ ou *) com o ETag atual."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(t.strip().removeprefix("W/") == etag for t in if_none_match.split(","))
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextlib
+from datetime import datetime
+
+#
+# MÉTRICAS POR ETAPA DO PIPELINE (teste1 / teste2)
+#
+# Cada etapa registra tempo de parede e de CPU do processo, linhas de entrada e
+# saída, bytes, pico de RSS durante a etapa (amostrado) e memória dos DataFrames
+# produzidos. Os registros vão para um arquivo JSON lines e, opcionalmente, para
+# a tabela etl_metricas no fim da execução.
+#
+# ETL_METRICAS_ARQUIVO  arquivo .jsonl (padrão metricas_etl.jsonl; vazio desliga)
+# ETL_METRICAS_BANCO    1 = grava também em etl_metricas
+# ETL_PERFIL            cprofile | tracemalloc (desligado por padrão)
+# ETL_PERFIL_ETAPAS     etapas perfiladas, separadas por vírgula (padrão: todas, menos "total")
+# ETL_PERFIL_DIR        onde ficam os .prof do cProfile
+#
+METRICAS_ARQUIVO = os.getenv("ETL_METRICAS_ARQUIVO", "metricas_etl.jsonl")
+METRICAS_BANCO = os.getenv("ETL_METRICAS_BANCO", "0").lower() in ("1", "true", "sim")
+PERFIL = os.getenv("ETL_PERFIL", "").lower()
+PERFIL_ETAPAS = {e.strip() for e in os.getenv("ETL_PERFIL_ETAPAS", "").split(",") if e.strip()}
+PERFIL_DIR = os.getenv("ETL_PERFIL_DIR", "perfis")
+# Intervalo de amostragem do RSS dentro de uma etapa
+AMOSTRA_RSS_S = float(os.getenv("ETL_METRICAS_AMOSTRA_S", "0.05"))
+
+_lock = threading.Lock()
+_execucao = {"id": None, "pipeline": None, "registros": []}
+_perfil_ativo = threading.Lock()
+
+def rss_bytes():
+    """RSS atual do processo (Linux); fora dele, o pico informado por getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def memoria_df(df):
+    """Memória de um DataFrame (deep) em bytes; 0 para o que não for DataFrame."""
+    try:
+        return int(df.memory_usage(deep=True).sum())
+    except AttributeError:
+        return 0
+
+class _AmostradorRSS(threading.Thread):
+    """Lê o RSS periodicamente enquanto a etapa roda e guarda o maior valor."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.pico = rss_bytes()
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(AMOSTRA_RSS_S):
+            self.pico = max(self.pico, rss_bytes())
+
+    def encerrar(self):
+        self._parar.set()
+        self.join()
+        self.pico = max(self.pico, rss_bytes())
+        return self.pico
+
+class Etapa:
+    """Registro de uma etapa em andamento; o código medido preenche linhas/bytes."""
+
+    def __init__(self, nome, linhas_entrada=None, detalhe=None):
+        self.nome = nome
+        self.linhas_entrada = linhas_entrada
+        self.linhas_saida = None
+        self.bytes = None
+        self.memoria_df = None
+        self.detalhe = detalhe
+        self.extra = {}
+
+    def saida(self, df):
+        """Marca `df` como resultado da etapa (linhas de saída e memória do DataFrame)."""
+        if df is not None:
+            self.linhas_saida = len(df)
+            self.memoria_df = (self.memoria_df or 0) + memoria_df(df)
+        return df
+
+def _perfilar(nome):
+    if PERFIL not in ("cprofile", "tracemalloc"):
+        return False
+    # "total" só se pedido explicitamente; senão as etapas internas ficariam sem perfil
+    if (PERFIL_ETAPAS or nome == "total") and nome not in PERFIL_ETAPAS:
+        return False
+    # Um perfilador por vez e só na thread principal (downloads rodam em threads)
+    return threading.current_thread() is threading.main_thread()
+
+@contextlib.contextmanager
+def _perfil(nome, etapa):
+    if not _perfilar(nome) or not _perfil_ativo.acquire(blocking=False):
+        yield
+        return
+    try:
+        if PERFIL == "cprofile":
+            import cProfile
+            perfil = cProfile.Profile()
+            perfil.enable()
+            try:
+                yield
+            finally:
+                perfil.disable()
+                os.makedirs(PERFIL_DIR, exist_ok=True)
+                caminho = os.path.join(PERFIL_DIR, f"{_execucao['id'] or 'avulsa'}-{nome}.prof")
+                perfil.dump_stats(caminho)
+                etapa.extra["perfil"] = caminho
+        else:
+            import tracemalloc
+            tracemalloc.start()
+            try:
+                yield
+            finally:
+                _, pico = tracemalloc.get_traced_memory()
+                maiores = tracemalloc.take_snapshot().statistics("lineno")[:10]
+                tracemalloc.stop()
+                etapa.extra["tracemalloc_pico_mb"] = round(pico / 1024 / 1024, 2)
+                etapa.extra["alocacoes"] = [f"{s.traceback} {s.size / 1024 / 1024:.2f} MB" for s in maiores]
+    finally:
+        _perfil_ativo.release()
+
+def _gravar(registro):
+    with _lock:
+        _execucao["registros"].append(registro)
+        if METRICAS_ARQUIVO:
+            with open(METRICAS_ARQUIVO, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False, default=str) + "\n")
+
+@contextlib.contextmanager
+def etapa(nome, linhas_entrada=None, detalhe=None):
+    """Mede o bloco como uma etapa: `with etapa("agregacao", len(df)) as e: e.saida(resultado)`."""
+    e = Etapa(nome, linhas_entrada, detalhe)
+    amostrador = _AmostradorRSS()
+    amostrador.start()
+    rss_inicio = amostrador.pico
+    inicio, cpu_inicio = time.perf_counter(), time.process_time()
+    iniciado_em = datetime.now().isoformat(timespec="seconds")
+    erro = None
+    try:
+        with _perfil(nome, e):
+            yield e
+    except BaseException as ex:
+        erro = f"{type(ex).__name__}: {ex}"
+        raise
+    finally:
+        wall, cpu = time.perf_counter() - inicio, time.process_time() - cpu_inicio
+        pico = amostrador.encerrar()
+        registro = {
+            "execucao": _execucao["id"],
+            "pipeline": _execucao["pipeline"],
+            "etapa": nome,
+            "detalhe": e.detalhe,
+            "inicio": iniciado_em,
+            "wall_s": round(wall, 4),
+            # CPU do processo inteiro (inclui threads de download e do pyarrow)
+            "cpu_s": round(cpu, 4),
+            "linhas_entrada": e.linhas_entrada,
+            "linhas_saida": e.linhas_saida,
+            "bytes": e.bytes,
+            "rss_inicio_mb": round(rss_inicio / 1024 / 1024, 1),
+            "rss_pico_mb": round(pico / 1024 / 1024, 1),
+            "memoria_df_mb": None if e.memoria_df is None else round(e.memoria_df / 1024 / 1024, 2),
+            "erro": erro,
+            **e.extra,
+        }
+        _gravar(registro)
+
+def _gravar_no_banco(registros):
+    import pandas as pd
+    from database import get_engine, carregar_em_massa
+    colunas = {
+        "execucao": "Execucao", "pipeline": "Pipeline", "etapa": "Etapa", "detalhe": "Detalhe",
+        "inicio": "Inicio", "wall_s": "WallS", "cpu_s": "CpuS", "linhas_entrada": "LinhasEntrada",
+        "linhas_saida": "LinhasSaida", "bytes": "Bytes", "rss_pico_mb": "RssPicoMB",
+        "memoria_df_mb": "MemoriaDfMB", "erro": "Erro",
+    }
+    df = pd.DataFrame(registros)[list(colunas)].rename(columns=colunas)
+    carregar_em_massa(df, "etl_metricas", get_engine(), relatorio=False)
+
+def resumo(registros):
+    """Tabela de texto com uma linha por etapa (impressa no fim da execução)."""
+    linhas = [f"{'Etapa':<28} {'wall(s)':>9} {'cpu(s)':>9} {'entrada':>11} {'saída':>11} {'pico RSS(MB)':>13}"]
+    for r in registros:
+        nome = r["etapa"] + (f" [{r['detalhe']}]" if r.get("detalhe") else "")
+        fmt = lambda v: "-" if v is None else f"{v:,}"
+        linhas.append(f"{nome[:28]:<28} {r['wall_s']:>9.2f} {r['cpu_s']:>9.2f} {fmt(r['linhas_entrada']):>11} "
+                      f"{fmt(r['linhas_saida']):>11} {r['rss_pico_mb']:>13.1f}")
+    return "\n".join(linhas)
+
+@contextlib.contextmanager
+def execucao(pipeline):
+    """Agrupa as etapas de uma execução (id único) e imprime/grava o resumo ao final."""
+    _execucao.update(id=f"{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}", pipeline=pipeline, registros=[])
+    try:
+        with etapa("total"):
+            yield _execucao["id"]
+    finally:
+        registros = list(_execucao["registros"])
+        print(f"\n📈 Métricas da execução {_execucao['id']} ({pipeline}):\n{resumo(registros)}")
+        if METRICAS_BANCO:
+            try:
+                _gravar_no_banco(registros)
+            except Exception as e:
+                print(f"⚠️ Não foi possível gravar as métricas no banco: {e}")
+        _execucao.update(id=None, pipeline=None, registros=[])
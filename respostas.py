@@ -0,0 +1,116 @@
+import os
+import gzip
+import json
+import math
+from functools import lru_cache
+import numpy as np
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#
+# SERIALIZAÇÃO E COMPRESSÃO DAS RESPOSTAS DA API
+#
+# Os endpoints devolvem bytes prontos: o JSON é gerado uma vez (orjson quando
+# instalado; json da stdlib como alternativa), sem passar pelo jsonable_encoder
+# do FastAPI. Corpos acima de API_COMPRESSAO_MIN bytes saem com br ou gzip,
+# conforme o Accept-Encoding do cliente. Como os payloads pré-serializados
+# (índice por CNPJ, páginas do catálogo, estatísticas) são sempre os mesmos
+# objetos bytes, a versão comprimida de cada um fica num cache LRU.
+#
+# API_COMPRESSAO_MIN     tamanho mínimo do corpo para comprimir (padrão 1024; 0 desliga)
+# API_COMPRESSAO_NIVEL   nível do gzip (padrão 6)
+# API_COMPRESSAO_CACHE   quantos corpos comprimidos manter em cache (padrão 4096)
+#
+COMPRESSAO_MIN = int(os.getenv("API_COMPRESSAO_MIN", "1024"))
+NIVEL_GZIP = int(os.getenv("API_COMPRESSAO_NIVEL", "6"))
+# Qualidade 4 do brotli comprime melhor que gzip -6 com custo de CPU parecido
+NIVEL_BROTLI = 4
+CACHE_COMPRESSAO = int(os.getenv("API_COMPRESSAO_CACHE", "4096"))
+
+def _nativo(valor):
+    # Só para o json da stdlib: escalares NumPy e NaN/inf viram tipos JSON
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return None
+    return valor
+
+def _limpar(obj):
+    if isinstance(obj, dict):
+        return {str(k): _limpar(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_limpar(v) for v in obj]
+    return _nativo(obj)
+
+def dumps(obj):
+    """JSON compacto em UTF-8 (bytes); escalares NumPy aceitos e NaN como null."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(_limpar(obj), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def registros(df):
+    """Linhas de `df` como dicts de tipos nativos (NaN/NA -> None), como o to_dict do baseline."""
+    colunas = [str(c) for c in df.columns]
+    valores = []
+    for coluna in df.columns:
+        serie = df[coluna]
+        if serie.isna().any():
+            serie = serie.astype(object).where(serie.notna(), None)
+        valores.append(serie.tolist())
+    return [dict(zip(colunas, linha)) for linha in zip(*valores)]
+
+def linhas_json(df):
+    """Uma linha JSON (bytes) por linha de `df`; floats no repr mais curto (228829771.73, não ...7299999)."""
+    return [dumps(registro) for registro in registros(df)]
+
+def escolher_codificacao(accept_encoding):
+    """"br", "gzip" ou None conforme o Accept-Encoding (respeita q=0)."""
+    aceitas = {}
+    for parte in (accept_encoding or "").lower().split(","):
+        nome, _, parametros = parte.strip().partition(";")
+        q = 1.0
+        if parametros.strip().startswith("q="):
+            try:
+                q = float(parametros.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if nome:
+            aceitas[nome] = q
+    for codificacao in ("br", "gzip"):
+        if codificacao == "br" and brotli is None:
+            continue
+        if aceitas.get(codificacao, aceitas.get("*", 0.0)) > 0:
+            return codificacao
+    return None
+
+def comprimir(corpo, codificacao):
+    if codificacao == "br":
+        return brotli.compress(corpo, quality=NIVEL_BROTLI)
+    # mtime=0: mesma entrada, mesmos bytes
+    return gzip.compress(corpo, compresslevel=NIVEL_GZIP, mtime=0)
+
+# Só para payloads pré-serializados (o hash de um bytes é calculado uma vez e guardado)
+_comprimir_em_cache = lru_cache(maxsize=CACHE_COMPRESSAO)(comprimir)
+
+def resposta_json(corpo, request=None, status_code=200, headers=None):
+    """Response com JSON em bytes (ou objeto a serializar), comprimida quando compensa."""
+    pronto = isinstance(corpo, bytes)
+    if not pronto:
+        corpo = dumps(corpo)
+    headers = dict(headers or {})
+    if COMPRESSAO_MIN and len(corpo) >= COMPRESSAO_MIN:
+        headers["Vary"] = "Accept-Encoding"
+        codificacao = escolher_codificacao(request.headers.get("accept-encoding")) if request else None
+        if codificacao:
+            corpo = (_comprimir_em_cache if pronto else comprimir)(corpo, codificacao)
+            headers["Content-Encoding"] = codificacao
+    return Response(corpo, status_code=status_code, media_type="application/json", headers=headers)
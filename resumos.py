@@ -0,0 +1,156 @@
+import sys
+import time
+from sqlalchemy import text
+from database import get_engine
+
+#
+# RESUMOS DAS CONSULTAS ANALÍTICAS (teste3.sql)
+#
+# As consultas usam a coluna Periodo (Ano*10 + trimestre, ex.: 20243) no lugar de
+# CONCAT(Ano, Trimestre): o join por (CNPJ, Periodo) e o MIN/MAX por CNPJ saem do
+# índice idx_consolidadas_cnpj_periodo. O ETL grava o resultado completo de cada
+# consulta em tabelas resumo_*, e o relatório vira um SELECT com ORDER BY/LIMIT.
+#
+# Uso: python resumos.py [repeticoes]  -> tempos e planos de execução de cada consulta
+#
+
+# Query 1: crescimento entre o primeiro e o último trimestre de cada operadora
+SQL_CRESCIMENTO = """
+WITH Extremos AS (
+    SELECT CNPJ, MIN(Periodo) AS PeriodoInicial, MAX(Periodo) AS PeriodoFinal
+    FROM despesas_consolidadas
+    GROUP BY CNPJ
+)
+SELECT
+    e.CNPJ,
+    d2.RazaoSocial,
+    e.PeriodoInicial,
+    e.PeriodoFinal,
+    d1.ValorDespesas AS ValorInicial,
+    d2.ValorDespesas AS ValorFinal,
+    ((d2.ValorDespesas - d1.ValorDespesas) / d1.ValorDespesas) * 100 AS CrescimentoPercentual
+FROM Extremos e
+JOIN despesas_consolidadas d1 ON d1.CNPJ = e.CNPJ AND d1.Periodo = e.PeriodoInicial
+JOIN despesas_consolidadas d2 ON d2.CNPJ = e.CNPJ AND d2.Periodo = e.PeriodoFinal
+WHERE d1.ValorDespesas > 0
+"""
+
+# Query 2: distribuição de despesas por UF
+SQL_UF = """
+SELECT
+    o.UF,
+    SUM(d.ValorDespesas) AS TotalDespesas,
+    AVG(d.ValorDespesas) AS MediaPorOperadora
+FROM despesas_consolidadas d
+JOIN operadoras_ativas o ON d.CNPJ = o.CNPJ
+WHERE o.UF IS NOT NULL
+GROUP BY o.UF
+"""
+
+# Query 3: trimestres acima da média geral, por operadora (a média é calculada uma vez)
+SQL_ACIMA_MEDIA = """
+SELECT CNPJ, COUNT(*) AS TrimestresAcima
+FROM despesas_consolidadas
+WHERE ValorDespesas > (SELECT AVG(ValorDespesas) FROM despesas_consolidadas)
+GROUP BY CNPJ
+"""
+
+RESUMOS = {
+    "resumo_crescimento": (
+        "CNPJ, RazaoSocial, PeriodoInicial, PeriodoFinal, ValorInicial, ValorFinal, CrescimentoPercentual",
+        SQL_CRESCIMENTO,
+    ),
+    "resumo_uf": ("UF, TotalDespesas, MediaPorOperadora", SQL_UF),
+    "resumo_acima_media": ("CNPJ, TrimestresAcima", SQL_ACIMA_MEDIA),
+}
+
+# Relatórios do teste3.sql lidos das tabelas de resumo
+RELATORIOS = {
+    "crescimento": "SELECT * FROM resumo_crescimento ORDER BY CrescimentoPercentual DESC LIMIT 5",
+    "uf": "SELECT * FROM resumo_uf ORDER BY TotalDespesas DESC LIMIT 5",
+    "acima_media": "SELECT * FROM resumo_acima_media WHERE TrimestresAcima >= 2",
+}
+
+def atualizar_resumos(engine=None):
+    """Recalcula as tabelas resumo_* numa única transação (leitores veem a versão antiga ou a nova)."""
+    engine = engine or get_engine()
+    inicio = time.perf_counter()
+    linhas = {}
+    with engine.begin() as conn:
+        for tabela, (colunas, consulta) in RESUMOS.items():
+            conn.execute(text(f"DELETE FROM {tabela}"))
+            linhas[tabela] = conn.execute(text(f"INSERT INTO {tabela} ({colunas}) {consulta}")).rowcount
+    print(f"📊 Resumos atualizados em {time.perf_counter() - inicio:.2f}s "
+          + ", ".join(f"{t}={n}" for t, n in linhas.items()))
+    return linhas
+
+#
+# EXECUTOR: TEMPOS E PLANOS (SQLite e MySQL)
+#
+def _crescimento_legado(dialeto):
+    # Versão original (join por texto concatenado); SQLite < 3.44 não tem CONCAT()
+    periodo = "{t}.Ano || {t}.Trimestre" if dialeto == "sqlite" else "CONCAT({t}.Ano, {t}.Trimestre)"
+    return f"""
+WITH TrimestresExtremos AS (
+    SELECT d.CNPJ, d.RazaoSocial, MIN({periodo.format(t='d')}) AS PrimeiroTri, MAX({periodo.format(t='d')}) AS UltimoTri
+    FROM despesas_consolidadas d
+    GROUP BY d.CNPJ, d.RazaoSocial
+)
+SELECT te.CNPJ, te.RazaoSocial, d1.ValorDespesas AS ValorInicial, d2.ValorDespesas AS ValorFinal,
+       ((d2.ValorDespesas - d1.ValorDespesas) / d1.ValorDespesas) * 100 AS CrescimentoPercentual
+FROM TrimestresExtremos te
+JOIN despesas_consolidadas d1 ON te.CNPJ = d1.CNPJ AND te.PrimeiroTri = {periodo.format(t='d1')}
+JOIN despesas_consolidadas d2 ON te.CNPJ = d2.CNPJ AND te.UltimoTri = {periodo.format(t='d2')}
+WHERE d1.ValorDespesas > 0
+ORDER BY CrescimentoPercentual DESC
+LIMIT 5
+"""
+
+def consultas(dialeto):
+    """{nome: sql} na ordem do relatório: original, com Periodo e lida do resumo."""
+    return {
+        "q1_legado_concat": _crescimento_legado(dialeto),
+        "q1_periodo": SQL_CRESCIMENTO + "ORDER BY CrescimentoPercentual DESC\nLIMIT 5",
+        "q1_resumo": RELATORIOS["crescimento"],
+        "q2_join": SQL_UF + "ORDER BY TotalDespesas DESC\nLIMIT 5",
+        "q2_resumo": RELATORIOS["uf"],
+        "q3_subconsulta": SQL_ACIMA_MEDIA + "HAVING COUNT(*) >= 2",
+        "q3_resumo": RELATORIOS["acima_media"],
+    }
+
+def plano(conn, dialeto, consulta):
+    prefixo = "EXPLAIN QUERY PLAN " if dialeto == "sqlite" else "EXPLAIN "
+    linhas = conn.execute(text(prefixo + consulta)).fetchall()
+    if dialeto == "sqlite":
+        # (id, parent, notused, detail): só o texto do passo interessa
+        return [str(l[-1]) for l in linhas]
+    return [" | ".join("" if v is None else str(v) for v in l) for l in linhas]
+
+def executar_relatorio(engine=None, repeticoes=3):
+    """Executa cada consulta `repeticoes` vezes; retorna [{consulta, melhor_s, linhas, plano}]."""
+    engine = engine or get_engine()
+    dialeto = engine.dialect.name
+    resultados = []
+    with engine.connect() as conn:
+        for nome, consulta in consultas(dialeto).items():
+            tempos = []
+            for _ in range(max(repeticoes, 1)):
+                inicio = time.perf_counter()
+                linhas = conn.execute(text(consulta)).fetchall()
+                tempos.append(time.perf_counter() - inicio)
+            resultados.append({
+                "consulta": nome,
+                "melhor_s": min(tempos),
+                "linhas": len(linhas),
+                "plano": plano(conn, dialeto, consulta),
+            })
+    return resultados
+
+if __name__ == "__main__":
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    engine = get_engine()
+    print(f"Banco: {engine.dialect.name} ({repeticoes} execuções por consulta)\n")
+    for r in executar_relatorio(engine, repeticoes):
+        print(f"⏱️ {r['consulta']:<18} {r['melhor_s'] * 1000:10.2f} ms  {r['linhas']:>6} linhas")
+        for passo in r["plano"]:
+            print(f"      {passo}")
@@ -1,6 +1,11 @@
 import pymysql
 import os
-from database import DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_NAME
+
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = os.getenv("DB_PORT", "3306")
+DB_NAME = os.getenv("DB_NAME")
 
 def create_database():
     print(f"🔌 Conectando ao MySQL em {DB_HOST}...")
@@ -23,48 +28,12 @@ def create_database():
         print("⚠️ Verifique se o MySQL está rodando e as credenciais em database.py estão corretas.")
 
 def create_tables():
-    from database import get_engine
-    from sqlalchemy import text
+    from database import get_engine, criar_tabelas
     
     try:
-        engine = get_engine()
-        
-        # DDL baseado no teste3.sql
-        ddl_commands = [
-            """
-            CREATE TABLE IF NOT EXISTS despesas_consolidadas (
-                CNPJ VARCHAR(14),
-                RazaoSocial VARCHAR(255),
-                Trimestre VARCHAR(2),
-                Ano INTEGER,
-                ValorDespesas DECIMAL(18, 2),
-                PRIMARY KEY (CNPJ, Trimestre, Ano)
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS operadoras_ativas (
-                CNPJ VARCHAR(14) PRIMARY KEY,
-                RegistroANS VARCHAR(20),
-                Modalidade VARCHAR(100),
-                UF CHAR(2)
-            )
-            """,
-            """
-            CREATE TABLE IF NOT EXISTS despesas_agregadas (
-                RazaoSocial VARCHAR(255),
-                UF CHAR(2),
-                TotalDespesas DECIMAL(18, 2),
-                MediaDespesas DECIMAL(18, 2),
-                DesvioPadraoDespesas DECIMAL(18, 2)
-            )
-            """
-        ]
-        
+        # DDL baseado no teste3.sql (definido em database.DDL_TABELAS)
         print("🏗️ Criando tabelas...")
-        with engine.connect() as conn:
-            for ddl in ddl_commands:
-                conn.execute(text(ddl))
-                conn.commit()
+        criar_tabelas(get_engine())
         print("✅ Tabelas criadas com sucesso.")
     except Exception as e:
         print(f"❌ Erro ao criar tabelas: {e}")
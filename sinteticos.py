@@ -0,0 +1,237 @@
+import io
+import os
+import csv
+import sys
+import json
+import time
+import zipfile
+import numpy as np
+import pandas as pd
+
+#
+# GERADOR DETERMINÍSTICO DE DADOS NO FORMATO DA ANS
+#
+# Produz ZIPs trimestrais iguais aos das demonstrações contábeis (membro CSV com
+# REG_ANS e um membro XLSX com CNPJ; CD_CONTA_CONTABIL, DESCRICAO e VL_SALDO_FINAL
+# em número brasileiro) e um Relatorio_cadop.csv coerente com eles. Mesma
+# semente e mesmos parâmetros -> mesmo conteúdo, em qualquer máquina.
+#
+# Layout: <destino>/<ano>/<N>T<ano>.zip + <destino>/Relatorio_cadop.csv + <destino>/manifesto.json
+#
+# Uso: python sinteticos.py [escala|linhas] [destino]   (escalas: 100k, 1m, 10m, 100m)
+#
+ESCALAS = {"100k": 100_000, "1m": 1_000_000, "10m": 10_000_000, "100m": 100_000_000}
+SEMENTE = 42
+LINHAS_POR_BLOCO = 500_000
+XLSX_MAX_LINHAS = 20_000
+# Data fixa nos membros do ZIP (ZipFile usaria o relógio)
+DATA_ZIP = (2024, 1, 1, 0, 0, 0)
+
+# Plano de contas resumido; as classes 4 (despesas) são as que o ETL aproveita
+CONTAS = [
+    ("411111", "EVENTOS CONHECIDOS OU AVISADOS DE ASSISTÊNCIA A SAÚDE MEDICO HOSPITALAR"),
+    ("411121", "EVENTOS CONHECIDOS OU AVISADOS - CONSULTAS MÉDICAS"),
+    ("411211", "EVENTOS CONHECIDOS OU AVISADOS - EXAMES"),
+    ("41", "EVENTOS INDENIZÁVEIS LÍQUIDOS / SINISTROS RETIDOS"),
+    ("4111", "EVENTOS/ SINISTROS CONHECIDOS OU AVISADOS"),
+    ("46", "DESPESAS ADMINISTRATIVAS"),
+    ("31", "CONTRAPRESTAÇÕES EFETIVAS DE PLANO DE ASSISTÊNCIA À SAÚDE"),
+    ("311", "RECEITAS COM OPERAÇÕES DE ASSISTÊNCIA À SAÚDE"),
+    ("12", "APLICAÇÕES FINANCEIRAS"),
+    ("121", "APLICAÇÕES GARANTIDORAS DE PROVISÕES TÉCNICAS"),
+    ("21", "PROVISÕES TÉCNICAS DE OPERAÇÕES DE ASSISTÊNCIA À SAÚDE"),
+    ("23", "PATRIMÔNIO LÍQUIDO"),
+]
+PESOS_CONTAS = np.array([0.14, 0.10, 0.08, 0.06, 0.06, 0.06, 0.12, 0.10, 0.08, 0.06, 0.08, 0.06])
+
+UFS = ["SP", "RJ", "MG", "RS", "PR", "SC", "BA", "PE", "GO", "DF", "CE", "ES", "PA", "MT", "MS", "AM"]
+PESOS_UFS = np.array([0.30, 0.12, 0.12, 0.07, 0.07, 0.05, 0.05, 0.04, 0.03, 0.03, 0.03, 0.02, 0.02, 0.02, 0.02, 0.01])
+MODALIDADES = ["Medicina de Grupo", "Cooperativa Médica", "Odontologia de Grupo", "Seguradora Especializada em Saúde",
+               "Autogestão", "Cooperativa Odontológica", "Filantropia"]
+NOMES = ["SAÚDE", "ASSISTÊNCIA MÉDICA", "UNIMED", "ODONTO", "BENEFICÊNCIA", "CLÍNICA", "PLANO", "VIDA"]
+CIDADES = ["SÃO PAULO", "RIO DE JANEIRO", "BELO HORIZONTE", "PORTO ALEGRE", "CURITIBA", "SALVADOR", "RECIFE", "GOIÂNIA"]
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = pc = pa_csv = None
+
+_PESOS1 = np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], dtype=np.int64)
+_PESOS2 = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], dtype=np.int64)
+
+def linhas_da_escala(escala):
+    """'1m' -> 1_000_000; aceita também um número de linhas."""
+    escala = str(escala).lower().replace("_", "")
+    return ESCALAS[escala] if escala in ESCALAS else int(float(escala))
+
+def gerar_cnpjs(rng, n, invalidos=0.0):
+    """n CNPJs distintos com dígitos verificadores corretos; uma fração `invalidos` tem o DV trocado."""
+    raizes = rng.choice(10**8, size=n, replace=False)
+    dig = np.zeros((n, 14), dtype=np.int64)
+    for i in range(8):
+        dig[:, 7 - i] = (raizes // 10**i) % 10
+    dig[:, 11] = 1  # filial 0001
+    resto1 = (dig[:, :12] @ _PESOS1) % 11
+    dig[:, 12] = np.where(resto1 < 2, 0, 11 - resto1)
+    resto2 = (dig[:, :13] @ _PESOS2) % 11
+    dig[:, 13] = np.where(resto2 < 2, 0, 11 - resto2)
+    errados = rng.random(n) < invalidos
+    dig[errados, 13] = (dig[errados, 13] + 1) % 10
+    return ["".join(map(str, d)) for d in dig.tolist()]
+
+def operadoras(n, semente=SEMENTE):
+    """Cadastro sintético: Registro_ANS, CNPJ, RazaoSocial, Modalidade, UF e se está no Cadop."""
+    rng = np.random.default_rng([semente, 0])
+    registros = 300_000 + rng.choice(200_000, size=n, replace=False)
+    nomes = rng.choice(len(NOMES), size=(n, 2))
+    return pd.DataFrame({
+        "Registro_ANS": np.sort(registros),
+        "CNPJ": gerar_cnpjs(rng, n, invalidos=0.01),
+        "RazaoSocial": [f"{NOMES[a]} {NOMES[b]} {i:05d} LTDA" for i, (a, b) in enumerate(nomes.tolist())],
+        "Modalidade": rng.choice(MODALIDADES, size=n),
+        "UF": rng.choice(UFS, size=n, p=PESOS_UFS / PESOS_UFS.sum()),
+        # Parte das operadoras dos arquivos contábeis já não está ativa (fora do Cadop)
+        "Ativa": rng.random(n) >= 0.03,
+        # Porte: poucas operadoras grandes concentram a maioria das linhas
+        "Peso": rng.lognormal(0, 1.2, size=n),
+    })
+
+def formatar_valor_br(centavos):
+    """Centavos (int) -> '1234,56' / '-1234,56', como nos CSVs da ANS."""
+    absoluto = np.abs(centavos)
+    if pc is not None:
+        reais = pc.binary_join_element_wise(
+            pc.if_else(pa.array(centavos < 0), "-", ""), pc.cast(pa.array(absoluto // 100), pa.string()), ""
+        )
+        cents = pc.utf8_lpad(pc.cast(pa.array(absoluto % 100), pa.string()), 2, "0")
+        return pc.binary_join_element_wise(reais, cents, ",")
+    reais = pd.Series(absoluto // 100).astype(str)
+    cents = pd.Series(absoluto % 100).astype(str).str.zfill(2)
+    sinal = pd.Series(np.where(centavos < 0, "-", ""))
+    return (sinal + reais + "," + cents).to_numpy()
+
+def _escolher(valores, indices):
+    if pa is not None:
+        return pa.array(list(valores), pa.string()).take(pa.array(indices))
+    return np.asarray(list(valores), dtype=object)[indices]
+
+def _bloco(rng, ops, n, ano, tri, identificador):
+    """Colunas de `n` linhas do balancete ({nome: array}), na ordem dos arquivos da ANS."""
+    probs = ops["Peso"].to_numpy() / ops["Peso"].sum()
+    quem = rng.choice(len(ops), size=n, p=probs)
+    contas = rng.choice(len(CONTAS), size=n, p=PESOS_CONTAS / PESOS_CONTAS.sum())
+    saldo_final = np.round(rng.lognormal(11, 2.2, size=n) * 100).astype(np.int64)
+    # Alguns saldos negativos (estornos), como nos arquivos reais
+    saldo_final[rng.random(n) < 0.02] *= -1
+    saldo_inicial = np.round(saldo_final * rng.uniform(0.2, 1.0, size=n)).astype(np.int64)
+    mes = (int(tri[0]) - 1) * 3 + 1
+    ids = ops["CNPJ"] if identificador == "CNPJ" else ops["Registro_ANS"].astype(str)
+    return {
+        "DATA": _escolher([f"{ano}-{mes:02d}-01"], np.zeros(n, dtype=np.int64)),
+        identificador: _escolher(ids.tolist(), quem),
+        "CD_CONTA_CONTABIL": _escolher([c for c, _ in CONTAS], contas),
+        "DESCRICAO": _escolher([d for _, d in CONTAS], contas),
+        "VL_SALDO_INICIAL": formatar_valor_br(saldo_inicial),
+        "VL_SALDO_FINAL": formatar_valor_br(saldo_final),
+    }
+
+def _csv(colunas, cabecalho):
+    """Bloco em CSV com ';' e todos os campos entre aspas (UTF-8)."""
+    if pa is not None:
+        buffer = io.BytesIO()
+        pa_csv.write_csv(pa.table(colunas), buffer,
+                         pa_csv.WriteOptions(include_header=cabecalho, delimiter=";", quoting_style="all_valid"))
+        return buffer.getvalue()
+    df = pd.DataFrame(colunas)
+    return df.to_csv(sep=";", index=False, header=cabecalho, quoting=csv.QUOTE_ALL).encode("utf-8")
+
+def _xlsx(colunas):
+    df = pd.DataFrame({nome: (v.to_pylist() if pa is not None and isinstance(v, pa.Array) else v)
+                       for nome, v in colunas.items()})
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False, engine="openpyxl")
+    return buffer.getvalue()
+
+def gerar_zip(caminho, ops, ano, tri, linhas, semente=SEMENTE, xlsx=True):
+    """Um ZIP trimestral: CSV (REG_ANS) com `linhas` linhas, menos as que vão para o XLSX (CNPJ)."""
+    rng = np.random.default_rng([semente, int(ano), int(tri[0])])
+    linhas_xlsx = min(XLSX_MAX_LINHAS, linhas // 50) if xlsx else 0
+    linhas_csv = linhas - linhas_xlsx
+    nome = f"{tri}{ano}"
+    tmp = f"{caminho}.tmp"
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf:
+        info = zipfile.ZipInfo(f"{nome}.csv", date_time=DATA_ZIP)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with zf.open(info, "w", force_zip64=True) as membro:
+            for inicio in range(0, linhas_csv, LINHAS_POR_BLOCO):
+                n = min(LINHAS_POR_BLOCO, linhas_csv - inicio)
+                membro.write(_csv(_bloco(rng, ops, n, ano, tri, "REG_ANS"), cabecalho=inicio == 0))
+        if linhas_xlsx:
+            info = zipfile.ZipInfo(f"{nome}_complementar.xlsx", date_time=DATA_ZIP)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            zf.writestr(info, _xlsx(_bloco(rng, ops, linhas_xlsx, ano, tri, "CNPJ")))
+    os.replace(tmp, caminho)
+    return {"ano": int(ano), "trimestre": tri, "arquivo": os.path.relpath(caminho, os.path.dirname(os.path.dirname(caminho))),
+            "linhas_csv": linhas_csv, "linhas_xlsx": linhas_xlsx}
+
+def gravar_cadop(caminho, ops):
+    """Relatorio_cadop.csv (';', latin1) só com as operadoras ativas."""
+    ativas = ops[ops["Ativa"]]
+    df = pd.DataFrame({
+        "REGISTRO_OPERADORA": ativas["Registro_ANS"].astype(str),
+        "CNPJ": ativas["CNPJ"],
+        "Razao_Social": ativas["RazaoSocial"],
+        "Nome_Fantasia": ativas["RazaoSocial"].str.split().str[0],
+        "Modalidade": ativas["Modalidade"],
+        "Cidade": np.array(CIDADES)[np.arange(len(ativas)) % len(CIDADES)],
+        "UF": ativas["UF"],
+        "Data_Registro_ANS": "2001-01-01",
+    })
+    df.to_csv(caminho, sep=";", index=False, encoding="latin1", quoting=csv.QUOTE_ALL)
+    return len(df)
+
+def trimestres_ate(ano_final, quantidade):
+    """Os `quantidade` trimestres que terminam em 4T/<ano_final>, do mais antigo ao mais novo."""
+    fim = int(ano_final) * 4 + 3
+    return [(k // 4, f"{k % 4 + 1}T") for k in range(fim - quantidade + 1, fim + 1)]
+
+def gerar(destino, linhas, trimestres=4, num_operadoras=None, semente=SEMENTE, ano_final=2024, xlsx=True):
+    """Gera o conjunto completo em `destino` e devolve o manifesto.
+
+    Se já existir um manifesto com os mesmos parâmetros, os arquivos são reaproveitados.
+    """
+    num_operadoras = num_operadoras or max(100, min(linhas // 1000, 5000))
+    parametros = {"linhas": int(linhas), "trimestres": int(trimestres), "operadoras": int(num_operadoras),
+                  "semente": int(semente), "ano_final": int(ano_final), "xlsx": bool(xlsx)}
+    caminho_manifesto = os.path.join(destino, "manifesto.json")
+    if os.path.exists(caminho_manifesto):
+        with open(caminho_manifesto, "r", encoding="utf-8") as f:
+            manifesto = json.load(f)
+        if manifesto.get("parametros") == parametros:
+            return manifesto
+
+    os.makedirs(destino, exist_ok=True)
+    inicio = time.perf_counter()
+    ops = operadoras(num_operadoras, semente)
+    por_trimestre = [linhas // trimestres + (1 if i < linhas % trimestres else 0) for i in range(trimestres)]
+    arquivos = []
+    for (ano, tri), n in zip(trimestres_ate(ano_final, trimestres), por_trimestre):
+        os.makedirs(os.path.join(destino, str(ano)), exist_ok=True)
+        arquivos.append(gerar_zip(os.path.join(destino, str(ano), f"{tri}{ano}.zip"), ops, ano, tri, n, semente, xlsx))
+        print(f"   🧪 {tri}{ano}: {n:,} linhas")
+    ativas = gravar_cadop(os.path.join(destino, "Relatorio_cadop.csv"), ops)
+
+    manifesto = {"parametros": parametros, "trimestres": arquivos, "cadop": "Relatorio_cadop.csv",
+                 "operadoras_ativas": ativas}
+    with open(caminho_manifesto, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, indent=2)
+    print(f"✅ Dados sintéticos ({linhas:,} linhas, {num_operadoras} operadoras) em {destino} "
+          f"({time.perf_counter() - inicio:.1f}s)")
+    return manifesto
+
+if __name__ == "__main__":
+    escala = sys.argv[1] if len(sys.argv) > 1 else "100k"
+    destino = sys.argv[2] if len(sys.argv) > 2 else os.path.join("dados_sinteticos", escala)
+    gerar(destino, linhas_da_escala(escala))
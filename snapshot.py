@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import time
+import shutil
+from datetime import datetime
+import pandas as pd
+from database import get_engine
+
+#
+# SNAPSHOT COLUNAR PRONTO PARA A API
+#
+# O ETL publica os dados já enriquecidos (RazaoSocial, UF) em arquivos Arrow IPC
+# sem compressão, que a API abre por memory-map na inicialização: nada de
+# varredura de tabelas, merge ou download de Cadop no caminho de serviço.
+#
+# Layout: <SNAPSHOT_DIR>/<versao>/{despesas,agregado}.arrow + <SNAPSHOT_DIR>/manifesto.json
+# O manifesto aponta para a versão atual e é trocado atomicamente (os.replace),
+# então um leitor nunca vê uma versão pela metade.
+#
+SNAPSHOT_DIR = os.getenv("API_SNAPSHOT_DIR", os.path.join(os.getcwd(), "snapshot"))
+SNAPSHOT_MANTER = int(os.getenv("API_SNAPSHOT_MANTER", "2"))
+
+TABELAS = ("despesas", "agregado")
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc  # noqa: F401
+    _FORMATO = "arrow"
+except ImportError:
+    pa = None
+    _FORMATO = "pickle"
+
+def _caminho_manifesto(diretorio):
+    return os.path.join(diretorio, "manifesto.json")
+
+def _extensao(formato):
+    return "arrow" if formato == "arrow" else "pkl"
+
+#
+# PUBLICAÇÃO (lado do ETL)
+#
+def montar_despesas(engine=None, df_cadop=None):
+    """despesas_consolidadas com UF (operadoras_ativas) e RazaoSocial preenchida pelo Cadop."""
+    engine = engine or get_engine()
+    # Periodo é só chave de consulta no banco; a API serve as colunas originais
+    df = pd.read_sql("SELECT * FROM despesas_consolidadas", engine).drop(columns=['Periodo'], errors='ignore')
+    df_ops = pd.read_sql("SELECT CNPJ, UF FROM operadoras_ativas", engine)
+    df['CNPJ'] = df['CNPJ'].astype(str).str.replace(r'\D', '', regex=True)
+
+    if 'UF' not in df.columns:
+        df_ops['CNPJ'] = df_ops['CNPJ'].astype(str)
+        df = df.merge(df_ops.drop_duplicates('CNPJ'), on='CNPJ', how='left')
+
+    if 'RazaoSocial' not in df.columns:
+        df['RazaoSocial'] = None
+    if df['RazaoSocial'].isna().any() and df_cadop is not None:
+        razao = df_cadop.set_index('CNPJ')['RazaoSocial']
+        df['RazaoSocial'] = df['RazaoSocial'].fillna(df['CNPJ'].str.zfill(14).map(razao))
+    df['RazaoSocial'] = df['RazaoSocial'].fillna('DESCONHECIDO')
+    return df
+
+def _gravar(df, caminho, formato):
+    if formato == "arrow":
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(caminho, "wb") as f, pa.ipc.new_file(f, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+    else:
+        df.to_pickle(caminho)
+
+def publicar_snapshot(df_despesas, df_agregado, diretorio=None):
+    """Grava uma nova versão do snapshot e a torna a atual. Retorna o manifesto."""
+    diretorio = diretorio or SNAPSHOT_DIR
+    versao = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    pasta = os.path.join(diretorio, versao)
+    os.makedirs(pasta, exist_ok=True)
+
+    inicio = time.perf_counter()
+    dados = {"despesas": df_despesas, "agregado": df_agregado}
+    arquivos = {}
+    for nome in TABELAS:
+        arquivos[nome] = f"{nome}.{_extensao(_FORMATO)}"
+        _gravar(dados[nome].reset_index(drop=True), os.path.join(pasta, arquivos[nome]), _FORMATO)
+
+    manifesto = {
+        "versao": versao,
+        "formato": _FORMATO,
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "arquivos": arquivos,
+        "linhas": {nome: int(len(dados[nome])) for nome in TABELAS},
+    }
+    tmp = _caminho_manifesto(diretorio) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, indent=2)
+    os.replace(tmp, _caminho_manifesto(diretorio))
+    _podar(diretorio, versao)
+
+    print(f"📦 Snapshot {versao} publicado em {time.perf_counter() - inicio:.2f}s "
+          f"({manifesto['linhas']['despesas']} despesas, {manifesto['linhas']['agregado']} grupos).")
+    return manifesto
+
+def publicar_do_banco(engine=None, diretorio=None):
+    """Monta o snapshot a partir das tabelas do banco (usado ao fim do teste2)."""
+    import cadop
+    engine = engine or get_engine()
+    df_despesas = montar_despesas(engine, cadop.obter_cadop())
+    df_agregado = pd.read_sql("SELECT * FROM despesas_agregadas", engine)
+    if 'TotalDespesas' in df_agregado.columns:
+        df_agregado = df_agregado.sort_values(by='TotalDespesas', ascending=False)
+    return publicar_snapshot(df_despesas, df_agregado, diretorio)
+
+def _podar(diretorio, atual):
+    # Versões antigas saem do disco; leitores com memory-map aberto seguem válidos (POSIX)
+    versoes = sorted(
+        # Só pastas de versão (AAAAMMDDTHHMMSSffffff); outras, como exportacoes/, ficam
+        (d for d in os.listdir(diretorio) if re.fullmatch(r"\d{8}T\d{12}", d) and os.path.isdir(os.path.join(diretorio, d))),
+        reverse=True,
+    )
+    for antiga in versoes[max(SNAPSHOT_MANTER, 1):]:
+        if antiga != atual:
+            shutil.rmtree(os.path.join(diretorio, antiga), ignore_errors=True)
+
+#
+# LEITURA (lado da API)
+#
+def ler_manifesto(diretorio=None):
+    try:
+        with open(_caminho_manifesto(diretorio or SNAPSHOT_DIR), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _ler(caminho, formato):
+    if formato == "arrow":
+        # memory-map: as páginas vêm do page cache sob demanda. split_blocks mantém
+        # cada coluna no seu bloco: numéricas sem nulos e textos (str do pandas,
+        # sobre Arrow) apontam para o arquivo em vez de serem copiadas para o heap
+        with pa.memory_map(caminho, "r") as origem:
+            tabela = pa.ipc.open_file(origem).read_all()
+        return tabela.to_pandas(split_blocks=True)
+    return pd.read_pickle(caminho)
+
+def carregar_versao(manifesto, diretorio=None):
+    """(df_despesas, df_agregado) da versão descrita por `manifesto`."""
+    if manifesto["formato"] == "arrow" and pa is None:
+        raise RuntimeError("Snapshot em Arrow requer pyarrow instalado")
+    pasta = os.path.join(diretorio or SNAPSHOT_DIR, manifesto["versao"])
+    return tuple(_ler(os.path.join(pasta, manifesto["arquivos"][nome]), manifesto["formato"]) for nome in TABELAS)
+
+def carregar_snapshot(diretorio=None):
+    """(manifesto, df_despesas, df_agregado) da versão atual, ou None se não houver snapshot."""
+    diretorio = diretorio or SNAPSHOT_DIR
+    manifesto = ler_manifesto(diretorio)
+    if manifesto is None:
+        return None
+    return (manifesto, *carregar_versao(manifesto, diretorio))
+
+if __name__ == "__main__":
+    publicar_do_banco()
@@ -1,50 +1,47 @@
-import requests
 import zipfile
 import io
 import pandas as pd
 import re
 from bs4 import BeautifulSoup
 import os
-from database import get_engine
+import hashlib
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from database import get_engine, criar_tabelas, carregar_em_massa, upsert_dataframe, excluir_por_chaves, ler_estado_carga, registrar_carga, reiniciar_estado_carga, registrar_versao
 from sqlalchemy import text
+from conversores import opcoes_leitura_csv, valor_br_para_float, somente_digitos, identificador_para_int, periodo_chave
+import cadop
+import metricas
+import consolidado
+from consolidado import salvar_arquivos
+from ans_client import baixar, baixar_para_arquivo, liberar_arquivo, DOWNLOAD_WORKERS
 
 url_base = "https://dadosabertos.ans.gov.br/FTP/PDA/demonstracoes_contabeis/"
 
+# Linhas por chunk na leitura em streaming dos CSVs da ANS
+CHUNK_LINHAS = int(os.getenv("ANS_CHUNK_LINHAS", "200000"))
+
+# Processos para parsing/normalização (1 = serial) e tamanho dos blocos enviados a cada um.
+# O pai mantém até 2 blocos por worker em voo: o padrão limitado a 4 segura o pico
+# (~8 x BLOCO_BYTES) em máquinas com muitos núcleos; acima disso, só explicitamente.
+PARSE_WORKERS = int(os.getenv("ANS_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+BLOCO_BYTES = int(float(os.getenv("ANS_BLOCO_MB", "32")) * 1024 * 1024)
+
+# Carga incremental: pula trimestres já carregados (mesmo checksum) e aplica só o delta
+INCREMENTAL = os.getenv("ETL_INCREMENTAL", "0").lower() in ("1", "true", "sim")
+
 # 
 # OBTER DADOS DE OPERADORAS ATIVAS (PARA RAZÃO SOCIAL)
 # 
 def obter_cadop():
-    print("Baixando dados cadastrais de operadoras (Cadop)...")
-    url_ativas = "https://dadosabertos.ans.gov.br/FTP/PDA/operadoras_de_plano_de_saude_ativas/Relatorio_cadop.csv"
-    try:
-        r = requests.get(url_ativas)
-        r.raise_for_status()
-        df = pd.read_csv(io.BytesIO(r.content), sep=';', encoding='latin1', on_bad_lines='skip')
-        
-        # Normalizar colunas
-        df.columns = [c.strip().upper() for c in df.columns]
-        
-        # Encontrar coluna de Razão Social
-        col_razao = next((c for c in df.columns if 'RAZAO' in c or 'NOME' in c), None)
-        col_cnpj = next((c for c in df.columns if 'CNPJ' in c), None)
-        col_reg = next((c for c in df.columns if 'REGISTRO' in c), None)
-        
-        if col_cnpj and col_razao:
-            cols = [col_cnpj, col_razao]
-            rename_map = {col_cnpj: 'CNPJ', col_razao: 'RazaoSocial_Cadop'}
-            
-            if col_reg:
-                cols.append(col_reg)
-                rename_map[col_reg] = 'Registro_ANS_Cadop'
-                
-            df = df[cols].copy()
-            df[col_cnpj] = df[col_cnpj].astype(str).str.replace(r'\D', '', regex=True)
-            df = df.rename(columns=rename_map)
-            return df
-        return None
-    except Exception as e:
-        print(f"Erro ao baixar Cadop: {e}")
+    # Cadastro compartilhado (cadop.py), com os nomes de coluna usados no merge abaixo
+    df = cadop.obter_cadop()
+    if df is None:
         return None
+    return df[['CNPJ', 'RazaoSocial', 'Registro_ANS']].rename(
+        columns={'RazaoSocial': 'RazaoSocial_Cadop', 'Registro_ANS': 'Registro_ANS_Cadop'}
+    )
 
 # 
 # LEITURA DE ARQUIVOS DENTRO DO ZIP
@@ -66,6 +63,159 @@ def ler_arquivo_do_zip(meu_zip, nome_arquivo):
         print(f"    ❌ Erro ao ler {nome_arquivo}: {e}")
         return None
 
+# 
+# LEITURA EM STREAMING (CHUNKS) DE UM CSV DO ZIP
+# 
+def _coluna_relevante(coluna):
+    # Apenas as colunas que normalizar() pode usar: identificador, valor, conta e descrição
+    c = str(coluna).strip().upper()
+    return c.startswith(("CNPJ", "REG_ANS", "VL_", "CD_CONTA")) or "DESC" in c
+
+def normalizar_membro(meu_zip, nome_arquivo, ano, trimestre, chunksize=None):
+    """Lê um membro do ZIP em chunks e normaliza cada chunk à medida que chega.
+
+    O filtro de despesas (classe 4) e a projeção de colunas acontecem por chunk,
+    então a memória fica limitada a um chunk + as linhas de despesa aceitas.
+    XLSX não tem leitura incremental no pandas e segue pelo caminho completo.
+    Erro de leitura no meio do arquivo sobe para quem chamou (não devolve parte dele).
+    """
+    chunksize = chunksize or CHUNK_LINHAS
+
+    if nome_arquivo.lower().endswith(".xlsx"):
+        df_raw = ler_arquivo_do_zip(meu_zip, nome_arquivo)
+        if df_raw is None:
+            return None
+        return normalizar(df_raw, ano, trimestre)
+
+    with meu_zip.open(nome_arquivo) as f:
+        opcoes = opcoes_leitura_csv(f.readline())
+
+    for encoding in ("utf-8", "latin1"):
+        partes = []
+        try:
+            with meu_zip.open(nome_arquivo) as f:
+                leitor = pd.read_csv(
+                    f, encoding=encoding, on_bad_lines="skip",
+                    usecols=_coluna_relevante, chunksize=chunksize, **opcoes
+                )
+                for chunk in leitor:
+                    df_norm = normalizar(chunk, ano, trimestre)
+                    if df_norm is not None:
+                        partes.append(df_norm)
+            break
+        except UnicodeDecodeError:
+            continue
+
+    if not partes:
+        return None
+    return pd.concat(partes, ignore_index=True)
+
+# 
+# PARSING PARALELO (POOL DE PROCESSOS)
+# 
+def dividir_membro(meu_zip, nome_arquivo, bloco_bytes=None):
+    """Divide um CSV do ZIP em blocos de ~bloco_bytes, cortados em fim de linha.
+
+    Cada bloco repete o cabeçalho, então pode ser lido de forma independente.
+    Assume que não há quebras de linha dentro de campos (formato da ANS).
+    """
+    bloco_bytes = bloco_bytes or BLOCO_BYTES
+    with meu_zip.open(nome_arquivo) as f:
+        cabecalho = f.readline()
+        resto = b""
+        while True:
+            dados = f.read(bloco_bytes)
+            if not dados:
+                break
+            dados = resto + dados
+            corte = dados.rfind(b"\n")
+            if corte == -1:
+                resto = dados
+                continue
+            resto = dados[corte + 1:]
+            yield cabecalho + dados[:corte + 1]
+        if resto.strip():
+            yield cabecalho + resto
+
+def normalizar_bloco(bloco, ano, trimestre):
+    """Worker: lê um bloco CSV e devolve só (CNPJ, Valor, Ano, Trimestre)."""
+    opcoes = opcoes_leitura_csv(bloco[:bloco.find(b"\n")])
+    for encoding in ("utf-8", "latin1"):
+        try:
+            df = pd.read_csv(
+                io.BytesIO(bloco), encoding=encoding, on_bad_lines="skip",
+                usecols=_coluna_relevante, **opcoes
+            )
+            break
+        except UnicodeDecodeError:
+            continue
+    return normalizar(df, ano, trimestre)
+
+def normalizar_xlsx(caminho_zip, nome_arquivo, ano, trimestre):
+    """Worker: XLSX não pode ser dividido, então o membro inteiro vai para um processo."""
+    with zipfile.ZipFile(caminho_zip) as z:
+        df_raw = ler_arquivo_do_zip(z, nome_arquivo)
+    if df_raw is None:
+        return None
+    return normalizar(df_raw, ano, trimestre)
+
+def processar_zip_paralelo(caminho_zip, ano, tri, pool, workers, falhas=None):
+    """Distribui membros/blocos entre os processos e remonta na ordem original.
+
+    No máximo 2 blocos por worker ficam em voo, limitando a memória do processo pai.
+    Um bloco que falha (erro de leitura, worker morto, pool quebrado) descarta o
+    membro inteiro: nunca sai um arquivo pela metade como aceito.
+    """
+    por_membro = {}
+    com_erro = set()
+    em_voo = deque()
+
+    def descartar(arq, erro):
+        print(f"    ❌ Erro ao ler {arq}: {erro}")
+        com_erro.add(arq)
+        por_membro[arq].clear()
+
+    def coletar(futuro, arq):
+        try:
+            df_norm = futuro.result()
+        except Exception as e:
+            descartar(arq, e)
+            return
+        if df_norm is not None and arq not in com_erro:
+            por_membro[arq].append(df_norm)
+
+    with zipfile.ZipFile(caminho_zip) as z:
+        membros = z.namelist()
+        for arq in membros:
+            por_membro[arq] = []
+            try:
+                if arq.lower().endswith(".xlsx"):
+                    tarefas = [pool.submit(normalizar_xlsx, caminho_zip, arq, ano, tri)]
+                else:
+                    tarefas = (pool.submit(normalizar_bloco, b, ano, tri) for b in dividir_membro(z, arq))
+                for futuro in tarefas:
+                    em_voo.append((futuro, arq))
+                    while len(em_voo) >= 2 * workers:
+                        coletar(*em_voo.popleft())
+            except Exception as e:
+                # Leitura do ZIP ou submit (BrokenProcessPool) falhou no meio do membro
+                descartar(arq, e)
+        while em_voo:
+            coletar(*em_voo.popleft())
+
+    dados = []
+    for arq in membros:
+        if arq in com_erro:
+            print(f"   ❌ {arq} descartado (erro de leitura)")
+            if falhas is not None:
+                falhas.append(arq)
+        elif por_membro[arq]:
+            dados.append(pd.concat(por_membro[arq], ignore_index=True))
+            print(f"   ✅ {arq} aceito (contém despesas)")
+        else:
+            print(f"   ⚠️ {arq} ignorado (sem dados de Despesas com Eventos/Sinistros)")
+    return dados
+
 # 
 # NORMALIZAÇÃO (VERSÃO REAL DA ANS)
 # 
@@ -115,18 +265,10 @@ def normalizar(df, ano, trimestre):
     df = df[[col_cnpj, col_valor]].copy()
     df.columns = ["CNPJ", "Valor"]
 
-    df["CNPJ"] = df["CNPJ"].astype(str).str.replace(r"\D", "", regex=True)
-
-    df["Valor"] = (
-        df["Valor"]
-        .astype(str)
-        .str.replace(".", "", regex=False)
-        .str.replace(",", ".", regex=False)
-        .str.replace("-", "", regex=False)
-        .str.strip()
-    )
+    df["CNPJ"] = somente_digitos(df["CNPJ"])
 
-    df["Valor"] = pd.to_numeric(df["Valor"], errors="coerce")
+    # Normalmente já chega numérico do read_csv (decimal=','); texto é convertido aqui
+    df["Valor"] = valor_br_para_float(df["Valor"])
 
     if df["Valor"].notna().sum() == 0:
         return None
@@ -139,75 +281,213 @@ def normalizar(df, ano, trimestre):
 # 
 # SALVAR RESULTADO
 # 
-def salvar_consolidado(df, csv_path="consolidado_despesas.csv", zip_path="consolidado_despesas.zip"):
+def preparar_para_banco(df):
+    """Colunas do banco e uma linha por chave primária (CNPJ, Trimestre, Ano).
+
+    Os arquivos da ANS trazem várias contas de despesa por operadora no mesmo
+    trimestre; no banco elas são somadas para respeitar a chave primária.
+    """
+    df_db = df.copy()
+
+    # Garantir colunas
+    cols_db = ["CNPJ", "RazaoSocial", "Trimestre", "Ano", "ValorDespesas", "Periodo"]
+    for col in cols_db:
+         if col not in df_db.columns:
+             df_db[col] = None
+
+    sem_cnpj = df_db["CNPJ"].isna() | (df_db["CNPJ"].astype(str) == "")
+    if sem_cnpj.any():
+        print(f"⚠️ {int(sem_cnpj.sum())} linhas sem CNPJ não vão para o banco.")
+        df_db = df_db[~sem_cnpj]
+
+    df_db = df_db.groupby(["CNPJ", "Trimestre", "Ano"], as_index=False, sort=False).agg(
+        RazaoSocial=("RazaoSocial", "first"),
+        ValorDespesas=("ValorDespesas", "sum"),
+    )
+    df_db["ValorDespesas"] = df_db["ValorDespesas"].round(2)
+    # Chave inteira do trimestre (20243 = 3T/2024): join e filtro por período usam índice
+    df_db["Periodo"] = periodo_chave(df_db["Ano"], df_db["Trimestre"])
+    return df_db[cols_db]
+
+def gravar_incremental(df_db, engine):
+    """Aplica no banco só o que mudou em cada trimestre de `df_db`.
+
+    Linhas novas ou com valor diferente entram por upsert na chave primária;
+    operadoras que sumiram do arquivo do trimestre são removidas.
+    """
+    total_upsert, total_removidas = 0, 0
+    for (ano, tri), novo in df_db.groupby(["Ano", "Trimestre"], sort=False):
+        atual = pd.read_sql(
+            text("SELECT CNPJ, RazaoSocial, ValorDespesas FROM despesas_consolidadas WHERE Ano = :ano AND Trimestre = :tri"),
+            engine, params={"ano": int(ano), "tri": tri},
+        )
+        comparado = novo.merge(atual, on="CNPJ", how="left", suffixes=("", "_atual"), indicator=True)
+        mudou = (
+            (comparado["_merge"] == "left_only")
+            | (comparado["ValorDespesas"].round(2) != pd.to_numeric(comparado["ValorDespesas_atual"]).round(2))
+            | (comparado["RazaoSocial"].fillna("") != comparado["RazaoSocial_atual"].fillna(""))
+        )
+        alterados = novo[mudou.to_numpy()]
+        removidos = atual.loc[~atual["CNPJ"].isin(novo["CNPJ"]), ["CNPJ"]].assign(Trimestre=tri, Ano=int(ano))
+
+        upsert_dataframe(alterados, "despesas_consolidadas", ["CNPJ", "Trimestre", "Ano"], engine)
+        excluir_por_chaves(removidos, "despesas_consolidadas", engine)
+        print(f"   🔄 {ano}-{tri}: {len(alterados)} linhas novas/alteradas, {len(removidos)} removidas, {len(novo) - len(alterados)} inalteradas")
+        total_upsert += len(alterados)
+        total_removidas += len(removidos)
+    return total_upsert, total_removidas
+
+def salvar_consolidado(df, csv_path="consolidado_despesas.csv", zip_path="consolidado_despesas.zip", incremental=False, df_cadop=None):
     # Padronizar nomes de colunas para CSV e Banco
     if "Valor" in df.columns:
         df = df.rename(columns={"Valor": "ValorDespesas"})
 
-    df.to_csv(csv_path, index=False, encoding="utf-8")
+    # Banco e arquivos saem das mesmas linhas (uma por CNPJ/Trimestre/Ano)
+    with metricas.etapa("preparar_banco", len(df)) as m:
+        df_db = m.saida(preparar_para_banco(df))
 
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
-        zf.write(csv_path, arcname=os.path.basename(csv_path))
-
-    print(f"\n✅ Arquivo final salvo em: {zip_path}")
+    if not incremental:
+        with metricas.etapa("arquivos", len(df_db)):
+            salvar_arquivos(df_db.sort_values(["Periodo", "CNPJ"])[consolidado.COLUNAS], csv_path, zip_path)
 
     # Salvar no MySQL
     try:
         print("🔌 Conectando ao MySQL...")
         engine = get_engine()
-        
-        # Preparar DataFrame para o banco
-        df_db = df.copy() # Já está renomeado
-        
-        # Garantir colunas
-        cols_db = ["CNPJ", "RazaoSocial", "Trimestre", "Ano", "ValorDespesas"]
-        for col in cols_db:
-             if col not in df_db.columns:
-                 df_db[col] = None
-                 
-        df_db = df_db[cols_db]
+
+        if incremental:
+            print("💾 Aplicando delta no MySQL (tabela despesas_consolidadas)...")
+            with metricas.etapa("gravacao_banco", len(df_db)):
+                gravar_incremental(df_db, engine)
+            print("✅ Delta aplicado no MySQL com sucesso!")
+            # Trimestres intocados pelo delta podem ter sido gravados antes sem nome
+            preenchidas = preencher_razao_social(df_cadop, engine)
+            if preenchidas:
+                print(f"   🏷️ RazaoSocial preenchida pelo Cadop em {preenchidas} linhas antigas")
+            # Arquivos locais refletem a tabela completa, não só o delta
+            with metricas.etapa("arquivos"):
+                salvar_arquivos(consolidado.do_banco(pd.read_sql(
+                    f"SELECT {', '.join(consolidado.COLUNAS)} FROM despesas_consolidadas ORDER BY Periodo, CNPJ", engine
+                )), csv_path, zip_path)
+            return True
         
         print("💾 Inserindo dados no MySQL (tabela despesas_consolidadas)...")
         
-        with engine.connect() as conn:
-            try:
-                if engine.dialect.name == "sqlite":
-                    conn.execute(text("DELETE FROM despesas_consolidadas"))
-                else:
-                    conn.execute(text("TRUNCATE TABLE despesas_consolidadas"))
-                conn.commit()
-            except Exception:
-                pass
-            
-        df_db.to_sql("despesas_consolidadas", engine, if_exists="append", index=False)
+        with metricas.etapa("gravacao_banco", len(df_db)):
+            with engine.connect() as conn:
+                try:
+                    if engine.dialect.name == "sqlite":
+                        conn.execute(text("DELETE FROM despesas_consolidadas"))
+                    else:
+                        conn.execute(text("TRUNCATE TABLE despesas_consolidadas"))
+                    conn.commit()
+                except Exception:
+                    pass
+
+            carregar_em_massa(df_db, "despesas_consolidadas", engine)
         print("✅ Dados salvos no MySQL com sucesso!")
+        return True
                 
     except Exception as e:
         print(f"❌ Erro ao salvar no MySQL: {e}")
+        return False
 
 # 
-# FUNÇÃO PRINCIPAL
+# CORREÇÃO DE IDENTIFICADORES (REGISTRO ANS -> CNPJ)
+# 
+def corrigir_identificadores(df_final, df_cadop):
+    nomes = _nomes_cadop(df_cadop)
+
+    # 1. Se tiver CNPJ mas parecer curto (RegistroANS disfarçado), renomear
+    if 'CNPJ' in df_final.columns:
+        # Verifica mediana do comprimento
+        sample = df_final['CNPJ'].dropna().astype(str)
+        if not sample.empty and sample.str.len().median() < 10:
+             print("CNPJ parece ser Registro ANS (comprimento < 10). Renomeando para Registro_ANS.")
+             df_final = df_final.rename(columns={'CNPJ': 'Registro_ANS'})
+
+    # 2. Se tiver Registro_ANS e tiver Cadop, mapear para CNPJ
+    if 'Registro_ANS' in df_final.columns and df_cadop is not None and 'Registro_ANS_Cadop' in df_cadop.columns:
+        print("Mapeando Registro_ANS para CNPJ usando Cadop...")
+        # Join por chave inteira (Int64) dos dois lados, sem ida e volta para string
+        df_final['Registro_ANS'] = identificador_para_int(df_final['Registro_ANS'])
+        df_cadop = df_cadop[['Registro_ANS_Cadop', 'CNPJ']].copy()
+        df_cadop['Registro_ANS_Cadop'] = identificador_para_int(df_cadop['Registro_ANS_Cadop'])
+        df_cadop = df_cadop.dropna(subset=['Registro_ANS_Cadop']).drop_duplicates('Registro_ANS_Cadop')
+
+        # Merge
+        # Se CNPJ já existe (parcialmente), mantermos. Se não, criamos.
+        if 'CNPJ' not in df_final.columns:
+             df_final['CNPJ'] = None
+
+        df_merged = pd.merge(df_final, df_cadop,
+                             left_on='Registro_ANS', right_on='Registro_ANS_Cadop', how='left')
+
+        # Preencher CNPJ onde possível
+        # CNPJ_x é o original (vazio ou incompleto), CNPJ_y é o do Cadop
+        if 'CNPJ_y' in df_merged.columns:
+            df_merged['CNPJ_x'] = df_merged['CNPJ_x'].fillna(df_merged['CNPJ_y'])
+            df_merged = df_merged.rename(columns={'CNPJ_x': 'CNPJ'})
+            df_merged = df_merged.drop(columns=['CNPJ_y', 'Registro_ANS_Cadop'])
+
+        df_final = df_merged
+
+    # 3. RazaoSocial pelo CNPJ: banco, consolidado e modo SQL da API guardam o nome
+    if 'CNPJ' in df_final.columns and nomes is not None:
+        if 'RazaoSocial' not in df_final.columns:
+            df_final['RazaoSocial'] = None
+        cnpj = df_final['CNPJ'].astype("string").str.zfill(14)
+        df_final['RazaoSocial'] = df_final['RazaoSocial'].fillna(cnpj.map(nomes))
+
+    return df_final
+
+def _nomes_cadop(df_cadop):
+    """Series CNPJ (14 dígitos) -> RazaoSocial do Cadop, ou None sem Cadop."""
+    if df_cadop is None or not {'CNPJ', 'RazaoSocial_Cadop'} <= set(df_cadop.columns):
+        return None
+    nomes = df_cadop.dropna(subset=['CNPJ', 'RazaoSocial_Cadop']).drop_duplicates('CNPJ')
+    return nomes.set_index('CNPJ')['RazaoSocial_Cadop']
+
+def preencher_razao_social(df_cadop, engine):
+    """Completa pelo Cadop a RazaoSocial das linhas já gravadas sem nome (cargas anteriores)."""
+    nomes = _nomes_cadop(df_cadop)
+    if nomes is None or nomes.empty:
+        return 0
+    parametros = [{"cnpj": c, "razao": r} for c, r in nomes.items()]
+    with engine.begin() as conn:
+        resultado = conn.execute(text(
+            "UPDATE despesas_consolidadas SET RazaoSocial = :razao WHERE CNPJ = :cnpj AND RazaoSocial IS NULL"
+        ), parametros)
+    if resultado.rowcount:
+        registrar_versao(engine)
+    return resultado.rowcount
+
 # 
-def baixar_e_processar():
-    print("Coletando dados da ANS...")
+# DESCOBERTA DE ANOS E TRIMESTRES
+# 
+def descobrir_trimestres(limite=3, desde=None, ate=None):
+    """Lista os ZIPs trimestrais mais recentes: [(ano, tri, url_zip), ...].
 
-    soup = BeautifulSoup(requests.get(url_base).text, "html.parser")
+    limite=None lista todos; desde/ate restringem os anos visitados.
+    """
+    soup = BeautifulSoup(baixar(url_base), "html.parser")
 
     anos = sorted(
         [a["href"].strip("/") for a in soup.find_all("a", href=True)
          if re.fullmatch(r"\d{4}/?", a["href"])],
         reverse=True
     )
+    anos = [a for a in anos if (desde is None or int(a) >= int(desde)) and (ate is None or int(a) <= int(ate))]
 
-    dados = []
-    trimestres_usados = set()
+    trimestres = []
+    chaves = set()
 
     for ano in anos:
-        if len(trimestres_usados) >= 3:
+        if limite is not None and len(chaves) >= limite:
             break
 
         url_ano = f"{url_base}{ano}/"
-        soup_ano = BeautifulSoup(requests.get(url_ano).text, "html.parser")
+        soup_ano = BeautifulSoup(baixar(url_ano), "html.parser")
 
         zips = sorted(
             [a["href"] for a in soup_ano.find_all("a", href=True)
@@ -216,7 +496,7 @@ def baixar_e_processar():
         )
 
         for zip_name in zips:
-            if len(trimestres_usados) >= 3:
+            if limite is not None and len(chaves) >= limite:
                 break
 
             m = re.search(r"([1-4])T\d{4}", zip_name, re.I)
@@ -225,74 +505,162 @@ def baixar_e_processar():
 
             tri = f"{m.group(1)}T"
             chave = f"{ano}-{tri}"
-            if chave in trimestres_usados:
+            if chave in chaves:
                 continue
 
-            print(f"\n📦 {zip_name}")
-            r_zip = requests.get(f"{url_ano}{zip_name}")
+            chaves.add(chave)
+            trimestres.append((ano, tri, f"{url_ano}{zip_name}"))
 
-            with zipfile.ZipFile(io.BytesIO(r_zip.content)) as z:
-                for arq in z.namelist():
-                    df_raw = ler_arquivo_do_zip(z, arq)
-                    if df_raw is None:
-                        continue
+    return trimestres
 
-                    df_norm = normalizar(df_raw, ano, tri)
-                    if df_norm is not None:
-                        dados.append(df_norm)
-                        print(f"   ✅ {arq} aceito (contém despesas)")
-                    else:
-                        print(f"   ⚠️ {arq} ignorado (sem dados de Despesas com Eventos/Sinistros)")
+# 
+# PROCESSAMENTO DE UM ZIP TRIMESTRAL
+# 
+def processar_zip(caminho_zip, ano, tri, pool=None, workers=1, falhas=None):
+    """DataFrames normalizados dos membros do ZIP; `falhas` (lista) recebe os membros descartados por erro."""
+    if pool is not None:
+        return processar_zip_paralelo(caminho_zip, ano, tri, pool, workers, falhas)
+
+    dados = []
+    with zipfile.ZipFile(caminho_zip) as z:
+        for arq in z.namelist():
+            try:
+                df_norm = normalizar_membro(z, arq, ano, tri)
+            except Exception as e:
+                print(f"    ❌ Erro ao ler {arq}: {e}")
+                print(f"   ❌ {arq} descartado (erro de leitura)")
+                if falhas is not None:
+                    falhas.append(arq)
+                continue
+            if df_norm is not None:
+                dados.append(df_norm)
+                print(f"   ✅ {arq} aceito (contém despesas)")
+            else:
+                print(f"   ⚠️ {arq} ignorado (sem dados de Despesas com Eventos/Sinistros)")
+    return dados
 
-            trimestres_usados.add(chave)
+def checksum_arquivo(caminho, bloco=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for parte in iter(lambda: f.read(bloco), b""):
+            sha.update(parte)
+    return sha.hexdigest()
+
+# 
+# FUNÇÃO PRINCIPAL
+# 
+def baixar_medido(url):
+    """baixar_para_arquivo() registrado como etapa "download" (bytes = tamanho do ZIP)."""
+    with metricas.etapa("download", detalhe=url.rsplit('/', 1)[-1]) as m:
+        caminho = baixar_para_arquivo(url)
+        m.bytes = os.path.getsize(caminho)
+    return caminho
+
+def baixar_e_processar(incremental=None):
+    with metricas.execucao("teste1"):
+        return _baixar_e_processar(incremental)
+
+def _baixar_e_processar(incremental):
+    incremental = INCREMENTAL if incremental is None else incremental
+    print(f"Coletando dados da ANS... (modo {'incremental' if incremental else 'completo'})")
+
+    estado = {}
+    try:
+        criar_tabelas()
+        if incremental:
+            estado = ler_estado_carga()
+    except Exception as e:
+        if incremental:
+            print(f"⚠️ Estado da carga indisponível ({e}). Seguindo com carga completa.")
+            incremental = False
+
+    with metricas.etapa("descoberta") as m:
+        trimestres = descobrir_trimestres()
+        m.linhas_saida = len(trimestres)
+    print(f"Trimestres encontrados: {[f'{a}-{t}' for a, t, _ in trimestres]}")
+
+    # Parsing em processos separados quando ANS_PARSE_WORKERS > 1 ("spawn" evita
+    # fork com as threads de download já ativas)
+    pool_parse = None
+    if PARSE_WORKERS > 1:
+        pool_parse = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+    # Downloads em paralelo (limitados a ANS_DOWNLOAD_WORKERS) direto para disco
+    # (cache local ou arquivo temporário); cada ZIP é processado assim que termina.
+    # A ordem final segue a descoberta.
+    resultados = {}
+    cargas = {}
+    descartados = []
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+        futuros = {pool.submit(baixar_medido, url): (ano, tri, url) for ano, tri, url in trimestres}
+        for futuro in as_completed(futuros):
+            ano, tri, url = futuros[futuro]
+            print(f"\n📦 {url.rsplit('/', 1)[-1]}")
+            try:
+                caminho_zip = futuro.result()
+            except Exception as e:
+                print(f"   ❌ Falha ao baixar {url}: {e}")
+                continue
+            try:
+                checksum = checksum_arquivo(caminho_zip)
+                if incremental and estado.get((int(ano), tri), {}).get("Checksum") == checksum:
+                    print("   ⏭️ Trimestre já carregado (checksum igual). Pulando.")
+                    continue
+                # Leitura e normalização acontecem juntas, chunk a chunk (ou bloco a bloco no pool)
+                falhas = []
+                with metricas.etapa("parse_normalizacao", detalhe=f"{ano}-{tri}") as m:
+                    m.bytes = os.path.getsize(caminho_zip)
+                    dados_zip = processar_zip(caminho_zip, ano, tri, pool_parse, PARSE_WORKERS, falhas)
+                    m.linhas_saida = sum(len(df) for df in dados_zip)
+                    m.memoria_df = sum(metricas.memoria_df(df) for df in dados_zip)
+                if falhas:
+                    # Trimestre incompleto não entra nem é registrado: a próxima execução tenta de novo
+                    print(f"   ❌ {ano}-{tri} descartado: {len(falhas)} arquivo(s) com erro de leitura")
+                    descartados.append(f"{ano}-{tri}")
+                    continue
+                resultados[(ano, tri)] = dados_zip
+                cargas[(ano, tri)] = (url.rsplit('/', 1)[-1], checksum)
+            finally:
+                liberar_arquivo(caminho_zip)
+
+    if pool_parse is not None:
+        pool_parse.shutdown()
+
+    dados = [df for ano, tri, _ in trimestres for df in resultados.get((ano, tri), [])]
 
     if not dados:
-        print("❌ Nenhum dado compatível encontrado.")
+        if incremental and not cargas and not descartados:
+            print("✅ Nenhum trimestre novo ou alterado. Nada a fazer.")
+        else:
+            print("❌ Nenhum dado compatível encontrado.")
         return None
 
     df_final = pd.concat(dados, ignore_index=True)
 
     # --- Lógica de Correção de ID ---
     print("Verificando consistência de identificadores (CNPJ/Registro ANS)...")
-    df_cadop = obter_cadop()
-    
-    # 2. Se tiver CNPJ mas parecer curto (RegistroANS disfarçado), renomear
-    if 'CNPJ' in df_final.columns:
-        # Verifica mediana do comprimento
-        sample = df_final['CNPJ'].dropna().astype(str)
-        if not sample.empty and sample.map(len).median() < 10:
-             print("CNPJ parece ser Registro ANS (comprimento < 10). Renomeando para Registro_ANS.")
-             df_final = df_final.rename(columns={'CNPJ': 'Registro_ANS'})
-    
-    # 3. Se tiver Registro_ANS e tiver Cadop, mapear para CNPJ
-    if 'Registro_ANS' in df_final.columns and df_cadop is not None and 'Registro_ANS_Cadop' in df_cadop.columns:
-        print("Mapeando Registro_ANS para CNPJ usando Cadop...")
-        # Garantir tipos compatíveis
-        df_final['Registro_ANS'] = pd.to_numeric(df_final['Registro_ANS'], errors='coerce').astype('Int64').astype(str)
-        df_cadop['Registro_ANS_Cadop'] = pd.to_numeric(df_cadop['Registro_ANS_Cadop'], errors='coerce').astype('Int64').astype(str)
-        
-        # Merge
-        # Se CNPJ já existe (parcialmente), mantermos. Se não, criamos.
-        if 'CNPJ' not in df_final.columns:
-             df_final['CNPJ'] = None
-             
-        df_merged = pd.merge(df_final, df_cadop[['Registro_ANS_Cadop', 'CNPJ']], 
-                             left_on='Registro_ANS', right_on='Registro_ANS_Cadop', how='left')
-        
-        # Preencher CNPJ onde possível
-        # CNPJ_x é o original (vazio ou incompleto), CNPJ_y é o do Cadop
-        if 'CNPJ_y' in df_merged.columns:
-            df_merged['CNPJ_x'] = df_merged['CNPJ_x'].fillna(df_merged['CNPJ_y'])
-            df_merged = df_merged.rename(columns={'CNPJ_x': 'CNPJ'})
-            df_merged = df_merged.drop(columns=['CNPJ_y', 'Registro_ANS_Cadop'])
-        
-        df_final = df_merged
+    with metricas.etapa("cadop") as m:
+        df_cadop = m.saida(obter_cadop())
+    with metricas.etapa("corrigir_identificadores", len(df_final)) as m:
+        df_final = m.saida(corrigir_identificadores(df_final, df_cadop))
 
-    salvar_consolidado(df_final)
+    if salvar_consolidado(df_final, incremental=incremental, df_cadop=df_cadop):
+        registrar_trimestres(df_final, cargas, reiniciar=not incremental)
 
     print("\n🎉 PROCESSO FINALIZADO COM SUCESSO")
     return df_final
 
+def registrar_trimestres(df_final, cargas, reiniciar=False):
+    """Grava (Ano, Trimestre, arquivo, checksum) dos trimestres carregados."""
+    try:
+        if reiniciar:
+            reiniciar_estado_carga()
+        linhas = df_final.groupby(["Ano", "Trimestre"]).size()
+        for (ano, tri), (arquivo, checksum) in cargas.items():
+            registrar_carga(ano, tri, arquivo, checksum, linhas.get((int(ano), tri), 0))
+    except Exception as e:
+        print(f"⚠️ Não foi possível registrar o estado da carga: {e}")
+
 # 
 # EXECUÇÃO
 # 
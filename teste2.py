@@ -1,10 +1,13 @@
 import pandas as pd
-import requests
-import io
 import os
-import zipfile
 import numpy as np
-from database import get_engine
+from database import get_engine, criar_tabelas, carregar_em_massa, upsert_dataframe, excluir_por_chaves, ler_estado_carga, marcar_agregado, registrar_versao
+import cadop
+import snapshot
+import consolidado
+import agregados
+import resumos
+import metricas
 from sqlalchemy import text
 
 def validar_cnpj(cnpj):
@@ -38,84 +41,104 @@ def validar_cnpj(cnpj):
 
     return True
 
-def processar_teste2():
-    print("[2.1] Lendo dados do MySQL (despesas_consolidadas)...")
-    engine = get_engine()
-    
+PESOS1 = np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], dtype=np.int64)
+PESOS2 = np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], dtype=np.int64)
+
+def validar_cnpj_vetorizado(cnpjs):
+    """Versão vetorizada de `validar_cnpj` (mesma máscara booleana).
+
+    Cada CNPJ distinto é validado uma única vez: os valores são fatorados,
+    os válidos em ASCII viram uma matriz de dígitos (n x 14) e os dois dígitos
+    verificadores saem de produtos escalares com os pesos do módulo 11.
+    """
+    serie = cnpjs if isinstance(cnpjs, pd.Series) else pd.Series(cnpjs)
+    codigos, unicos = pd.factorize(serie.astype(str), sort=False)
+
+    limpos = pd.Series(unicos, dtype=object).str.replace(r"[./-]", "", regex=True)
+    ascii14 = limpos.str.fullmatch(r"[0-9]{14}").fillna(False).to_numpy(dtype=bool)
+
+    valido = np.zeros(len(unicos), dtype=bool)
+    if ascii14.any():
+        texto = "".join(limpos[ascii14]).encode("ascii")
+        dig = (np.frombuffer(texto, dtype=np.uint8).reshape(-1, 14) - ord("0")).astype(np.int64)
+
+        resto1 = (dig[:, :12] @ PESOS1) % 11
+        digito1 = np.where(resto1 < 2, 0, 11 - resto1)
+        resto2 = (dig[:, :13] @ PESOS2) % 11
+        digito2 = np.where(resto2 < 2, 0, 11 - resto2)
+        repetidos = (dig == dig[:, :1]).all(axis=1)
+
+        valido[ascii14] = (dig[:, 12] == digito1) & (dig[:, 13] == digito2) & ~repetidos
+
+    # Dígitos não-ASCII (ex.: '٣') passam por isdigit(); delega à versão escalar
+    outros = ~ascii14 & limpos.str.len().eq(14).to_numpy(dtype=bool)
+    for i in np.flatnonzero(outros):
+        valido[i] = validar_cnpj(limpos.iat[i])
+
+    # Códigos -1 são valores ausentes (e `valido` fica vazio se todos forem)
+    resultado = np.zeros(len(codigos), dtype=bool)
+    presentes = codigos >= 0
+    resultado[presentes] = valido[codigos[presentes]]
+    return pd.Series(resultado, index=serie.index, name=serie.name)
+
+INCREMENTAL = os.getenv("ETL_INCREMENTAL", "0").lower() in ("1", "true", "sim")
+
+# Colunas lidas do consolidado local (projeção no Parquet)
+COLUNAS_CONSOLIDADO = ['CNPJ', 'RazaoSocial', 'Trimestre', 'Ano', 'ValorDespesas']
+
+def carregar_consolidado(engine):
     try:
         df = pd.read_sql("SELECT * FROM despesas_consolidadas", engine)
         if df.empty:
             raise ValueError("Tabela vazia")
     except Exception as e:
         print(f"Erro ao ler do MySQL: {e}. Tentando ler arquivo local...")
-        if os.path.exists('consolidado_despesas.csv'):
-            df = pd.read_csv('consolidado_despesas.csv')
-        elif os.path.exists('consolidado_despesas.zip'):
-             with zipfile.ZipFile('consolidado_despesas.zip') as z:
-                 # Assumindo que há apenas um arquivo ou pegando o primeiro CSV
-                 csv_name = [n for n in z.namelist() if n.endswith('.csv')][0]
-                 df = pd.read_csv(z.open(csv_name))
-        else:
-            raise FileNotFoundError("Nem tabela MySQL, nem CSV, nem ZIP encontrados.")
-
-    print(f"Colunas carregadas: {df.columns.tolist()}")
+        # Parquet tipado (ou CSV/ZIP), só com as colunas usadas daqui em diante
+        df = consolidado.ler_consolidado(colunas=COLUNAS_CONSOLIDADO)
+        if df is None:
+            raise FileNotFoundError("Nem tabela MySQL, nem Parquet, CSV ou ZIP encontrados.")
+    return df
 
+def validar_despesas(df):
     # Garantir que CNPJ seja string e tenha 14 dígitos (zero à esquerda)
     if 'CNPJ' in df.columns:
-        # Remover .0 de float, remover não dígitos, preencher com zero
-        df['CNPJ'] = df['CNPJ'].astype(str).str.replace(r'\.0$', '', regex=True).str.replace(r'\D', '', regex=True).str.zfill(14)
+        # Remover não dígitos, preencher com zero (as fontes já entregam CNPJ como texto)
+        df['CNPJ'] = df['CNPJ'].astype(str).str.replace(r'\D', '', regex=True).str.zfill(14)
         print(f"Amostra CNPJ: {df['CNPJ'].head().tolist()}")
 
     # Validações
     # 1. CNPJ válido (algoritmo real)
-    df['CNPJ_Valido'] = df['CNPJ'].apply(validar_cnpj)
+    df['CNPJ_Valido'] = validar_cnpj_vetorizado(df['CNPJ'])
     print(f"CNPJs válidos: {df['CNPJ_Valido'].sum()} de {len(df)}")
     # 2. ValorDespesas > 0 (removendo inconsistências/zerados)
     # 3. RazaoSocial não nula e não vazia (se já existir no CSV, caso contrário será preenchida depois)
     
-    df['CNPJ_Valido'] = df['CNPJ'].apply(validar_cnpj)
-    
+    # DECIMAL do MySQL chega como objeto Decimal
+    df['ValorDespesas'] = pd.to_numeric(df['ValorDespesas'], errors='coerce')
     mask_valid = (
         df['CNPJ_Valido'] & 
         (df['ValorDespesas'] > 0)
     )
     
     df = df[mask_valid]
-    df = df.drop(columns=['CNPJ_Valido'])
-    
-    print("[2.2] Enriquecendo dados com operadoras ativas...")
-    url_ativas = "https://dadosabertos.ans.gov.br/FTP/PDA/operadoras_de_plano_de_saude_ativas/Relatorio_cadop.csv"
-    
+    return df.drop(columns=['CNPJ_Valido'])
+
+def enriquecer(df, df_ativas):
     try:
-        # Tentar baixar
-        r = requests.get(url_ativas)
-        # Tenta ler o CSV de operadoras ativas
-        df_ativas = pd.read_csv(io.BytesIO(r.content), sep=';', encoding='latin1', on_bad_lines='skip')
-        
-        # Normalizar colunas das ativas
-        df_ativas.columns = [c.strip() for c in df_ativas.columns]
-        print(f"Colunas Cadop: {df_ativas.columns.tolist()}")
-        df_ativas['CNPJ'] = df_ativas['CNPJ'].astype(str).str.replace(r'\D', '', regex=True)
-        
+        if df_ativas is None:
+            raise ValueError("Cadop indisponível")
+
         # Join (incluindo Razao Social pois vem nulo do teste1)
-        # Identificar coluna de Razão Social
-        col_razao = next((c for c in df_ativas.columns if 'RAZAO' in c.upper()), None)
-        
-        cols_merge = ['CNPJ', 'Registro_ANS', 'Modalidade', 'UF']
-        if col_razao:
-            cols_merge.append(col_razao)
-            
-        # Filtrar colunas existentes
-        cols_merge = [c for c in cols_merge if c in df_ativas.columns]
-        
-        df_final = pd.merge(df, df_ativas[cols_merge], on='CNPJ', how='left')
+        # Cadop já normalizado em cadop.py: CNPJ, Registro_ANS, RazaoSocial, Modalidade, UF
+        cols_merge = ['CNPJ', 'Registro_ANS', 'Modalidade', 'UF', 'RazaoSocial']
+        df_final = pd.merge(df, df_ativas[cols_merge].rename(columns={'RazaoSocial': 'RazaoSocial_Cadop'}),
+                            on='CNPJ', how='left')
         
         # Preencher RazaoSocial nula com a obtida do merge
-        if col_razao and col_razao in df_final.columns:
-            if 'RazaoSocial' not in df_final.columns:
-                df_final['RazaoSocial'] = None
-            df_final['RazaoSocial'] = df_final['RazaoSocial'].fillna(df_final[col_razao])
-            df_final = df_final.drop(columns=[col_razao])
+        if 'RazaoSocial' not in df_final.columns:
+            df_final['RazaoSocial'] = None
+        df_final['RazaoSocial'] = df_final['RazaoSocial'].fillna(df_final['RazaoSocial_Cadop'])
+        df_final = df_final.drop(columns=['RazaoSocial_Cadop'])
         
         # Renomear para o solicitado
         df_final = df_final.rename(columns={'Registro_ANS': 'RegistroANS'})
@@ -134,17 +157,69 @@ def processar_teste2():
         df_final['RazaoSocial'] = 'DESCONHECIDO'
     
     df_final['RazaoSocial'] = df_final['RazaoSocial'].fillna('DESCONHECIDO')
+    return df_final
 
-    print("[2.3] Agregando dados...")
-    # Agrupar por RazaoSocial e UF
-    agregado = df_final.groupby(['RazaoSocial', 'UF']).agg(
-        TotalDespesas=('ValorDespesas', 'sum'),
-        MediaDespesas=('ValorDespesas', 'mean'),
-        DesvioPadraoDespesas=('ValorDespesas', 'std')
-    ).reset_index()
+def agregar(df_final):
+    # Agrupar por RazaoSocial e UF, via parciais por trimestre (ordenado pelo total)
+    return agregados.finalizar(agregados.combinar(agregados.parciais(df_final)))
+
+def agregado_periodo(engine, ultimos=None, de=None, ate=None):
+    """despesas_agregadas de um período sob demanda, só a partir dos parciais gravados.
+
+    Ex.: agregado_periodo(engine, ultimos=4) ou agregado_periodo(engine, de=(2023, '3T'), ate=(2024, '2T')).
+    """
+    df_parciais = pd.read_sql("SELECT * FROM despesas_parciais", engine)
+    return agregados.janela(df_parciais, ultimos=ultimos, de=de, ate=ate)
+
+def operadoras_para_salvar(df_final):
+    cols_ops = ['CNPJ', 'RegistroANS', 'Modalidade', 'UF']
+    # Mapear colunas se necessário (df_final tem 'Registro_ANS' ou 'RegistroANS' dependendo do merge)
+    if 'Registro_ANS' in df_final.columns:
+         df_final = df_final.rename(columns={'Registro_ANS': 'RegistroANS'})
+    for c in cols_ops:
+        if c not in df_final.columns:
+            df_final[c] = None
+    return df_final[cols_ops].drop_duplicates('CNPJ')
+
+def processar_teste2(incremental=None):
+    with metricas.execucao("teste2"):
+        return _processar_teste2(incremental)
+
+def _processar_teste2(incremental):
+    incremental = INCREMENTAL if incremental is None else incremental
+    engine = get_engine()
+    criar_tabelas(engine)
+
+    if incremental:
+        try:
+            with metricas.etapa("incremental") as m:
+                resultado = processar_incremental(engine)
+                if resultado is not None:
+                    m.saida(resultado[0])
+            if resultado is not None:
+                publicar_para_api(engine)
+                return resultado
+        except Exception as e:
+            print(f"⚠️ Modo incremental indisponível ({e}). Seguindo com processamento completo.")
+
+    print("[2.1] Lendo dados do MySQL (despesas_consolidadas)...")
+    with metricas.etapa("leitura") as m:
+        df = m.saida(carregar_consolidado(engine))
+    print(f"Colunas carregadas: {df.columns.tolist()}")
+
+    with metricas.etapa("validacao", len(df)) as m:
+        df = m.saida(validar_despesas(df))
     
-    # Ordenar por valor total (maior para menor)
-    agregado = agregado.sort_values(by='TotalDespesas', ascending=False)
+    print("[2.2] Enriquecendo dados com operadoras ativas...")
+    with metricas.etapa("cadop") as m:
+        df_ativas = m.saida(cadop.obter_cadop())
+    with metricas.etapa("enriquecimento", len(df)) as m:
+        df_final = m.saida(enriquecer(df, df_ativas))
+
+    print("[2.3] Agregando dados...")
+    with metricas.etapa("agregacao", len(df_final)) as m:
+        df_parciais = agregados.parciais(df_final)
+        agregado = m.saida(agregados.finalizar(agregados.combinar(df_parciais)))
     
     # Salvar CSV (backup)
     agregado.to_csv('despesas_agregadas.csv', index=False, encoding='utf-8')
@@ -152,37 +227,116 @@ def processar_teste2():
     # Salvar no MySQL
     try:
         print("Atualizando tabelas no MySQL...")
-        with engine.connect() as conn:
-            try:
-                if engine.dialect.name == "sqlite":
-                    conn.execute(text("DELETE FROM despesas_agregadas"))
-                    conn.execute(text("DELETE FROM operadoras_ativas"))
-                else:
-                    conn.execute(text("TRUNCATE TABLE despesas_agregadas"))
-                    conn.execute(text("TRUNCATE TABLE operadoras_ativas"))
-                conn.commit()
-            except Exception:
-                pass
-            
-        agregado.to_sql('despesas_agregadas', engine, if_exists='append', index=False)
-        
-        # Salvar operadoras ativas
-        cols_ops = ['CNPJ', 'RegistroANS', 'Modalidade', 'UF']
-        # Mapear colunas se necessário (df_final tem 'Registro_ANS' ou 'RegistroANS' dependendo do merge)
-        if 'Registro_ANS' in df_final.columns:
-             df_final = df_final.rename(columns={'Registro_ANS': 'RegistroANS'})
-        for c in cols_ops:
-            if c not in df_final.columns:
-                df_final[c] = None
-             
-        ops_to_save = df_final[cols_ops].drop_duplicates('CNPJ')
-        ops_to_save.to_sql('operadoras_ativas', engine, if_exists='append', index=False)
-        
-        print("✅ Dados salvos no MySQL (despesas_agregadas, operadoras_ativas).")
+        with metricas.etapa("gravacao_banco", len(agregado) + len(df_parciais)):
+            gravar_agregacoes(engine, agregado, df_parciais, df_final)
+        print("✅ Dados salvos no MySQL (despesas_agregadas, despesas_parciais, operadoras_ativas).")
+        try:
+            marcar_agregado(list(ler_estado_carga(engine)), engine)
+        except Exception:
+            pass
+        registrar_versao(engine)
     except Exception as e:
         print(f"❌ Erro ao salvar no MySQL: {e}")
-        
+
+    publicar_para_api(engine)
     return df_final, agregado
 
+def gravar_agregacoes(engine, agregado, df_parciais, df_final):
+    """Substitui despesas_agregadas, despesas_parciais e operadoras_ativas (carga completa)."""
+    criar_tabelas(engine)
+    with engine.connect() as conn:
+        try:
+            if engine.dialect.name == "sqlite":
+                conn.execute(text("DELETE FROM despesas_agregadas"))
+                conn.execute(text("DELETE FROM despesas_parciais"))
+                conn.execute(text("DELETE FROM operadoras_ativas"))
+            else:
+                conn.execute(text("TRUNCATE TABLE despesas_agregadas"))
+                conn.execute(text("TRUNCATE TABLE despesas_parciais"))
+                conn.execute(text("TRUNCATE TABLE operadoras_ativas"))
+            conn.commit()
+        except Exception:
+            pass
+
+    carregar_em_massa(agregado, 'despesas_agregadas', engine)
+    carregar_em_massa(df_parciais, 'despesas_parciais', engine)
+    carregar_em_massa(operadoras_para_salvar(df_final), 'operadoras_ativas', engine)
+
+def publicar_para_api(engine):
+    """Publica o snapshot colunar da API e recalcula as tabelas de resumo do teste3.sql."""
+    try:
+        with metricas.etapa("snapshot"):
+            snapshot.publicar_do_banco(engine)
+    except Exception as e:
+        print(f"⚠️ Não foi possível publicar o snapshot da API: {e}")
+    try:
+        with metricas.etapa("resumos"):
+            resumos.atualizar_resumos(engine)
+    except Exception as e:
+        print(f"⚠️ Não foi possível atualizar as tabelas de resumo: {e}")
+
+def processar_incremental(engine):
+    """Atualiza as agregações a partir dos parciais, relendo só os trimestres novos.
+
+    Retorna None quando não há estado de carga ou parciais gravados (cai no
+    processamento completo).
+    """
+    estado = ler_estado_carga(engine)
+    pendentes = [chave for chave, info in estado.items() if not info["Agregado"]]
+    if not estado:
+        return None
+    if not pendentes:
+        print("✅ Nenhum trimestre pendente de agregação. Nada a fazer.")
+        return pd.DataFrame(), pd.DataFrame()
+
+    df_parciais = pd.read_sql("SELECT * FROM despesas_parciais", engine)
+    if df_parciais.empty:
+        print("⚠️ Nenhum agregado parcial gravado ainda.")
+        return None
+
+    print(f"[2.1] Trimestres pendentes: {[f'{a}-{t}' for a, t in pendentes]}")
+    partes = [
+        pd.read_sql(
+            text("SELECT * FROM despesas_consolidadas WHERE Ano = :ano AND Trimestre = :tri"),
+            engine, params={"ano": int(ano), "tri": tri},
+        )
+        for ano, tri in pendentes
+    ]
+    df = pd.concat(partes, ignore_index=True)
+
+    print("[2.2] Enriquecendo dados com operadoras ativas...")
+    if df.empty:
+        novos = agregados.parciais(df)
+    else:
+        df = enriquecer(validar_despesas(df), cadop.obter_cadop())
+        novos = agregados.parciais(df)
+
+    # Troca os parciais dos trimestres pendentes; um grupo é afetado se tinha ou
+    # passou a ter parcial em algum deles
+    periodos = pd.MultiIndex.from_arrays([df_parciais['Ano'].astype(int), df_parciais['Trimestre'].astype(str)])
+    nos_pendentes = periodos.isin([(int(a), t) for a, t in pendentes])
+    afetados = pd.concat([df_parciais.loc[nos_pendentes, agregados.GRUPO], novos[agregados.GRUPO]]).drop_duplicates()
+    df_parciais = pd.concat([df_parciais[~nos_pendentes], novos], ignore_index=True)
+
+    print(f"[2.3] Combinando parciais de {len(afetados)} grupos (RazaoSocial, UF)...")
+    agregado = agregados.finalizar(agregados.combinar(df_parciais.merge(afetados, on=agregados.GRUPO)))
+
+    print("Atualizando tabelas no MySQL...")
+    excluir_por_chaves(pd.DataFrame(pendentes, columns=['Ano', 'Trimestre']), 'despesas_parciais', engine)
+    carregar_em_massa(novos, 'despesas_parciais', engine)
+    excluir_por_chaves(afetados.dropna(), 'despesas_agregadas', engine)
+    carregar_em_massa(agregado, 'despesas_agregadas', engine)
+    if not df.empty:
+        upsert_dataframe(operadoras_para_salvar(df), 'operadoras_ativas', ['CNPJ'], engine)
+    marcar_agregado(pendentes, engine)
+    registrar_versao(engine)
+
+    # CSV (backup) com a tabela completa
+    pd.read_sql("SELECT * FROM despesas_agregadas", engine) \
+        .sort_values(by='TotalDespesas', ascending=False) \
+        .to_csv('despesas_agregadas.csv', index=False, encoding='utf-8')
+    print(f"✅ {len(agregado)} grupos (RazaoSocial, UF) recalculados.")
+    return df, agregado
+
 if __name__ == "__main__":
     processar_teste2()
@@ -8,6 +8,7 @@ CREATE TABLE IF NOT EXISTS despesas_consolidadas (
     Trimestre VARCHAR(2),
     Ano INTEGER,
     ValorDespesas DECIMAL(18, 2),
+    Periodo INTEGER, -- Ano * 10 + trimestre (ex.: 20243 = 3T/2024), chave ordenável e indexável
     PRIMARY KEY (CNPJ, Trimestre, Ano)
 );
 
@@ -28,6 +29,88 @@ CREATE TABLE IF NOT EXISTS despesas_agregadas (
     DesvioPadraoDespesas DECIMAL(18, 2)
 );
 
+-- Agregados parciais combináveis por (RazaoSocial, UF, trimestre): n, soma e M2
+-- (soma dos quadrados dos desvios). despesas_agregadas é derivada deles.
+CREATE TABLE IF NOT EXISTS despesas_parciais (
+    RazaoSocial VARCHAR(255),
+    UF CHAR(2),
+    Ano INTEGER,
+    Trimestre VARCHAR(2),
+    Contagem INTEGER,
+    Soma DOUBLE PRECISION,
+    M2 DOUBLE PRECISION,
+    PRIMARY KEY (RazaoSocial, UF, Ano, Trimestre)
+);
+
+-- Resumos das queries analíticas (recalculados pelo ETL em resumos.py)
+CREATE TABLE IF NOT EXISTS resumo_crescimento (
+    CNPJ VARCHAR(14) PRIMARY KEY,
+    RazaoSocial VARCHAR(255),
+    PeriodoInicial INTEGER,
+    PeriodoFinal INTEGER,
+    ValorInicial DECIMAL(18, 2),
+    ValorFinal DECIMAL(18, 2),
+    CrescimentoPercentual DOUBLE PRECISION
+);
+
+CREATE TABLE IF NOT EXISTS resumo_uf (
+    UF CHAR(2) PRIMARY KEY,
+    TotalDespesas DECIMAL(18, 2),
+    MediaPorOperadora DECIMAL(18, 2)
+);
+
+CREATE TABLE IF NOT EXISTS resumo_acima_media (
+    CNPJ VARCHAR(14) PRIMARY KEY,
+    TrimestresAcima INTEGER
+);
+
+-- Métricas por etapa das execuções do ETL (tempo, CPU, linhas, bytes, memória)
+CREATE TABLE IF NOT EXISTS etl_metricas (
+    Execucao VARCHAR(40),
+    Pipeline VARCHAR(20),
+    Etapa VARCHAR(60),
+    Detalhe VARCHAR(255),
+    Inicio VARCHAR(32),
+    WallS DOUBLE PRECISION,
+    CpuS DOUBLE PRECISION,
+    LinhasEntrada BIGINT,
+    LinhasSaida BIGINT,
+    Bytes BIGINT,
+    RssPicoMB DOUBLE PRECISION,
+    MemoriaDfMB DOUBLE PRECISION,
+    Erro VARCHAR(500)
+);
+
+-- Controle da carga incremental (trimestres já processados pelo ETL)
+CREATE TABLE IF NOT EXISTS etl_carga_trimestres (
+    Ano INTEGER,
+    Trimestre VARCHAR(2),
+    Arquivo VARCHAR(255),
+    Checksum CHAR(64),
+    Linhas INTEGER,
+    CarregadoEm VARCHAR(32),
+    Agregado INTEGER DEFAULT 0,
+    PRIMARY KEY (Ano, Trimestre)
+);
+
+-- Versão dos dados servidos pela API no modo sql (trocada pelo ETL a cada gravação)
+CREATE TABLE IF NOT EXISTS etl_versao (
+    Id INTEGER PRIMARY KEY,
+    Versao VARCHAR(32),
+    AtualizadoEm VARCHAR(32)
+);
+
+-- Índices usados pela API no modo sql (top 5 e distribuição por UF)
+CREATE INDEX idx_agregadas_total ON despesas_agregadas (TotalDespesas);
+CREATE INDEX idx_agregadas_uf ON despesas_agregadas (UF);
+
+-- Índices das queries analíticas: (CNPJ, Periodo) cobre o MIN/MAX e os joins da Query 1,
+-- (ValorDespesas, CNPJ) cobre o filtro da Query 3 e (UF, CNPJ) o join da Query 2
+CREATE INDEX idx_consolidadas_cnpj_periodo ON despesas_consolidadas (CNPJ, Periodo, ValorDespesas);
+CREATE INDEX idx_consolidadas_valor ON despesas_consolidadas (ValorDespesas, CNPJ);
+CREATE INDEX idx_operadoras_uf ON operadoras_ativas (UF, CNPJ);
+CREATE INDEX idx_crescimento_percentual ON resumo_crescimento (CrescimentoPercentual);
+
 -- 3.4 Queries Analíticas
 
 -- 3.5 Queries de Importação e Tratamento de Inconsistências
@@ -75,34 +158,23 @@ IGNORE 1 ROWS
 */
 
 -- Query 1: 5 operadoras com maior crescimento percentual entre primeiro e último trimestre
--- Nota: Usando subqueries para identificar o primeiro e último valor
-WITH TrimestresExtremos AS (
-    SELECT 
-        CNPJ,
-        RazaoSocial,
-        MIN(CONCAT(Ano, Trimestre)) as PrimeiroTri,
-        MAX(CONCAT(Ano, Trimestre)) as UltimoTri
+-- Nota: o join usa Periodo (inteiro indexado) em vez de CONCAT(Ano, Trimestre), que
+-- nenhum índice atende; MIN/MAX e os dois joins saem de idx_consolidadas_cnpj_periodo
+WITH Extremos AS (
+    SELECT CNPJ, MIN(Periodo) AS PeriodoInicial, MAX(Periodo) AS PeriodoFinal
     FROM despesas_consolidadas
-    GROUP BY CNPJ, RazaoSocial
-),
-ValoresExtremos AS (
-    SELECT 
-        te.CNPJ,
-        te.RazaoSocial,
-        d1.ValorDespesas as ValorInicial,
-        d2.ValorDespesas as ValorFinal
-    FROM TrimestresExtremos te
-    JOIN despesas_consolidadas d1 ON te.CNPJ = d1.CNPJ AND te.PrimeiroTri = CONCAT(d1.Ano, d1.Trimestre)
-    JOIN despesas_consolidadas d2 ON te.CNPJ = d2.CNPJ AND te.UltimoTri = CONCAT(d2.Ano, d2.Trimestre)
+    GROUP BY CNPJ
 )
 SELECT 
-    CNPJ,
-    RazaoSocial,
-    ValorInicial,
-    ValorFinal,
-    ((ValorFinal - ValorInicial) / ValorInicial) * 100 as CrescimentoPercentual
-FROM ValoresExtremos
-WHERE ValorInicial > 0
+    e.CNPJ,
+    d2.RazaoSocial,
+    d1.ValorDespesas as ValorInicial,
+    d2.ValorDespesas as ValorFinal,
+    ((d2.ValorDespesas - d1.ValorDespesas) / d1.ValorDespesas) * 100 as CrescimentoPercentual
+FROM Extremos e
+JOIN despesas_consolidadas d1 ON d1.CNPJ = e.CNPJ AND d1.Periodo = e.PeriodoInicial
+JOIN despesas_consolidadas d2 ON d2.CNPJ = e.CNPJ AND d2.Periodo = e.PeriodoFinal
+WHERE d1.ValorDespesas > 0
 ORDER BY CrescimentoPercentual DESC
 LIMIT 5;
 
@@ -113,23 +185,20 @@ SELECT
     AVG(d.ValorDespesas) as MediaPorOperadora
 FROM despesas_consolidadas d
 JOIN operadoras_ativas o ON d.CNPJ = o.CNPJ
+WHERE o.UF IS NOT NULL
 GROUP BY o.UF
 ORDER BY TotalDespesas DESC
 LIMIT 5;
 
 -- Query 3: Operadoras com despesas acima da média geral em pelo menos 2 dos 3 trimestres
-WITH MediaGeral AS (
-    SELECT AVG(ValorDespesas) as Media FROM despesas_consolidadas
-),
-AcimaDaMedia AS (
-    SELECT 
-        d.CNPJ,
-        d.Trimestre,
-        d.Ano
-    FROM despesas_consolidadas d, MediaGeral m
-    WHERE d.ValorDespesas > m.Media
-)
+-- (média calculada uma vez; o filtro por valor usa idx_consolidadas_valor)
 SELECT CNPJ, COUNT(*) as TrimestresAcima
-FROM AcimaDaMedia
+FROM despesas_consolidadas
+WHERE ValorDespesas > (SELECT AVG(ValorDespesas) FROM despesas_consolidadas)
 GROUP BY CNPJ
-HAVING COUNT(*) >= 2;
\ No newline at end of file
+HAVING COUNT(*) >= 2;
+
+-- As mesmas respostas a partir das tabelas de resumo (atualizadas ao fim do teste2)
+SELECT * FROM resumo_crescimento ORDER BY CrescimentoPercentual DESC LIMIT 5;
+SELECT * FROM resumo_uf ORDER BY TotalDespesas DESC LIMIT 5;
+SELECT * FROM resumo_acima_media WHERE TrimestresAcima >= 2;
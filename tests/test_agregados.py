@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+import agregados
+import cadop
+import metricas
+import teste2
+from database import criar_tabelas, carregar_em_massa, excluir_por_chaves, registrar_carga
+from teste1 import preparar_para_banco
+
+def _linhas(semente=7, n=400):
+    rng = np.random.default_rng(semente)
+    df = pd.DataFrame({
+        "RazaoSocial": rng.choice(["A", "B", "C", "D"], n),
+        "UF": rng.choice(["SP", "RJ"], n),
+        "Ano": rng.choice([2023, 2024], n),
+        "Trimestre": rng.choice(["1T", "2T", "3T"], n),
+        "ValorDespesas": rng.gamma(2.0, 1e6, n).round(2),
+    })
+    # Grupo de uma linha só (desvio indefinido) e grupo com valores iguais (desvio zero)
+    extras = pd.DataFrame({
+        "RazaoSocial": ["UNICA", "IGUAL", "IGUAL", "IGUAL"], "UF": ["MG", "BA", "BA", "BA"],
+        "Ano": [2024, 2023, 2024, 2024], "Trimestre": ["1T", "1T", "1T", "2T"],
+        "ValorDespesas": [10.0, 5.5, 5.5, 5.5],
+    })
+    return pd.concat([df, extras], ignore_index=True)
+
+def _ordenar(df):
+    return df.sort_values(agregados.GRUPO).reset_index(drop=True)
+
+def test_parciais_combinados_iguais_ao_groupby():
+    df = _linhas()
+    esperado = df.groupby(agregados.GRUPO)["ValorDespesas"].agg(["sum", "mean", "std"]).reset_index()
+    esperado.columns = agregados.GRUPO + ["TotalDespesas", "MediaDespesas", "DesvioPadraoDespesas"]
+    obtido = agregados.finalizar(agregados.combinar(agregados.parciais(df)))
+    pd.testing.assert_frame_equal(_ordenar(obtido), _ordenar(esperado), check_dtype=False, rtol=1e-9)
+
+def test_janela_igual_ao_groupby_do_periodo():
+    df = _linhas()
+    no_periodo = (df["Ano"] * 10 + df["Trimestre"].str[0].astype(int)).between(20232, 20241)
+    esperado = df[no_periodo].groupby(agregados.GRUPO)["ValorDespesas"].agg(["sum", "mean", "std"]).reset_index()
+    esperado.columns = agregados.GRUPO + ["TotalDespesas", "MediaDespesas", "DesvioPadraoDespesas"]
+    obtido = agregados.janela(agregados.parciais(df), de=(2023, "2T"), ate=(2024, "1T"))
+    pd.testing.assert_frame_equal(_ordenar(obtido), _ordenar(esperado), check_dtype=False, rtol=1e-9)
+
+#
+# INCREMENTAL x COMPLETO (teste2 sobre um SQLite temporário)
+#
+def _cnpj(base):
+    for dv in range(100):
+        cnpj = f"{base:012d}{dv:02d}"
+        if teste2.validar_cnpj(cnpj):
+            return cnpj
+
+CNPJS = [_cnpj(1000 + i) for i in range(12)]
+CADOP = pd.DataFrame({
+    "CNPJ": CNPJS,
+    "Registro_ANS": [str(300000 + i) for i in range(12)],
+    "Modalidade": "Medicina de Grupo",
+    "UF": ["SP", "RJ"] * 6,
+    # Nomes repetidos: vários CNPJs no mesmo grupo (RazaoSocial, UF)
+    "RazaoSocial": [f"OPERADORA {i % 4}" for i in range(12)],
+})
+
+def _trimestre(ano, tri, semente):
+    rng = np.random.default_rng(semente)
+    return pd.DataFrame({
+        "CNPJ": CNPJS, "RazaoSocial": None, "Ano": ano, "Trimestre": tri,
+        "ValorDespesas": rng.gamma(2.0, 1e5, len(CNPJS)).round(2),
+    })
+
+def _carregar(engine, df, arquivo):
+    excluir_por_chaves(df[["Ano", "Trimestre"]].drop_duplicates(), "despesas_consolidadas", engine)
+    carregar_em_massa(preparar_para_banco(df), "despesas_consolidadas", engine, relatorio=False)
+    registrar_carga(int(df["Ano"].iloc[0]), df["Trimestre"].iloc[0], arquivo, arquivo, len(df), engine)
+
+def _agregadas(engine):
+    return _ordenar(pd.read_sql("SELECT * FROM despesas_agregadas", engine))
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(metricas, "METRICAS_ARQUIVO", "")
+    engine = create_engine(f"sqlite:///{tmp_path / 'teste.db'}")
+    criar_tabelas(engine)
+    monkeypatch.setattr(teste2, "get_engine", lambda: engine)
+    monkeypatch.setattr(cadop, "obter_cadop", lambda: CADOP.copy())
+    monkeypatch.setattr(teste2, "publicar_para_api", lambda engine: None)
+    return engine
+
+def test_incremental_igual_a_reconstrucao_completa(banco):
+    _carregar(banco, _trimestre(2024, "1T", 1), "1T2024.zip")
+    _carregar(banco, _trimestre(2024, "2T", 2), "2T2024.zip")
+    teste2.processar_teste2(incremental=False)
+
+    # Trimestre novo e um trimestre já agregado que mudou (reprocessado)
+    _carregar(banco, _trimestre(2024, "3T", 3), "3T2024.zip")
+    _carregar(banco, _trimestre(2024, "2T", 22), "2T2024-v2.zip")
+    # Direto pelo caminho incremental (processar_teste2 cairia no completo em caso de erro)
+    assert teste2.processar_incremental(banco) is not None
+    incremental = _agregadas(banco)
+
+    teste2.processar_teste2(incremental=False)
+    completo = _agregadas(banco)
+    assert len(completo) == 4
+    pd.testing.assert_frame_equal(incremental, completo, check_dtype=False, rtol=1e-6)
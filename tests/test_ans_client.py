@@ -0,0 +1,49 @@
+import os
+import time
+import hashlib
+import multiprocessing
+import pytest
+import ans_client
+
+pytestmark = pytest.mark.skipif(ans_client.fcntl is None, reason="sem flock nesta plataforma")
+
+def _guardar_varios(prefixo, quantidade):
+    for i in range(quantidade):
+        conteudo = f"{prefixo}-{i}".encode()
+        caminho = os.path.join(ans_client.CACHE_DIR, f"{prefixo}-{i}.part")
+        with open(caminho, "wb") as f:
+            f.write(conteudo)
+        ans_client._guardar_no_cache(f"https://ans/{prefixo}/{i}", caminho, hashlib.sha256(conteudo).hexdigest(),
+                                     len(conteudo), {})
+
+def test_processos_simultaneos_nao_perdem_entradas(tmp_path, monkeypatch):
+    monkeypatch.setattr(ans_client, "CACHE_DIR", str(tmp_path))
+    contexto = multiprocessing.get_context("fork")
+    processos = [contexto.Process(target=_guardar_varios, args=(p, 40)) for p in ("a", "b", "c")]
+    for processo in processos:
+        processo.start()
+    for processo in processos:
+        processo.join()
+    assert [p.exitcode for p in processos] == [0, 0, 0]
+    assert len(ans_client._ler_indice()) == 120
+
+def test_acerto_recente_nao_regrava_o_indice(tmp_path, monkeypatch):
+    monkeypatch.setattr(ans_client, "CACHE_DIR", str(tmp_path))
+    _guardar_varios("a", 1)
+    entrada = ans_client._entrada_cache("https://ans/a/0")
+    antes = os.stat(ans_client._caminho_indice()).st_mtime_ns
+    ans_client._tocar_cache("https://ans/a/0", entrada)
+    assert os.stat(ans_client._caminho_indice()).st_mtime_ns == antes
+
+    entrada["acesso"] = time.time() - 2 * ans_client.ACESSO_RESOLUCAO_SEGUNDOS
+    ans_client._tocar_cache("https://ans/a/0", entrada)
+    assert ans_client._ler_indice()["https://ans/a/0"]["acesso"] > entrada["acesso"]
+
+def test_despejo_remove_objetos_orfaos(tmp_path, monkeypatch):
+    monkeypatch.setattr(ans_client, "CACHE_DIR", str(tmp_path))
+    orfao = ans_client._caminho_objeto("ff" * 32)
+    os.makedirs(os.path.dirname(orfao))
+    with open(orfao, "wb") as f:
+        f.write(b"perdido")
+    _guardar_varios("a", 1)
+    assert not os.path.exists(orfao)
@@ -0,0 +1,48 @@
+import pandas as pd
+from sqlalchemy import create_engine
+import consultas_sql
+from database import criar_tabelas, carregar_em_massa, registrar_carga, marcar_agregado, registrar_versao
+from teste1 import corrigir_identificadores, preparar_para_banco
+
+CADOP = pd.DataFrame({
+    "CNPJ": ["11222333000181", "44555666000172"],
+    "RazaoSocial_Cadop": ["UNIMED CAMPINAS", "SAUDE BRASIL"],
+    "Registro_ANS_Cadop": ["300001", "300002"],
+})
+
+def _banco(tmp_path):
+    """SQLite com uma carga passando pelo mesmo caminho do ETL (Registro ANS -> CNPJ + nome pelo Cadop)."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'teste.db'}")
+    criar_tabelas(engine)
+    bruto = pd.DataFrame({
+        "CNPJ": ["300001", "300002", "300001"],
+        "ValorDespesas": [10.5, 20.0, 5.25],
+        "Ano": 2024,
+        "Trimestre": ["1T", "1T", "2T"],
+    })
+    df = corrigir_identificadores(bruto, CADOP.copy())
+    carregar_em_massa(preparar_para_banco(df), "despesas_consolidadas", engine, relatorio=False)
+    registrar_carga(2024, "1T", "1T2024.zip", "x", 2, engine)
+    return engine
+
+def test_busca_por_nome_no_modo_sql(tmp_path):
+    resposta = consultas_sql.listar_operadoras(_banco(tmp_path), search="UNIMED")
+    assert resposta["total"] == 1
+    assert resposta["data"] == [{"CNPJ": "11222333000181", "RazaoSocial": "UNIMED CAMPINAS"}]
+
+def test_total_igual_na_paginacao_por_chave(tmp_path):
+    engine = _banco(tmp_path)
+    primeira = consultas_sql.listar_operadoras(engine, limit=1)
+    seguinte = consultas_sql.listar_operadoras(engine, limit=1, apos=primeira["proximo"])
+    assert primeira["total"] == seguinte["total"] == 2
+    assert seguinte["data"] == [{"CNPJ": "44555666000172", "RazaoSocial": "SAUDE BRASIL"}]
+
+def test_versao_muda_com_reagregacao_sem_nova_carga(tmp_path):
+    engine = _banco(tmp_path)
+    marcar_agregado([(2024, "1T")], engine)
+    antes = consultas_sql.versao_dados(engine)
+    # teste2 completo de novo (ex.: Cadop com nomes/UFs novos): estado da carga não muda
+    marcar_agregado([(2024, "1T")], engine)
+    assert consultas_sql.versao_dados(engine) == antes
+    registrar_versao(engine)
+    assert consultas_sql.versao_dados(engine) != antes
@@ -0,0 +1,104 @@
+import io
+import os
+import gzip
+import dataclasses
+from collections import OrderedDict
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+import app
+import exportacao
+
+FORMATOS = ["csv", "ndjson", "arrow"]
+CODIFICACOES = ["identity", "gzip"]
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    n = 300
+    despesas = pd.DataFrame({
+        "CNPJ": [f"{i:014d}" for i in range(n)],
+        "RazaoSocial": [f"OPERADORA {i % 17}" for i in range(n)],
+        "Trimestre": [f"{i % 4 + 1}T" for i in range(n)],
+        "Ano": 2024,
+        "ValorDespesas": [i * 1234.56 + 0.1 for i in range(n)],
+        "UF": ["SP", "RJ", "MG"] * (n // 3),
+    })
+    agregado = pd.DataFrame({"RazaoSocial": ["A"], "UF": ["SP"], "TotalDespesas": [1.0]})
+    monkeypatch.setattr(app, "API_MODO", "memoria")
+    monkeypatch.setattr(app, "estado", dataclasses.replace(
+        app._estado_vazio(), versao="teste", df_despesas=despesas, df_agregado=agregado))
+    # Vários blocos por exportação e tamanhos registrados num diretório só do teste
+    monkeypatch.setattr(exportacao, "LINHAS_POR_BLOCO", 40)
+    monkeypatch.setattr(exportacao, "EXPORT_DIR", str(tmp_path / "exportacoes"))
+    monkeypatch.setattr(exportacao, "_tamanhos", OrderedDict())
+    # Sem lifespan: o estado acima não é trocado pela carga do snapshot
+    return TestClient(app.app)
+
+def _get(cliente, formato, codificacao, **headers):
+    """(status, headers, bytes como enviados), sem descompactar o gzip."""
+    with cliente.stream("GET", "/api/export", params={"formato": formato},
+                        headers={"Accept-Encoding": codificacao, **headers}) as r:
+        return r.status_code, r.headers, b"".join(r.iter_raw())
+
+@pytest.mark.parametrize("codificacao", CODIFICACOES)
+@pytest.mark.parametrize("formato", FORMATOS)
+def test_retomada_sem_tamanho_conhecido(cliente, formato, codificacao):
+    # Range antes de qualquer download completo: o servidor mede a saída e responde 206
+    status, headers, completo_inicio = _get(cliente, formato, codificacao, Range="bytes=0-99")
+    assert status == 206
+    status, headers, resto = _get(cliente, formato, codificacao, Range="bytes=100-",
+                                  **{"If-Range": headers["etag"]})
+    assert status == 206
+    status, _, completo = _get(cliente, formato, codificacao)
+    assert status == 200
+    assert headers["content-range"] == f"bytes 100-{len(completo) - 1}/{len(completo)}"
+    assert completo_inicio + resto == completo
+    if codificacao == "gzip":
+        completo = gzip.decompress(completo)
+    if formato == "csv":
+        assert len(pd.read_csv(io.BytesIO(completo))) == 300
+    elif formato == "ndjson":
+        assert len(completo.splitlines()) == 300
+
+@pytest.mark.parametrize("codificacao", CODIFICACOES)
+@pytest.mark.parametrize("formato", FORMATOS)
+def test_retomada_depois_do_download_completo(cliente, formato, codificacao):
+    _, headers, completo = _get(cliente, formato, codificacao)
+    corte = len(completo) // 3
+    status, parcial, resto = _get(cliente, formato, codificacao, Range=f"bytes={corte}-",
+                                  **{"If-Range": headers["etag"]})
+    assert status == 206
+    assert parcial["content-length"] == str(len(completo) - corte)
+    assert completo[:corte] + resto == completo
+
+def test_tamanho_registrado_em_disco_vale_para_outro_worker(cliente, monkeypatch):
+    _, headers, completo = _get(cliente, "csv", "identity")
+    arquivo = os.path.join(exportacao.EXPORT_DIR, headers["etag"].strip('"') + ".tamanho")
+    assert os.path.exists(arquivo)
+    # Outro processo: nada em memória, só o arquivo
+    monkeypatch.setattr(exportacao, "_tamanhos", OrderedDict())
+    assert exportacao.tamanho_conhecido(headers["etag"]) == len(completo)
+    # Sem passada de medição: a serialização roda uma vez só
+    chamadas = []
+    serializar = exportacao.serializar
+    monkeypatch.setattr(exportacao, "serializar", lambda *a: chamadas.append(1) or serializar(*a))
+    status, _, resto = _get(cliente, "csv", "identity", Range="bytes=10-")
+    assert status == 206 and resto == completo[10:] and len(chamadas) == 1
+
+def test_if_range_diferente_devolve_tudo(cliente):
+    _, _, completo = _get(cliente, "csv", "identity")
+    status, _, corpo = _get(cliente, "csv", "identity", Range="bytes=10-", **{"If-Range": '"outro"'})
+    assert status == 200 and corpo == completo
+
+def test_range_fora_do_tamanho(cliente):
+    _, _, completo = _get(cliente, "csv", "identity")
+    status, headers, _ = _get(cliente, "csv", "identity", Range=f"bytes={len(completo)}-")
+    assert status == 416
+    assert headers["content-range"] == f"bytes */{len(completo)}"
+
+def test_filtro_por_coluna_ausente_responde_400(cliente, monkeypatch):
+    sem_uf = app.estado.df_despesas.drop(columns=["UF"])
+    monkeypatch.setattr(app, "estado", dataclasses.replace(app.estado, df_despesas=sem_uf))
+    r = cliente.get("/api/export", params={"uf": "SP"})
+    assert r.status_code == 400
+    assert "UF" in r.json()["error"]
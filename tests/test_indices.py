@@ -0,0 +1,19 @@
+import pandas as pd
+from indices import CatalogoOperadoras
+
+def _catalogo():
+    return CatalogoOperadoras(pd.DataFrame({
+        "CNPJ": ["00000000000191", "12345678000199", "11222333000181"],
+        "RazaoSocial": ["AAA SAUDE", "AAAA VIDA", "UNIMED CAMPINAS"],
+    }))
+
+def test_busca_termo_com_caracteres_repetidos_confirma_substring():
+    catalogo = _catalogo()
+    # "aaaa" e "0000000" têm um único trigrama distinto, mas não estão em todo texto que o contém
+    assert [r["CNPJ"] for r in catalogo.pagina("aaaa", 1, 10)[0]] == ["12345678000199"]
+    assert [r["CNPJ"] for r in catalogo.pagina("0000000", 1, 10)[0]] == ["00000000000191"]
+
+def test_busca_termo_de_tres_caracteres():
+    data, total = _catalogo().pagina("aaa", 1, 10)
+    assert total == 2
+    assert data[0]["RazaoSocial"] == "AAA SAUDE"
@@ -0,0 +1,48 @@
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import teste1
+
+def _zip(caminho, linhas=200):
+    corpo = "".join(f'"{100000 + i}";"411";"EVENTOS";"{i + 1},00"\n' for i in range(linhas))
+    with zipfile.ZipFile(caminho, "w") as z:
+        z.writestr("ruim.csv", '"REG_ANS";"CD_CONTA_CONTABIL";"DESCRICAO";"VL_SALDO_FINAL"\n' + corpo)
+        z.writestr("bom.csv", '"REG_ANS";"CD_CONTA_CONTABIL";"DESCRICAO";"VL_SALDO_FINAL"\n"100001";"411";"EVENTOS";"5,00"\n')
+    return str(caminho)
+
+def _falha_no_segundo(funcao):
+    chamadas = [0]
+
+    def envolvida(*args, **kwargs):
+        chamadas[0] += 1
+        if chamadas[0] == 2:
+            raise MemoryError("worker sem memória")
+        return funcao(*args, **kwargs)
+    return envolvida
+
+def test_bloco_com_erro_descarta_o_membro_no_pool(tmp_path, monkeypatch):
+    caminho = _zip(tmp_path / "t.zip")
+    monkeypatch.setattr(teste1, "BLOCO_BYTES", 1024)
+    # ruim.csv vira vários blocos e é enviado primeiro: a segunda chamada é um bloco dele
+    monkeypatch.setattr(teste1, "normalizar_bloco", _falha_no_segundo(teste1.normalizar_bloco))
+    falhas = []
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        dados = teste1.processar_zip(caminho, "2024", "1T", pool, 2, falhas)
+    assert falhas == ["ruim.csv"]
+    assert len(dados) == 1 and len(dados[0]) == 1
+
+def test_erro_de_leitura_descarta_o_membro_em_serie(tmp_path, monkeypatch):
+    caminho = _zip(tmp_path / "t.zip")
+    monkeypatch.setattr(teste1, "CHUNK_LINHAS", 50)
+    monkeypatch.setattr(teste1, "normalizar", _falha_no_segundo(teste1.normalizar))
+    falhas = []
+    dados = teste1.processar_zip(caminho, "2024", "1T", falhas=falhas)
+    assert falhas == ["ruim.csv"]
+    assert len(dados) == 1 and len(dados[0]) == 1
+
+def test_pool_quebrado_nao_aceita_nada(tmp_path):
+    caminho = _zip(tmp_path / "t.zip")
+    pool = ThreadPoolExecutor(max_workers=1)
+    pool.shutdown()
+    falhas = []
+    assert teste1.processar_zip(caminho, "2024", "1T", pool, 1, falhas) == []
+    assert falhas == ["ruim.csv", "bom.csv"]
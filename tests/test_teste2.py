@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from teste2 import validar_cnpj, validar_cnpj_vetorizado
+
+CASOS = [
+    "11222333000181",          # válido
+    "11.222.333/0001-81",      # válido com máscara
+    "11222333000182",          # segundo dígito errado
+    "11222333000191",          # primeiro dígito errado
+    "00000000000000",          # dígitos repetidos
+    "11111111111111",
+    "00000000000191",          # válido com zeros à esquerda
+    "1122233300018",           # 13 dígitos
+    "112223330001811",         # 15 dígitos
+    "1122233300018a",          # letra
+    "11 222 333 0001 81",      # espaço não é removido
+    "",
+    "١١٢٢٢٣٣٣٠٠٠١٨١",          # dígitos arábicos (isdigit, não ASCII)
+    "1122233300018١",          # mistura ASCII e não-ASCII
+    "１１２２２３３３０００１８１",  # dígitos de largura total
+    11222333000181,            # inteiro
+    191,                       # inteiro sem zeros à esquerda
+    11222333000181.0,          # float
+    None,
+    np.nan,
+    pd.NA,
+]
+
+@pytest.mark.parametrize("valor", CASOS, ids=repr)
+def test_vetorizado_igual_ao_escalar(valor):
+    assert bool(validar_cnpj_vetorizado(pd.Series([valor], dtype=object))[0]) == validar_cnpj(valor)
+
+def test_vetorizado_igual_ao_escalar_em_lote():
+    rng = np.random.default_rng(5)
+    aleatorios = ["".join(map(str, rng.integers(0, 10, 14))) for _ in range(2000)]
+    # Garante válidos no lote: o segundo dígito é ajustado até passar na versão escalar
+    validos = [c[:13] + d for c in aleatorios[:200] for d in "0123456789" if validar_cnpj(c[:13] + d)]
+    serie = pd.Series(aleatorios + validos + CASOS * 3, dtype=object)
+    esperado = np.array([validar_cnpj(v) for v in serie])
+    assert esperado.any()
+    np.testing.assert_array_equal(np.asarray(validar_cnpj_vetorizado(serie), dtype=bool), esperado)